@@ -0,0 +1,179 @@
+"""
+Wind speed statistics of several anemometers grouped in time buckets.
+
+Sub-daily buckets are binned with `date_bin`, the others truncated in the
+project time zone like the rollups. Daily, weekly and monthly buckets are read
+from the daily and weekly rollups whenever the requested statistics and window
+allow it, and from the raw readings otherwise.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import (
+    Aggregate,
+    Avg,
+    Count,
+    DateTimeField,
+    F,
+    FloatField,
+    Func,
+    Max,
+    Min,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Round, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Anemometer, WindSpeedReadings, WindSpeedRollup
+
+BUCKET_INTERVALS = {"15m": "15 minutes", "1h": "1 hour"}
+BUCKET_TRUNCS = {"1d": TruncDay, "1w": TruncWeek, "1M": TruncMonth}
+BUCKETS = (*BUCKET_INTERVALS, *BUCKET_TRUNCS)
+STATS = ("mean", "min", "max", "count", "p95")
+ROLLUP_STATS = {"mean", "min", "max", "count"}
+# Origin of the `date_bin` buckets, a Monday midnight.
+BIN_ORIGIN = datetime(2000, 1, 3, tzinfo=timezone.get_fixed_timezone(0))
+
+
+class DateBin(Func):
+    function = "date_bin"
+    output_field = DateTimeField()
+
+    def __init__(self, interval: str, expression, origin: datetime = BIN_ORIGIN):
+        super().__init__(Value(interval), expression, Value(origin))
+
+
+class PercentileCont(Aggregate):
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile: float, **extra):
+        super().__init__(expression, percentile=percentile, **extra)
+
+
+class AggregateTooLarge(Exception):
+    pass
+
+
+def _is_aligned(date: Optional[datetime], bucket: str) -> bool:
+    """
+    Whether a window bound falls on the start of a rollup bucket.
+    """
+    if date is None:
+        return True
+    local = timezone.localtime(date)
+    if local != local.replace(hour=0, minute=0, second=0, microsecond=0):
+        return False
+    return bucket != "1w" or local.weekday() == 0
+
+
+def uses_rollups(bucket: str, stats: list[str], start=None, end=None) -> bool:
+    return (
+        bucket in BUCKET_TRUNCS
+        and ROLLUP_STATS.issuperset(stats)
+        and _is_aligned(start, bucket)
+        and _is_aligned(end, bucket)
+    )
+
+
+def _rollup_rows(anemometer_ids, bucket, stats, start, end):
+    period = (
+        WindSpeedRollup.Period.WEEK if bucket == "1w" else WindSpeedRollup.Period.DAY
+    )
+    rollups = WindSpeedRollup.objects.filter(period=period)
+    if anemometer_ids is not None:
+        rollups = rollups.filter(anemometer_id__in=anemometer_ids)
+    if start:
+        rollups = rollups.filter(bucket__gte=start)
+    if end:
+        rollups = rollups.filter(bucket__lt=end)
+
+    # Months are whole days, so they are regrouped from the daily buckets.
+    bucket_expression = TruncMonth("bucket") if bucket == "1M" else F("bucket")
+    expressions = {
+        "mean": Round(Sum("speed_sum") / Sum("speed_count"), 2),
+        "min": Round(Min("speed_min"), 2),
+        "max": Round(Max("speed_max"), 2),
+        "count": Sum("speed_count"),
+    }
+    return (
+        rollups.annotate(time=bucket_expression)
+        .values("anemometer_id", "time")
+        .annotate(**{stat: expressions[stat] for stat in stats})
+    )
+
+
+def _reading_rows(anemometer_ids, bucket, stats, start, end):
+    readings = WindSpeedReadings.objects.all()
+    if anemometer_ids is not None:
+        readings = readings.filter(anemometer_id__in=anemometer_ids)
+    if start:
+        readings = readings.filter(date__gte=start)
+    if end:
+        readings = readings.filter(date__lt=end)
+
+    if bucket in BUCKET_INTERVALS:
+        bucket_expression = DateBin(BUCKET_INTERVALS[bucket], "date")
+    else:
+        bucket_expression = BUCKET_TRUNCS[bucket]("date")
+    expressions = {
+        "mean": Round(Avg("speed"), 2),
+        "min": Round(Min("speed"), 2),
+        "max": Round(Max("speed"), 2),
+        "count": Count("id"),
+        "p95": Round(PercentileCont("speed", 0.95), 2),
+    }
+    return (
+        readings.annotate(time=bucket_expression)
+        .values("anemometer_id", "time")
+        .annotate(**{stat: expressions[stat] for stat in stats})
+    )
+
+
+def aggregate_readings(
+    bucket: str,
+    stats: list[str],
+    anemometers: Optional[list[int]] = None,
+    tag: Optional[list[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    max_rows: int = 100000,
+) -> list[dict]:
+    """
+    Statistics of the readings per anemometer and time bucket, in a single
+    grouped query, as one series per anemometer holding one array per column.
+    """
+    anemometer_ids = None
+    if anemometers or tag:
+        selected = Anemometer.objects.all()
+        if anemometers:
+            selected = selected.filter(id__in=anemometers)
+        if tag:
+            selected = selected.filter(tags__name__in=tag)
+        anemometer_ids = selected.values("id")
+
+    if uses_rollups(bucket, stats, start, end):
+        rows = _rollup_rows(anemometer_ids, bucket, stats, start, end)
+    else:
+        rows = _reading_rows(anemometer_ids, bucket, stats, start, end)
+    rows = list(rows.order_by("anemometer_id", "time")[: max_rows + 1])
+    if len(rows) > max_rows:
+        raise AggregateTooLarge(
+            f"The aggregate exceeds {max_rows} buckets, narrow the window or widen the buckets."
+        )
+
+    series = {}
+    for row in rows:
+        columns = series.get(row["anemometer_id"])
+        if columns is None:
+            columns = series[row["anemometer_id"]] = {
+                "anemometer": row["anemometer_id"],
+                "time": [],
+                **{stat: [] for stat in stats},
+            }
+        for column in ("time", *stats):
+            columns[column].append(row[column])
+    return list(series.values())
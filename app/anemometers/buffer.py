@@ -0,0 +1,228 @@
+"""
+Write-behind buffer for the readings ingestion.
+
+With `READINGS_WRITE_BEHIND` enabled, validated readings are queued in memory
+and a background thread inserts them with `ingest.insert_readings` every
+`READINGS_BUFFER_BATCH_SIZE` rows or `READINGS_BUFFER_FLUSH_MS` milliseconds,
+whichever comes first. The queue is bounded: a batch that does not fit is
+rejected as a whole, and the caller is expected to retry later. The pending
+readings are flushed when the process exits.
+
+The queued readings were already acknowledged, so a failed flush loses none
+of them: a batch failing on the database is put back at the head of the
+queue and retried with an exponential backoff, while a batch failing on an
+integrity error is split in halves until the offending rows are isolated,
+and only those are dropped.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections
+
+from .ingest import insert_readings
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 30
+
+
+class BufferFull(Exception):
+    pass
+
+
+class ReadingsBuffer:
+    def __init__(
+        self,
+        max_rows: int = 50000,
+        batch_size: int = 1000,
+        flush_interval: float = 0.5,
+        autostart: bool = True,
+    ):
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.autostart = autostart
+
+        self._rows = deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._backoff = 0.0
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "flushed": 0,
+            "failed": 0,
+            "retried": 0,
+            "flushes": 0,
+            "last_flush_ms": None,
+            "max_flush_ms": None,
+        }
+
+    def put(self, rows: list[dict]):
+        """
+        Queues validated rows, or raises `BufferFull` without queuing any of
+        them when they do not fit.
+        """
+        with self._condition:
+            if len(self._rows) + len(rows) > self.max_rows:
+                self._stats["rejected"] += len(rows)
+                raise BufferFull(
+                    f"The ingestion buffer is full ({len(self._rows)}/{self.max_rows} readings)."
+                )
+            self._rows.extend(rows)
+            self._stats["enqueued"] += len(rows)
+            if len(self._rows) >= self.batch_size:
+                self._condition.notify()
+        if self.autostart:
+            self.start()
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name="readings-buffer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stops the flusher thread once every pending row has been flushed.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def flush(self) -> bool:
+        """
+        Flushes every pending row from the calling thread. Returns False when
+        the database failed, the batch being put back in the queue.
+        """
+        while batch := self._take(self.batch_size):
+            if not self._flush_batch(batch):
+                return False
+        return True
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                **self._stats,
+                "depth": len(self._rows),
+                "capacity": self.max_rows,
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+    def _take(self, count: int) -> list[dict]:
+        with self._condition:
+            return [self._rows.popleft() for _ in range(min(count, len(self._rows)))]
+
+    def _requeue(self, batch: list[dict]):
+        with self._condition:
+            self._rows.extendleft(reversed(batch))
+            self._stats["retried"] += len(batch)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Waits out the backoff of a failed flush, even with a full batch.
+                deadline = time.monotonic() + max(self.flush_interval, self._backoff)
+                while (
+                    len(self._rows) < self.batch_size or self._backoff
+                ) and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                stopping = self._stopping
+
+            if stopping:
+                close_old_connections()
+                if not self.flush():
+                    logger.error(
+                        "Exiting with %d buffered readings not flushed", len(self._rows)
+                    )
+                close_old_connections()
+                return
+            if batch := self._take(self.batch_size):
+                close_old_connections()
+                if self._flush_batch(batch):
+                    self._backoff = 0.0
+                else:
+                    self._backoff = min(
+                        MAX_BACKOFF, max(self.flush_interval, self._backoff * 2)
+                    )
+
+    def _flush_batch(self, batch: list[dict]) -> bool:
+        """
+        Inserts a batch, splitting it in halves on integrity errors until the
+        offending rows are alone, and drops them. Returns False when the
+        database failed, the rows not inserted yet being put back in the queue.
+        """
+        started_at = time.monotonic()
+        flushed = failed = 0
+        requeued = False
+        chunks = [batch]
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                insert_readings(chunk)
+            except (IntegrityError, DataError):
+                if len(chunk) == 1:
+                    logger.exception(
+                        "Dropped an invalid buffered reading: %r", chunk[0]
+                    )
+                    failed += 1
+                else:
+                    middle = len(chunk) // 2
+                    chunks += [chunk[middle:], chunk[:middle]]
+            except Exception:
+                pending = chunk + [row for rest in reversed(chunks) for row in rest]
+                logger.exception(
+                    "Failed to flush %d buffered readings, retrying", len(pending)
+                )
+                self._requeue(pending)
+                requeued = True
+                break
+            else:
+                flushed += len(chunk)
+        elapsed_ms = round((time.monotonic() - started_at) * 1000, 3)
+
+        with self._condition:
+            self._stats["flushed"] += flushed
+            self._stats["failed"] += failed
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["max_flush_ms"] = max(
+                self._stats["max_flush_ms"] or 0, elapsed_ms
+            )
+        return not requeued
+
+
+_buffer: Optional[ReadingsBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_readings_buffer() -> ReadingsBuffer:
+    global _buffer
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ReadingsBuffer(
+                    max_rows=settings.READINGS_BUFFER_MAX_ROWS,
+                    batch_size=settings.READINGS_BUFFER_BATCH_SIZE,
+                    flush_interval=settings.READINGS_BUFFER_FLUSH_MS / 1000,
+                )
+                atexit.register(_buffer.stop)
+    return _buffer
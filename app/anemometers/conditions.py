@@ -0,0 +1,37 @@
+"""
+Current conditions of the anemometers, annotated on anemometer querysets so
+that any number of stations is served by a single query.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.db.models import Avg, F, FilteredRelation, Q, QuerySet
+from django.db.models.functions import Round
+from django.utils import timezone
+
+
+def with_conditions(anemometers: QuerySet, now: Optional[datetime] = None) -> QuerySet:
+    """
+    Annotates the last day and last week mean speeds, along with the date of
+    the latest reading as `latest_date`.
+
+    The readings of the last week are joined once and both means are computed
+    from them with conditional aggregates.
+    """
+    now = now or timezone.now()
+    last_day, last_week = now - timedelta(days=1), now - timedelta(days=7)
+    return anemometers.annotate(
+        recent_readings=FilteredRelation(
+            "wind_readings", condition=Q(wind_readings__date__gte=last_week)
+        ),
+        last_day_mean_speed=Round(
+            Avg(
+                "recent_readings__speed",
+                filter=Q(recent_readings__date__gte=last_day),
+            ),
+            2,
+        ),
+        last_week_mean_speed=Round(Avg("recent_readings__speed"), 2),
+        latest_date=F("latest_reading_at"),
+    )
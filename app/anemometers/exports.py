@@ -0,0 +1,182 @@
+"""
+Streaming exports of the wind speed readings.
+
+Rows are read through a server-side cursor and encoded chunk by chunk, so the
+memory used does not depend on the size of the export. Under ASGI, the chunks
+are handed to the server one at a time by `aiter_chunks`. The columnar formats
+require the `pyarrow` package.
+"""
+
+import csv
+import importlib.util
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+
+from core.encoders import PreciseJSONEncoder
+
+from .models import Anemometer, WindSpeedReadings
+
+EXPORT_COLUMNS = ("id", "anemometer", "speed", "date")
+COLUMNAR_OUTPUTS = ("parquet", "arrow")
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+def get_export_rows(
+    anemometers: Optional[list[int]] = None,
+    tag: Optional[list[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_size: int = 2000,
+) -> Iterator[tuple]:
+    """
+    Iterates over the (id, anemometer name, speed, date) of the matching
+    readings, ordered by anemometer and date.
+    """
+    readings = WindSpeedReadings.objects.all()
+    if anemometers:
+        readings = readings.filter(anemometer_id__in=anemometers)
+    if tag:
+        readings = readings.filter(
+            anemometer__in=Anemometer.objects.filter(tags__name__in=tag)
+        )
+    if start:
+        readings = readings.filter(date__gte=start)
+    if end:
+        readings = readings.filter(date__lt=end)
+
+    return (
+        readings.order_by("anemometer_id", "date")
+        .values_list("id", "anemometer__name", "speed", "date")
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def iter_csv(rows: Iterable[tuple], chunk_size: int) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batched(rows, chunk_size):
+        writer.writerows(
+            (id_, name, speed, date.isoformat()) for id_, name, speed, date in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def iter_ndjson(rows: Iterable[tuple], chunk_size: int) -> Iterator[bytes]:
+    for batch in _batched(rows, chunk_size):
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=PreciseJSONEncoder) + "\n"
+            for row in batch
+        ).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting the bytes written by pyarrow until drained.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_columnar(
+    rows: Iterable[tuple], chunk_size: int, output: str
+) -> Iterator[bytes]:
+    """
+    Encodes the rows as a Parquet file with one row group per chunk, or as an
+    Arrow IPC stream with one record batch per chunk.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("anemometer", pa.string()),
+            ("speed", pa.float64()),
+            ("date", pa.timestamp("us", tz="UTC")),
+        ]
+    )
+    sink = _ChunkSink()
+    if output == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    with writer:
+        for batch in _batched(rows, chunk_size):
+            columns = [list(column) for column in zip(*batch)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def check_output(output: str):
+    if output in COLUMNAR_OUTPUTS and importlib.util.find_spec("pyarrow") is None:
+        raise ExportUnavailable(f"The {output} export requires the pyarrow package.")
+
+
+def stream_export(
+    rows: Iterable[tuple], output: str, chunk_size: int
+) -> Iterator[bytes]:
+    check_output(output)
+    if output == "csv":
+        return iter_csv(rows, chunk_size)
+    if output == "ndjson":
+        return iter_ndjson(rows, chunk_size)
+    return iter_columnar(rows, chunk_size, output)
+
+
+async def aiter_chunks(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Pulls the chunks of an export one at a time from the thread of its
+    database connection. The ASGI handler would otherwise read a synchronous
+    iterator to the end before sending its first byte.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close, thread_sensitive=True)()
@@ -6,7 +6,10 @@ from .models import Tag
 class AnemometerFilterSet(FilterSet):
     name = filters.CharFilter(lookup_expr="icontains")
     tag = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(), to_field_name="name", field_name="tags__name"
+        queryset=Tag.objects.all(),
+        to_field_name="name",
+        field_name="tags__name",
+        distinct=True,
     )
 
 
@@ -15,4 +18,5 @@ class WindReadingFilterSet(FilterSet):
         queryset=Tag.objects.all(),
         to_field_name="name",
         field_name="anemometer__tags__name",
+        distinct=True,
     )
@@ -0,0 +1,89 @@
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Anemometer, WindSpeedReadings
+from .serializers.model_serializers import WindReadingSerializer
+from .signals import readings_bulk_created
+
+UNKNOWN_ANEMOMETER_ERROR = "Anemometer with this name does not exist"
+
+
+def validate_readings(rows: list) -> tuple[list[dict], list[dict]]:
+    """
+    Validates raw reading rows and resolves their anemometer names.
+
+    Field validation reuses a single serializer instance for every row and all
+    the anemometer names are resolved with one query. Returns the valid rows,
+    ready to be inserted, and the per-row errors indexed on the input position.
+    """
+    serializer = WindReadingSerializer()
+    valid_rows, errors = [], []
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append(
+                {
+                    "index": index,
+                    "errors": {"non_field_errors": ["Expected an object."]},
+                }
+            )
+            continue
+        try:
+            validated_data = serializer.run_validation(row)
+        except serializers.ValidationError as exc:
+            errors.append({"index": index, "errors": exc.detail})
+            continue
+        valid_rows.append((index, validated_data))
+
+    names = {data["anemometer_to_link"] for _, data in valid_rows}
+    anemometer_ids = dict(
+        Anemometer.objects.filter(name__in=names).values_list("name", "id")
+    )
+
+    resolved_rows = []
+    for index, data in valid_rows:
+        anemometer_id = anemometer_ids.get(data["anemometer_to_link"])
+        if anemometer_id is None:
+            errors.append(
+                {
+                    "index": index,
+                    "errors": {"anemometer_to_link": [UNKNOWN_ANEMOMETER_ERROR]},
+                }
+            )
+            continue
+        resolved_rows.append(
+            {
+                "anemometer_id": anemometer_id,
+                "speed": data["speed"],
+                "date": data["date"],
+            }
+        )
+
+    errors.sort(key=lambda error: error["index"])
+    return resolved_rows, errors
+
+
+def insert_readings(
+    rows: list[dict], batch_size: int = 1000
+) -> list[WindSpeedReadings]:
+    """
+    Inserts already validated rows with set-based INSERTs and notifies the
+    `readings_bulk_created` receivers once for the whole batch.
+    """
+    if not rows:
+        return []
+
+    # The receivers run in the transaction, so that a failed batch leaves
+    # neither readings nor rollups behind and can be retried as a whole.
+    with transaction.atomic():
+        readings = WindSpeedReadings.objects.bulk_create(
+            [WindSpeedReadings(**row) for row in rows], batch_size=batch_size
+        )
+        readings_bulk_created.send(sender=WindSpeedReadings, readings=readings)
+    return readings
+
+
+def ingest_readings(rows: list) -> tuple[list[WindSpeedReadings], list[dict]]:
+    valid_rows, errors = validate_readings(rows)
+    readings = insert_readings(valid_rows)
+    return readings, errors
@@ -0,0 +1,67 @@
+"""
+Maintenance of the latest reading state denormalized on `Anemometer`.
+
+Inserted readings move the state forward with a conditional update that only
+keeps a later date, which the row lock makes safe against concurrent writers.
+Updated and deleted readings may have been the latest one, so the state of
+their anemometers is recomputed from the raw readings.
+"""
+
+from typing import Iterable
+
+from django.db import connection
+
+from .models import Anemometer, WindSpeedReadings
+
+ANEMOMETERS_TABLE = Anemometer._meta.db_table
+READINGS_TABLE = WindSpeedReadings._meta.db_table
+
+_RECORD_READINGS_SQL = f"""
+    UPDATE {ANEMOMETERS_TABLE} AS a
+    SET latest_reading_at = r.date, latest_speed = r.speed
+    FROM (
+        SELECT DISTINCT ON (anemometer_id) anemometer_id, speed, date
+        FROM unnest(%(anemometer_ids)s::bigint[], %(speeds)s::float8[],
+                    %(dates)s::timestamptz[]) AS r(anemometer_id, speed, date)
+        ORDER BY anemometer_id, date DESC
+    ) AS r
+    WHERE a.id = r.anemometer_id
+      AND (a.latest_reading_at IS NULL OR a.latest_reading_at <= r.date)
+"""
+
+_REFRESH_SQL = f"""
+    UPDATE {ANEMOMETERS_TABLE} AS a
+    SET (latest_reading_at, latest_speed) = (
+        SELECT date, speed FROM {READINGS_TABLE}
+        WHERE anemometer_id = a.id
+        ORDER BY date DESC
+        LIMIT 1
+    )
+    WHERE a.id = ANY(%(anemometer_ids)s)
+"""
+
+
+def record_readings(readings: Iterable[WindSpeedReadings]):
+    """
+    Moves the latest reading state forward for newly inserted readings.
+    """
+    readings = list(readings)
+    if not readings:
+        return
+
+    params = {
+        "anemometer_ids": [reading.anemometer_id for reading in readings],
+        "speeds": [reading.speed for reading in readings],
+        "dates": [reading.date for reading in readings],
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_RECORD_READINGS_SQL, params)
+
+
+def refresh_latest(anemometer_ids: Iterable[int]):
+    """
+    Recomputes the latest reading state of the anemometers from their
+    readings, clearing it when they have none left.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_REFRESH_SQL, {"anemometer_ids": list(set(anemometer_ids))})
@@ -0,0 +1,68 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from anemometers.exports import (
+    CONTENT_TYPES,
+    ExportUnavailable,
+    get_export_rows,
+    stream_export,
+)
+
+
+def datetime_argument(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid datetime {value!r}")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Streams the wind speed readings to a file in CSV, NDJSON, Parquet or Arrow."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", choices=list(CONTENT_TYPES), default="csv")
+        parser.add_argument(
+            "--file", help="Path of the export file, the standard output by default"
+        )
+        parser.add_argument(
+            "--anemometer",
+            type=int,
+            action="append",
+            dest="anemometers",
+            help="Id of an anemometer to export (repeatable)",
+        )
+        parser.add_argument(
+            "--tag",
+            action="append",
+            help="Only export the anemometers wearing this tag (repeatable)",
+        )
+        parser.add_argument("--start", type=datetime_argument)
+        parser.add_argument("--end", type=datetime_argument)
+        parser.add_argument(
+            "--chunk-size", type=int, default=settings.READINGS_EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        rows = get_export_rows(
+            anemometers=options["anemometers"],
+            tag=options["tag"],
+            start=options["start"],
+            end=options["end"],
+            chunk_size=options["chunk_size"],
+        )
+        try:
+            content = stream_export(rows, options["output"], options["chunk_size"])
+        except ExportUnavailable as exc:
+            raise CommandError(str(exc))
+
+        if options["file"]:
+            with open(options["file"], "wb") as file:
+                for chunk in content:
+                    file.write(chunk)
+        else:
+            for chunk in content:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from anemometers.partitions import (
+    DEFAULT_MONTHS_AHEAD,
+    add_months,
+    create_monthly_partition,
+    detach_monthly_partition,
+    is_partitioned,
+    list_monthly_partitions,
+    month_start,
+    partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the monthly partitions of the wind speed readings table ahead "
+        "of time and detaches the ones older than the retention period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=DEFAULT_MONTHS_AHEAD,
+            help="Number of future months to create partitions for",
+        )
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            default=None,
+            help="Detach the partitions of months older than this many months",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop the detached partitions instead of keeping them as tables",
+        )
+
+    def handle(self, *args, **options):
+        this_month = month_start(timezone.now().date())
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                raise CommandError(
+                    "The readings table is not partitioned, run the migrations first."
+                )
+
+            for offset in range(options["ahead"] + 1):
+                month = add_months(this_month, offset)
+                if create_monthly_partition(cursor, month):
+                    self.stdout.write(f"Created partition {partition_name(month)}")
+
+            if options["retention_months"] is not None:
+                cutoff = add_months(this_month, -options["retention_months"])
+                for month in sorted(list_monthly_partitions(cursor)):
+                    if month < cutoff:
+                        name = detach_monthly_partition(
+                            cursor, month, drop=options["drop"]
+                        )
+                        action = "Dropped" if options["drop"] else "Detached"
+                        self.stdout.write(f"{action} partition {name}")
+
+        self.stdout.write(self.style.SUCCESS("Partitions are up to date."))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from anemometers.models import Anemometer
+from anemometers.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills the daily and weekly wind speed rollups from the raw readings, "
+        "a chunk of anemometers at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--anemometer",
+            type=int,
+            action="append",
+            dest="anemometer_ids",
+            help="Only rebuild the rollups of this anemometer id (repeatable)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50,
+            help="Number of anemometers rebuilt per transaction",
+        )
+
+    def handle(self, *args, **options):
+        anemometers = Anemometer.objects.order_by("id")
+        if options["anemometer_ids"]:
+            anemometers = anemometers.filter(id__in=options["anemometer_ids"])
+        anemometer_ids = list(anemometers.values_list("id", flat=True))
+
+        chunk_size = options["chunk_size"]
+        for start in range(0, len(anemometer_ids), chunk_size):
+            end = start + chunk_size
+            chunk = anemometer_ids[start:end]
+            rebuild_rollups(chunk)
+            self.stdout.write(
+                f"Rebuilt rollups of {start + len(chunk)}/{len(anemometer_ids)} anemometers"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Rollups are up to date."))
@@ -0,0 +1,84 @@
+import io
+import pstats
+import re
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+QUERY_HEADER = re.compile(r"^-- (?P<duration>[\d.]+) ms on \S+$")
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarizes the hot spots of the profiles captured by the profiling "
+        "middleware: the costliest functions and SQL statements across them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir",
+            default=settings.PROFILING_DIR,
+            help="Directory of the captured profiles",
+        )
+        parser.add_argument(
+            "--route",
+            help="Only summarize the profiles of routes containing this text",
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["tottime", "cumulative", "ncalls"],
+            default="tottime",
+            help="Ordering of the functions",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Number of functions and SQL statements listed",
+        )
+
+    def handle(self, *args, **options):
+        profiles = sorted(Path(options["dir"]).glob("*.prof"))
+        if options["route"]:
+            profiles = [path for path in profiles if options["route"] in path.stem]
+        if not profiles:
+            raise CommandError(f"No profiles found in {options['dir']}.")
+
+        self.stdout.write(f"{len(profiles)} profile(s)\n")
+        stream = io.StringIO()
+        stats = pstats.Stats(stream=stream)
+        for profile in profiles:
+            try:
+                stats.add(str(profile))
+            except TypeError:
+                # The request ended before its first sample.
+                continue
+        stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
+        self.stdout.write(stream.getvalue())
+
+        statements = self.sql_statements(profiles)
+        top = sorted(statements.items(), key=lambda item: item[1][1], reverse=True)
+        self.stdout.write("   count   total ms  statement")
+        for sql, (count, total) in top[: options["limit"]]:
+            self.stdout.write(f"{count:8d} {total:10.1f}  {sql}")
+
+    def sql_statements(self, profiles) -> dict:
+        """
+        Totals the duration of each statement of the SQL reports, ignoring
+        their parameters.
+        """
+        statements = defaultdict(lambda: [0, 0.0])
+        for profile in profiles:
+            report = profile.with_suffix(".sql")
+            if not report.exists():
+                continue
+            lines = report.read_text().splitlines()
+            for header, sql in zip(lines, lines[1:]):
+                match = QUERY_HEADER.match(header)
+                if match:
+                    statement = statements[sql]
+                    statement[0] += 1
+                    statement[1] += float(match["duration"])
+        return statements
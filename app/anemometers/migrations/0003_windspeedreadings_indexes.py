@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:12
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anemometers", "0002_windspeedreadings"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="windspeedreadings",
+            index=models.Index(
+                fields=["anemometer", "-date"], name="readings_anemometer_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="windspeedreadings",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                fields=["date"], name="readings_date_brin_idx"
+            ),
+        ),
+    ]
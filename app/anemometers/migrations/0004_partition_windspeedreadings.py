@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.utils import timezone
+
+from anemometers.partitions import partition_readings_table, unpartition_readings_table
+
+
+def partition(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        partition_readings_table(cursor, today=timezone.now().date())
+
+
+def unpartition(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        unpartition_readings_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anemometers", "0003_windspeedreadings_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+    INSERT INTO anemometers_windspeedrollup
+        (anemometer_id, period, bucket, speed_sum, speed_count, speed_min, speed_max)
+    SELECT anemometer_id, %(period)s, bucket, SUM(speed), COUNT(*), MIN(speed), MAX(speed)
+    FROM (SELECT anemometer_id, speed,
+                 date_trunc(%(period)s, date AT TIME ZONE %(tz)s) AT TIME ZONE %(tz)s
+                     AS bucket
+          FROM anemometers_windspeedreadings) AS readings
+    GROUP BY anemometer_id, bucket
+"""
+
+
+def backfill_rollups(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for period in ("day", "week"):
+            cursor.execute(BACKFILL_SQL, {"period": period, "tz": settings.TIME_ZONE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anemometers", "0004_partition_windspeedreadings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WindSpeedRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week")], max_length=8
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.DateTimeField(help_text="start of the aggregated period"),
+                ),
+                ("speed_sum", models.FloatField(help_text="speed in knots")),
+                ("speed_count", models.PositiveIntegerField()),
+                ("speed_min", models.FloatField(help_text="speed in knots")),
+                ("speed_max", models.FloatField(help_text="speed in knots")),
+                (
+                    "anemometer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="wind_rollups",
+                        to="anemometers.anemometer",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("anemometer", "period", "bucket"),
+                        name="unique_rollup_bucket",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anemometers", "0005_windspeedrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="anemometer",
+            name="modified_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="last change of the anemometer or of its readings",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+def backfill_latest_readings(apps, schema_editor):
+    from anemometers.latest import refresh_latest
+
+    Anemometer = apps.get_model("anemometers", "Anemometer")
+    refresh_latest(Anemometer.objects.values_list("id", flat=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anemometers", "0006_anemometer_modified_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="anemometer",
+            name="latest_reading_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="date of the latest reading",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="anemometer",
+            name="latest_speed",
+            field=models.FloatField(
+                blank=True,
+                editable=False,
+                help_text="speed of the latest reading, in knots",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_latest_readings, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.indexes import BrinIndex
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 
 class Tag(models.Model):
@@ -20,10 +22,40 @@ class Anemometer(gis_models.Model):
     )
     coordinates = gis_models.PointField(geography=True, srid=4326)
     tags = models.ManyToManyField(to=Tag, related_name="anemometers", blank=True)
+    modified_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="last change of the anemometer or of its readings",
+    )
+    latest_reading_at = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="date of the latest reading"
+    )
+    latest_speed = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="speed of the latest reading, in knots",
+    )
+
+    # Maintained by `latest.py` with SQL updates, never written by `save`.
+    LATEST_READING_FIELDS = ("latest_reading_at", "latest_speed")
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.modified_at = timezone.now()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "modified_at"}
+        elif not self._state.adding and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = {
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.LATEST_READING_FIELDS
+            }
+        super().save(*args, **kwargs)
+
 
 class WindSpeedReadings(models.Model):
     anemometer = models.ForeignKey(
@@ -34,3 +66,39 @@ class WindSpeedReadings(models.Model):
         help_text="speed in knots",
     )
     date = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["anemometer", "-date"], name="readings_anemometer_date_idx"
+            ),
+            BrinIndex(fields=["date"], name="readings_date_brin_idx"),
+        ]
+
+
+class WindSpeedRollup(models.Model):
+    """
+    Wind speed statistics of an anemometer aggregated per day or per week,
+    maintained incrementally from the readings by `anemometers.rollups`.
+    """
+
+    class Period(models.TextChoices):
+        DAY = "day"
+        WEEK = "week"
+
+    anemometer = models.ForeignKey(
+        to=Anemometer, on_delete=models.CASCADE, related_name="wind_rollups"
+    )
+    period = models.CharField(max_length=8, choices=Period.choices)
+    bucket = models.DateTimeField(help_text="start of the aggregated period")
+    speed_sum = models.FloatField(help_text="speed in knots")
+    speed_count = models.PositiveIntegerField()
+    speed_min = models.FloatField(help_text="speed in knots")
+    speed_max = models.FloatField(help_text="speed in knots")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["anemometer", "period", "bucket"], name="unique_rollup_bucket"
+            ),
+        ]
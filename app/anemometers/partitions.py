@@ -0,0 +1,243 @@
+"""
+Monthly range partitioning of the wind speed readings table.
+
+The ORM keeps seeing a single `anemometers_windspeedreadings` table: PostgreSQL
+routes rows to the `_pYYYY_MM` partition covering their date, or to the
+`_default` partition when no monthly partition exists yet.
+"""
+
+import re
+from datetime import date, datetime, timezone
+
+READINGS_TABLE = "anemometers_windspeedreadings"
+DEFAULT_PARTITION = f"{READINGS_TABLE}_default"
+ID_SEQUENCE = f"{READINGS_TABLE}_id_seq"
+DEFAULT_MONTHS_AHEAD = 3
+
+_PARTITION_NAME_RE = re.compile(rf"^{READINGS_TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    start = month_start(month)
+    end = add_months(start, 1)
+    return (
+        datetime(start.year, start.month, 1, tzinfo=timezone.utc),
+        datetime(end.year, end.month, 1, tzinfo=timezone.utc),
+    )
+
+
+def partition_name(month: date) -> str:
+    return f"{READINGS_TABLE}_p{month:%Y_%m}"
+
+
+def is_partitioned(cursor, table: str = READINGS_TABLE) -> bool:
+    cursor.execute(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = %s
+        )
+        """,
+        [table],
+    )
+    return cursor.fetchone()[0]
+
+
+def list_monthly_partitions(cursor) -> dict[date, str]:
+    """
+    Returns the monthly partitions currently attached, keyed by month.
+    """
+    cursor.execute(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+        """,
+        [READINGS_TABLE],
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = _PARTITION_NAME_RE.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_monthly_partition(cursor, month: date) -> bool:
+    """
+    Creates the partition of `month`, moving the rows of that month which
+    already landed in the default partition. Must run inside a transaction.
+    Returns False if the partition already exists.
+    """
+    month = month_start(month)
+    if month in list_monthly_partitions(cursor):
+        return False
+
+    name = partition_name(month)
+    start, end = month_bounds(month)
+
+    cursor.execute(f"ALTER TABLE {READINGS_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    cursor.execute(
+        f"CREATE TABLE {name} PARTITION OF {READINGS_TABLE} FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+        """,
+        [start, end],
+    )
+    cursor.execute(
+        f"ALTER TABLE {READINGS_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+    )
+    return True
+
+
+def detach_monthly_partition(cursor, month: date, drop: bool = False) -> str:
+    """
+    Detaches the partition of `month` from the readings table. The detached
+    table is kept for archiving unless `drop` is set.
+    """
+    name = partition_name(month_start(month))
+    cursor.execute(f"ALTER TABLE {READINGS_TABLE} DETACH PARTITION {name}")
+    if drop:
+        cursor.execute(f"DROP TABLE {name}")
+    return name
+
+
+def _pop_indexes_and_foreign_keys(cursor, table: str) -> list[str]:
+    """
+    Drops the secondary indexes and foreign keys of `table` and returns the
+    statements recreating them, so they can be replayed on a new table.
+    """
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+        """,
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('p', 'u')
+        )
+        """,
+        [table, table],
+    )
+    indexes = cursor.fetchall()
+
+    for name, _ in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    for name, _ in indexes:
+        cursor.execute(f"DROP INDEX {name}")
+
+    return [definition for _, definition in indexes] + [
+        f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"
+        for name, definition in foreign_keys
+    ]
+
+
+def _replay(cursor, statements: list[str], source: str, target: str):
+    for statement in statements:
+        # Indexes of a partitioned table are defined `ON ONLY` the parent.
+        statement = statement.replace(" ON ONLY ", " ON ")
+        cursor.execute(statement.replace(source, target))
+
+
+def partition_readings_table(cursor, today: date):
+    """
+    Converts the plain readings table into a table partitioned by month.
+
+    Partitions are created for every month holding data and for
+    `DEFAULT_MONTHS_AHEAD` months after `today`. The primary key becomes
+    `(id, date)`, as PostgreSQL requires the partition key in it, and `id`
+    keeps being generated by a sequence so the ORM is unaffected. Rows are
+    copied, so this runs in time proportional to the table size.
+    """
+    if is_partitioned(cursor):
+        return
+
+    legacy = f"{READINGS_TABLE}_legacy"
+    cursor.execute(f"ALTER TABLE {READINGS_TABLE} RENAME TO {legacy}")
+    statements = _pop_indexes_and_foreign_keys(cursor, legacy)
+    cursor.execute(
+        f"ALTER TABLE {legacy} RENAME CONSTRAINT {READINGS_TABLE}_pkey TO {legacy}_pkey"
+    )
+
+    cursor.execute(
+        f"""
+        CREATE TABLE {READINGS_TABLE} (LIKE {legacy} INCLUDING DEFAULTS)
+        PARTITION BY RANGE (date)
+        """
+    )
+    cursor.execute(f"ALTER TABLE {READINGS_TABLE} ADD PRIMARY KEY (id, date)")
+    cursor.execute(
+        f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {READINGS_TABLE} DEFAULT"
+    )
+
+    cursor.execute(f"SELECT MIN(date) FROM {legacy}")
+    first_date = cursor.fetchone()[0]
+    month = month_start(first_date.date() if first_date else today)
+    last_month = add_months(month_start(today), DEFAULT_MONTHS_AHEAD)
+    while month <= last_month:
+        create_monthly_partition(cursor, month)
+        month = add_months(month, 1)
+
+    cursor.execute(f"INSERT INTO {READINGS_TABLE} SELECT * FROM {legacy}")
+    cursor.execute(f"DROP TABLE {legacy}")
+
+    cursor.execute(f"CREATE SEQUENCE {ID_SEQUENCE} OWNED BY {READINGS_TABLE}.id")
+    cursor.execute(
+        f"SELECT setval(%s, COALESCE(MAX(id), 0) + 1, false) FROM {READINGS_TABLE}",
+        [ID_SEQUENCE],
+    )
+    cursor.execute(
+        f"ALTER TABLE {READINGS_TABLE} ALTER COLUMN id SET DEFAULT nextval(%s)",
+        [ID_SEQUENCE],
+    )
+
+    _replay(cursor, statements, legacy, READINGS_TABLE)
+
+
+def unpartition_readings_table(cursor):
+    """
+    Converts the partitioned readings table back into a plain table.
+    """
+    if not is_partitioned(cursor):
+        return
+
+    partitioned = f"{READINGS_TABLE}_partitioned"
+    cursor.execute(f"ALTER TABLE {READINGS_TABLE} RENAME TO {partitioned}")
+    statements = _pop_indexes_and_foreign_keys(cursor, partitioned)
+    cursor.execute(
+        f"ALTER TABLE {partitioned} RENAME CONSTRAINT {READINGS_TABLE}_pkey "
+        f"TO {partitioned}_pkey"
+    )
+
+    cursor.execute(
+        f"CREATE TABLE {READINGS_TABLE} (LIKE {partitioned} INCLUDING DEFAULTS)"
+    )
+    cursor.execute(f"ALTER TABLE {READINGS_TABLE} ADD PRIMARY KEY (id)")
+    cursor.execute(f"ALTER SEQUENCE {ID_SEQUENCE} OWNED BY {READINGS_TABLE}.id")
+    cursor.execute(f"INSERT INTO {READINGS_TABLE} SELECT * FROM {partitioned}")
+    cursor.execute(f"DROP TABLE {partitioned} CASCADE")
+
+    _replay(cursor, statements, partitioned, READINGS_TABLE)
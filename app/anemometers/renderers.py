@@ -0,0 +1,19 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views stream `text/event-stream` responses; other data, such as
+    errors, is rendered as a single JSON message event.
+    """
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return f"event: error\ndata: {json.dumps(data)}\n\n".encode(self.charset)
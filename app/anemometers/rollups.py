@@ -0,0 +1,165 @@
+"""
+Incremental maintenance of the daily and weekly `WindSpeedRollup` buckets.
+
+Inserted readings are folded into their buckets with a single upsert per
+period. Updated and deleted readings cannot be subtracted from the min/max, so
+their buckets are recomputed from the raw readings they cover.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import WindSpeedReadings, WindSpeedRollup
+
+ROLLUPS_TABLE = WindSpeedRollup._meta.db_table
+READINGS_TABLE = WindSpeedReadings._meta.db_table
+PERIODS = WindSpeedRollup.Period.values
+
+_BUCKET_SQL = "date_trunc(%(period)s, {date} AT TIME ZONE %(tz)s) AT TIME ZONE %(tz)s"
+
+_INSERT_SQL = f"""
+    INSERT INTO {ROLLUPS_TABLE}
+        (anemometer_id, period, bucket, speed_sum, speed_count, speed_min, speed_max)
+    SELECT anemometer_id, %(period)s, bucket, SUM(speed), COUNT(*), MIN(speed), MAX(speed)
+    FROM (SELECT anemometer_id, speed, {_BUCKET_SQL.format(date="date")} AS bucket
+          FROM {{source}}) AS readings
+    GROUP BY anemometer_id, bucket
+"""
+
+_ADD_READINGS_SQL = (
+    _INSERT_SQL.format(
+        source="unnest(%(anemometer_ids)s::bigint[], %(speeds)s::float8[], "
+        "%(dates)s::timestamptz[]) AS r(anemometer_id, speed, date)"
+    )
+    + f"""
+    ON CONFLICT (anemometer_id, period, bucket) DO UPDATE SET
+        speed_sum = {ROLLUPS_TABLE}.speed_sum + EXCLUDED.speed_sum,
+        speed_count = {ROLLUPS_TABLE}.speed_count + EXCLUDED.speed_count,
+        speed_min = LEAST({ROLLUPS_TABLE}.speed_min, EXCLUDED.speed_min),
+        speed_max = GREATEST({ROLLUPS_TABLE}.speed_max, EXCLUDED.speed_max)
+"""
+)
+
+_DELETE_BUCKETS_SQL = f"""
+    DELETE FROM {ROLLUPS_TABLE}
+    WHERE anemometer_id = %(anemometer_id)s AND period = %(period)s AND bucket IN (
+        SELECT {_BUCKET_SQL.format(date="d")} FROM unnest(%(dates)s::timestamptz[]) AS d
+    )
+"""
+
+_REFRESH_BUCKETS_SQL = _INSERT_SQL.format(
+    source=f"""{READINGS_TABLE}
+          JOIN (SELECT DISTINCT {_BUCKET_SQL.format(date="d")} AS start
+                FROM unnest(%(dates)s::timestamptz[]) AS d) AS buckets
+          ON date >= buckets.start AND date < buckets.start + ('1 ' || %(period)s)::interval
+          WHERE anemometer_id = %(anemometer_id)s"""
+)
+
+_REBUILD_SQL = _INSERT_SQL.format(
+    source=f"{READINGS_TABLE} WHERE anemometer_id = ANY(%(anemometer_ids)s)"
+)
+
+
+def add_readings(readings: Iterable[WindSpeedReadings]):
+    """
+    Folds newly inserted readings into their daily and weekly buckets.
+    """
+    readings = list(readings)
+    if not readings:
+        return
+
+    params = {
+        "anemometer_ids": [reading.anemometer_id for reading in readings],
+        "speeds": [reading.speed for reading in readings],
+        "dates": [reading.date for reading in readings],
+        "tz": settings.TIME_ZONE,
+    }
+    with connection.cursor() as cursor:
+        for period in PERIODS:
+            cursor.execute(_ADD_READINGS_SQL, {**params, "period": period})
+
+
+def refresh_buckets(anemometer_id: int, dates: Iterable[datetime]):
+    """
+    Recomputes from the raw readings the buckets of an anemometer containing
+    the given dates.
+    """
+    params = {
+        "anemometer_id": anemometer_id,
+        "dates": list(dates),
+        "tz": settings.TIME_ZONE,
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        for period in PERIODS:
+            cursor.execute(_DELETE_BUCKETS_SQL, {**params, "period": period})
+            cursor.execute(_REFRESH_BUCKETS_SQL, {**params, "period": period})
+
+
+def rebuild_rollups(anemometer_ids: list[int]):
+    """
+    Recomputes every bucket of the given anemometers from the raw readings.
+    """
+    params = {"anemometer_ids": anemometer_ids, "tz": settings.TIME_ZONE}
+    with transaction.atomic(), connection.cursor() as cursor:
+        WindSpeedRollup.objects.filter(anemometer_id__in=anemometer_ids).delete()
+        for period in PERIODS:
+            cursor.execute(_REBUILD_SQL, {**params, "period": period})
+
+
+def _mean_speed_querysets(anemometer_id: int, since: datetime):
+    """
+    Whole days are read from the daily buckets and only the readings of the
+    partial day following `since` are aggregated from the raw table.
+    """
+    tz = timezone.get_default_timezone()
+    boundary = since.astimezone(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    if boundary < since:
+        boundary += timedelta(days=1)
+
+    buckets = WindSpeedRollup.objects.filter(
+        anemometer_id=anemometer_id,
+        period=WindSpeedRollup.Period.DAY,
+        bucket__gte=boundary,
+    )
+    partial_day = WindSpeedReadings.objects.filter(
+        anemometer_id=anemometer_id, date__gte=since, date__lt=boundary
+    )
+    return buckets, partial_day
+
+
+def _mean_speed(buckets: dict, partial_day: dict) -> Optional[float]:
+    count = (buckets["count"] or 0) + partial_day["count"]
+    if not count:
+        return None
+    return round(((buckets["total"] or 0) + (partial_day["total"] or 0)) / count, 2)
+
+
+def mean_speed_since(anemometer_id: int, since: datetime) -> Optional[float]:
+    """
+    Mean speed of the readings dated after `since`, rounded to 2 decimals.
+    """
+    buckets, partial_day = _mean_speed_querysets(anemometer_id, since)
+    return _mean_speed(
+        buckets.aggregate(total=Sum("speed_sum"), count=Sum("speed_count")),
+        partial_day.aggregate(total=Sum("speed"), count=Count("id")),
+    )
+
+
+async def amean_speed_since(anemometer_id: int, since: datetime) -> Optional[float]:
+    """
+    Async variant of `mean_speed_since`, aggregating the buckets and the
+    partial day concurrently.
+    """
+    buckets, partial_day = _mean_speed_querysets(anemometer_id, since)
+    return _mean_speed(
+        *await asyncio.gather(
+            buckets.aaggregate(total=Sum("speed_sum"), count=Sum("speed_count")),
+            partial_day.aaggregate(total=Sum("speed"), count=Count("id")),
+        )
+    )
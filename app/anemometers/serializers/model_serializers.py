@@ -1,11 +1,11 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 
-from django.db.models import Avg
-from django.db.models.functions import Round
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
 
 from ..models import Anemometer, Tag, WindSpeedReadings
+from ..rollups import mean_speed_since
 
 
 class AnemometerSerializer(GeoFeatureModelSerializer):
@@ -17,10 +17,18 @@ class AnemometerSerializer(GeoFeatureModelSerializer):
     class Meta:
         model = Anemometer
         geo_field = "coordinates"
-        fields = ("id", "name", "coordinates", "tags", "tags_to_link")
+        fields = (
+            "id",
+            "name",
+            "coordinates",
+            "tags",
+            "tags_to_link",
+            "latest_reading_at",
+            "latest_speed",
+        )
 
     def get_tags(self, obj):
-        return obj.tags.all().values_list("name", flat=True)
+        return [tag.name for tag in obj.tags.all()]
 
     def validate_coordinates(self, value):
         longitude, latitude = value.coords
@@ -117,27 +125,25 @@ class AnemometerRetrieveSerializer(GeoFeatureModelSerializer):
             "name",
             "coordinates",
             "tags",
+            "latest_reading_at",
+            "latest_speed",
             "last_day_mean_speed",
             "last_week_mean_speed",
         )
 
     def get_tags(self, obj):
-        return obj.tags.all().values_list("name", flat=True)
+        return [tag.name for tag in obj.tags.all()]
 
+    # Both means may be computed ahead of the serialization, as by the async
+    # retrieve view, and set on the anemometer.
     def get_last_day_mean_speed(self, anemometer):
-        last_day = datetime.now() - timedelta(days=1)
-        mean_speed = (
-            anemometer.wind_readings.filter(date__gte=last_day)
-            .aggregate(mean_speed=Round(Avg("speed"), 2))
-            .get("mean_speed")
-        )
-        return mean_speed
+        if hasattr(anemometer, "last_day_mean_speed"):
+            return anemometer.last_day_mean_speed
+        last_day = timezone.now() - timedelta(days=1)
+        return mean_speed_since(anemometer.id, since=last_day)
 
     def get_last_week_mean_speed(self, anemometer):
-        last_week = datetime.now() - timedelta(weeks=1)
-        mean_speed = (
-            anemometer.wind_readings.filter(date__gte=last_week)
-            .aggregate(mean_speed=Round(Avg("speed"), 2))
-            .get("mean_speed")
-        )
-        return mean_speed
+        if hasattr(anemometer, "last_week_mean_speed"):
+            return anemometer.last_week_mean_speed
+        last_week = timezone.now() - timedelta(weeks=1)
+        return mean_speed_since(anemometer.id, since=last_week)
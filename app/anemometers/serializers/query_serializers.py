@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from ..aggregates import BUCKETS, STATS
+
 
 class SpeedStatsWithinRadiusQuerySerializer(serializers.Serializer):
     lon = serializers.FloatField(
@@ -11,3 +14,169 @@ class SpeedStatsWithinRadiusQuerySerializer(serializers.Serializer):
     radius = serializers.FloatField(
         min_value=0, max_value=500, help_text="radius in nautical miles"
     )
+
+
+class NearestAnemometersQuerySerializer(serializers.Serializer):
+    lon = serializers.FloatField(
+        min_value=-180, max_value=180, help_text="Longitude of the point"
+    )
+    lat = serializers.FloatField(
+        min_value=-90, max_value=90, help_text="Latitude of the point"
+    )
+    k = serializers.IntegerField(
+        min_value=1, max_value=100, default=5, help_text="Number of anemometers"
+    )
+
+
+class CommaSeparatedListField(serializers.ListField):
+    """
+    List given either as repeated query parameters or as comma-separated values.
+    """
+
+    def get_value(self, dictionary):
+        value = super().get_value(dictionary)
+        if not isinstance(value, list):
+            return value
+        return [item.strip() for v in value for item in v.split(",") if item.strip()]
+
+
+class TimeWindowQuerySerializer(serializers.Serializer):
+    start = serializers.DateTimeField(
+        required=False, help_text="Only consider the readings from this date"
+    )
+    end = serializers.DateTimeField(
+        required=False, help_text="Only consider the readings before this date"
+    )
+
+    def validate(self, attrs):
+        if "start" in attrs and "end" in attrs and attrs["start"] >= attrs["end"]:
+            raise serializers.ValidationError("start must be before end.")
+        return attrs
+
+
+class BatchSpeedStatsWithinRadiusQuerySerializer(TimeWindowQuerySerializer):
+    centers = SpeedStatsWithinRadiusQuerySerializer(
+        many=True,
+        allow_empty=False,
+        max_length=settings.READINGS_RADIUS_BATCH_MAX_CENTERS,
+        help_text="Centers and radii to compute the stats around",
+    )
+
+
+class WindFieldQuerySerializer(TimeWindowQuerySerializer):
+    min_lon = serializers.FloatField(min_value=-180, max_value=180)
+    min_lat = serializers.FloatField(min_value=-90, max_value=90)
+    max_lon = serializers.FloatField(min_value=-180, max_value=180)
+    max_lat = serializers.FloatField(min_value=-90, max_value=90)
+    width = serializers.IntegerField(
+        min_value=1, max_value=512, default=64, help_text="Grid columns"
+    )
+    height = serializers.IntegerField(
+        min_value=1, max_value=512, default=64, help_text="Grid rows"
+    )
+    power = serializers.FloatField(
+        min_value=0.5, max_value=5, default=2, help_text="Inverse distance power"
+    )
+    output = serializers.ChoiceField(
+        choices=["png", "f32"],
+        default="png",
+        help_text="16-bit grayscale PNG in hundredths of knots, or raw float32 array",
+    )
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs["min_lon"] >= attrs["max_lon"] or attrs["min_lat"] >= attrs["max_lat"]:
+            raise serializers.ValidationError("The bounding box is empty.")
+        return attrs
+
+
+class AnemometerConditionsQuerySerializer(serializers.Serializer):
+    ids = CommaSeparatedListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        help_text="Ids of the anemometers",
+    )
+    tag = CommaSeparatedListField(
+        child=serializers.CharField(max_length=64),
+        required=False,
+        help_text="Only the anemometers wearing one of these tags",
+    )
+
+
+class ReadingsStreamQuerySerializer(serializers.Serializer):
+    anemometers = CommaSeparatedListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        help_text="Ids of the anemometers to follow",
+    )
+    tag = CommaSeparatedListField(
+        child=serializers.CharField(max_length=64),
+        required=False,
+        help_text="Only follow the anemometers wearing one of these tags",
+    )
+    lon = serializers.FloatField(
+        min_value=-180,
+        max_value=180,
+        required=False,
+        help_text="Longitude of the center point",
+    )
+    lat = serializers.FloatField(
+        min_value=-90,
+        max_value=90,
+        required=False,
+        help_text="Latitude of the center point",
+    )
+    radius = serializers.FloatField(
+        min_value=0, max_value=500, required=False, help_text="radius in nautical miles"
+    )
+
+    def validate(self, attrs):
+        area = [name for name in ("lon", "lat", "radius") if name in attrs]
+        if area and len(area) != 3:
+            raise serializers.ValidationError("lon, lat and radius go together.")
+        return attrs
+
+
+class ReadingsAggregateQuerySerializer(TimeWindowQuerySerializer):
+    bucket = serializers.ChoiceField(
+        choices=BUCKETS,
+        default="1d",
+        help_text="Size of the time buckets",
+    )
+    stats = CommaSeparatedListField(
+        child=serializers.ChoiceField(choices=STATS),
+        default=["mean"],
+        allow_empty=False,
+        help_text="Statistics computed per bucket",
+    )
+    anemometers = CommaSeparatedListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        help_text="Ids of the anemometers to aggregate",
+    )
+    tag = CommaSeparatedListField(
+        child=serializers.CharField(max_length=64),
+        required=False,
+        help_text="Only aggregate the anemometers wearing one of these tags",
+    )
+
+    def validate_stats(self, value):
+        return list(dict.fromkeys(value))
+
+
+class ReadingsExportQuerySerializer(TimeWindowQuerySerializer):
+    output = serializers.ChoiceField(
+        choices=["csv", "ndjson", "parquet", "arrow"],
+        default="csv",
+        help_text="Export file format",
+    )
+    anemometers = CommaSeparatedListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        help_text="Ids of the anemometers to export",
+    )
+    tag = CommaSeparatedListField(
+        child=serializers.CharField(max_length=64),
+        required=False,
+        help_text="Only export the anemometers wearing one of these tags",
+    )
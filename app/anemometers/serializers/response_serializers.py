@@ -19,3 +19,94 @@ class SpeedStatsWithinRadiusResponseSerializer(serializers.Serializer):
     min_speed = serializers.FloatField(help_text="speed in knots")
     max_speed = serializers.FloatField(help_text="speed in knots")
     mean_speed = serializers.FloatField(help_text="speed in knots")
+
+
+class BatchSpeedStatsWithinRadiusResponseSerializer(
+    SpeedStatsWithinRadiusResponseSerializer
+):
+    lon = serializers.FloatField(help_text="Longitude of the center point")
+    lat = serializers.FloatField(help_text="Latitude of the center point")
+    radius = serializers.FloatField(help_text="radius in nautical miles")
+
+
+class NearestAnemometerResponseSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    distance = serializers.FloatField(help_text="distance in nautical miles")
+    latest_speed = serializers.FloatField(
+        allow_null=True, help_text="speed of the latest reading, in knots"
+    )
+    latest_date = serializers.DateTimeField(
+        allow_null=True, help_text="date of the latest reading"
+    )
+    last_day_mean_speed = serializers.FloatField(
+        allow_null=True, help_text="mean speed over the last 24 hours, in knots"
+    )
+
+
+class ReadingsAggregateSeriesResponseSerializer(serializers.Serializer):
+    anemometer = serializers.IntegerField(help_text="Id of the anemometer")
+    time = serializers.ListField(
+        child=serializers.DateTimeField(), help_text="Start of each bucket"
+    )
+    mean = serializers.ListField(child=serializers.FloatField(), required=False)
+    min = serializers.ListField(child=serializers.FloatField(), required=False)
+    max = serializers.ListField(child=serializers.FloatField(), required=False)
+    count = serializers.ListField(child=serializers.IntegerField(), required=False)
+    p95 = serializers.ListField(child=serializers.FloatField(), required=False)
+
+
+class ReadingsAggregateResponseSerializer(serializers.Serializer):
+    bucket = serializers.CharField()
+    stats = serializers.ListField(child=serializers.CharField())
+    series = ReadingsAggregateSeriesResponseSerializer(many=True)
+
+
+class AnemometerConditionsResponseSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    latest_speed = serializers.FloatField(
+        allow_null=True, help_text="speed of the latest reading, in knots"
+    )
+    latest_date = serializers.DateTimeField(
+        allow_null=True, help_text="date of the latest reading"
+    )
+    last_day_mean_speed = serializers.FloatField(
+        allow_null=True, help_text="mean speed over the last 24 hours, in knots"
+    )
+    last_week_mean_speed = serializers.FloatField(
+        allow_null=True, help_text="mean speed over the last 7 days, in knots"
+    )
+
+
+class BulkReadingErrorResponseSerializer(serializers.Serializer):
+    index = serializers.IntegerField(help_text="Position of the row in the batch")
+    errors = serializers.DictField(help_text="Validation errors of the row")
+
+
+class BulkReadingsResponseSerializer(serializers.Serializer):
+    created = serializers.IntegerField(help_text="Number of readings created")
+    errors = BulkReadingErrorResponseSerializer(many=True)
+
+
+class QueuedReadingsResponseSerializer(serializers.Serializer):
+    queued = serializers.IntegerField(help_text="Number of readings queued")
+    errors = BulkReadingErrorResponseSerializer(many=True)
+
+
+class ReadingsBufferStatsResponseSerializer(serializers.Serializer):
+    depth = serializers.IntegerField(help_text="Readings waiting to be flushed")
+    capacity = serializers.IntegerField(help_text="Maximum number of queued readings")
+    running = serializers.BooleanField(help_text="Whether the flusher thread runs")
+    enqueued = serializers.IntegerField()
+    rejected = serializers.IntegerField(help_text="Readings refused on a full buffer")
+    flushed = serializers.IntegerField()
+    failed = serializers.IntegerField(
+        help_text="Invalid readings isolated and dropped by a flush"
+    )
+    retried = serializers.IntegerField(
+        help_text="Readings put back in the queue after a database failure"
+    )
+    flushes = serializers.IntegerField()
+    last_flush_ms = serializers.FloatField(allow_null=True)
+    max_flush_ms = serializers.FloatField(allow_null=True)
@@ -1,12 +1,173 @@
-from django.db.models.signals import post_delete, post_save
-from django.dispatch import receiver
+from functools import partial
 
-from core.cache import clear_anemometer_cache
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 
-from .models import WindSpeedReadings
+from core.cache import clear_anemometer_cache, clear_anemometers_cache
+
+from . import rollups, streams
+from .latest import record_readings, refresh_latest
+from .models import Anemometer, WindSpeedReadings
+from .spatial import invalidate_anemometer_index
+from .tiles import clear_anemometer_tiles, clear_tiles
+
+# Sent once per batch by `ingest.insert_readings`, whose `bulk_create` does not
+# trigger the per-instance model signals. Receivers get the `readings` list.
+readings_bulk_created = Signal()
+
+
+def is_anemometer_deletion(origin) -> bool:
+    if isinstance(origin, QuerySet):
+        return origin.model is Anemometer
+    return isinstance(origin, Anemometer)
+
+
+def mark_anemometers_modified(anemometer_ids):
+    """
+    Moves the last-modified watermark of the anemometers forward, and drops
+    their cached responses once the readings are committed.
+    """
+    anemometer_ids = set(anemometer_ids)
+    Anemometer.objects.filter(id__in=anemometer_ids).update(modified_at=timezone.now())
+    # Bumped before the commit, the generations would let concurrent requests
+    # cache the previous readings under them until they expire.
+    transaction.on_commit(partial(clear_anemometers_cache, anemometer_ids))
+    clear_anemometer_tiles(anemometer_ids)
+
+
+@receiver(post_save, sender=WindSpeedReadings)
+@receiver(post_delete, sender=WindSpeedReadings)
+def empty_cache(sender, instance, origin=None, **kwargs):
+    if is_anemometer_deletion(origin):
+        return
+    anemometer_ids = [instance.anemometer_id]
+    previous = getattr(instance, "_previous_values", None)
+    if previous is not None:
+        anemometer_ids.append(previous["anemometer_id"])
+    mark_anemometers_modified(anemometer_ids)
+
+
+@receiver(post_save, sender=Anemometer)
+@receiver(post_delete, sender=Anemometer)
+def empty_anemometer_cache(sender, instance, **kwargs):
+    clear_anemometer_cache(instance.id)
+
+
+@receiver(post_save, sender=Anemometer)
+@receiver(post_delete, sender=Anemometer)
+def rebuild_anemometer_index(sender, instance, **kwargs):
+    invalidate_anemometer_index()
+
+
+@receiver(pre_save, sender=Anemometer)
+def remember_previous_coordinates(sender, instance, **kwargs):
+    instance._previous_coordinates = None
+    if instance.pk is not None:
+        instance._previous_coordinates = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("coordinates", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Anemometer)
+@receiver(post_delete, sender=Anemometer)
+def empty_anemometer_tiles(sender, instance, **kwargs):
+    clear_tiles(
+        [instance.coordinates, getattr(instance, "_previous_coordinates", None)]
+    )
+
+
+@receiver(m2m_changed, sender=Anemometer.tags.through)
+def empty_cache_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        anemometer_ids = [instance.id]
+    else:
+        anemometer_ids = pk_set or instance.anemometers.values_list("id", flat=True)
+    mark_anemometers_modified(anemometer_ids)
+
+
+@receiver(readings_bulk_created, sender=WindSpeedReadings)
+def empty_cache_for_batch(sender, readings, **kwargs):
+    mark_anemometers_modified(reading.anemometer_id for reading in readings)
+
+
+@receiver(pre_save, sender=WindSpeedReadings)
+def remember_previous_values(sender, instance, **kwargs):
+    instance._previous_values = None
+    if instance.pk is not None:
+        instance._previous_values = (
+            sender.objects.filter(pk=instance.pk)
+            .values("anemometer_id", "date")
+            .first()
+        )
 
 
 @receiver(post_save, sender=WindSpeedReadings)
+def update_rollups(sender, instance, raw=False, **kwargs):
+    # Fixtures are loaded as is, their rollups are rebuilt by `rebuild_rollups`.
+    if raw:
+        return
+    previous = getattr(instance, "_previous_values", None)
+    if previous is None:
+        rollups.add_readings([instance])
+        return
+
+    if previous["anemometer_id"] == instance.anemometer_id:
+        rollups.refresh_buckets(
+            instance.anemometer_id, [previous["date"], instance.date]
+        )
+    else:
+        rollups.refresh_buckets(previous["anemometer_id"], [previous["date"]])
+        rollups.refresh_buckets(instance.anemometer_id, [instance.date])
+
+
 @receiver(post_delete, sender=WindSpeedReadings)
-def empty_cache(sender, instance, **kwargs):
-    clear_anemometer_cache(instance.anemometer_id)
+def remove_from_rollups(sender, instance, origin=None, **kwargs):
+    # The rollups of a deleted anemometer are removed by the cascade.
+    if is_anemometer_deletion(origin):
+        return
+    rollups.refresh_buckets(instance.anemometer_id, [instance.date])
+
+
+@receiver(readings_bulk_created, sender=WindSpeedReadings)
+def update_rollups_for_batch(sender, readings, **kwargs):
+    rollups.add_readings(readings)
+
+
+@receiver(post_save, sender=WindSpeedReadings)
+def update_latest_reading(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_values", None)
+    if previous is None:
+        record_readings([instance])
+    else:
+        refresh_latest([previous["anemometer_id"], instance.anemometer_id])
+
+
+@receiver(post_delete, sender=WindSpeedReadings)
+def remove_latest_reading(sender, instance, origin=None, **kwargs):
+    if is_anemometer_deletion(origin):
+        return
+    refresh_latest([instance.anemometer_id])
+
+
+@receiver(readings_bulk_created, sender=WindSpeedReadings)
+def update_latest_readings_for_batch(sender, readings, **kwargs):
+    record_readings(readings)
+
+
+@receiver(post_save, sender=WindSpeedReadings)
+def publish_reading(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and len(streams.broker):
+        transaction.on_commit(lambda: streams.broker.publish([instance]))
+
+
+@receiver(readings_bulk_created, sender=WindSpeedReadings)
+def publish_readings_for_batch(sender, readings, **kwargs):
+    if len(streams.broker):
+        transaction.on_commit(lambda: streams.broker.publish(readings))
@@ -0,0 +1,104 @@
+"""
+Process-local index of the anemometer locations.
+
+The anemometers are few and rarely move, so their coordinates are kept in
+NumPy arrays and radius lookups are answered with a vectorized haversine
+instead of a database round-trip. The index is built on first use and rebuilt
+once the `anemometer-locations` cache generation, bumped when an anemometer is
+saved or deleted, no longer matches the one it was built at.
+"""
+
+import threading
+from typing import Optional
+
+import numpy as np
+from django.contrib.gis.measure import D
+from django.db import transaction
+
+from core.cache import bump_generation, get_generation
+
+from .models import Anemometer
+
+LOCATIONS_NAMESPACE = "anemometer-locations"
+EARTH_RADIUS = 6371008.8  # mean radius, in metres
+
+
+def haversine(lons1, lats1, lons2, lats2) -> np.ndarray:
+    """
+    Great-circle distances in metres between points given in radians, with
+    NumPy broadcasting between the two sets of coordinates.
+    """
+    a = (
+        np.sin((lats2 - lats1) / 2) ** 2
+        + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class AnemometerIndex:
+    def __init__(self, ids: list[int], lons: list[float], lats: list[float]):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lons = np.radians(np.asarray(lons, dtype=np.float64))
+        self.lats = np.radians(np.asarray(lats, dtype=np.float64))
+
+    @classmethod
+    def build(cls) -> "AnemometerIndex":
+        ids, lons, lats = [], [], []
+        for anemometer_id, point in Anemometer.objects.values_list("id", "coordinates"):
+            ids.append(anemometer_id)
+            lons.append(point.x)
+            lats.append(point.y)
+        return cls(ids, lons, lats)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, longitude: float, latitude: float) -> np.ndarray:
+        """
+        Great-circle distances in metres from the point to every anemometer.
+        """
+        return haversine(
+            np.radians(longitude), np.radians(latitude), self.lons, self.lats
+        )
+
+    def within(self, longitude: float, latitude: float, radius: float) -> list[int]:
+        """
+        Ids of the anemometers within `radius` metres of the point.
+        """
+        distances = self.distances(longitude, latitude)
+        return self.ids[distances <= radius].tolist()
+
+
+_lock = threading.Lock()
+_index: Optional[AnemometerIndex] = None
+_index_generation = None
+
+
+def get_anemometer_index() -> AnemometerIndex:
+    global _index, _index_generation
+
+    generation = get_generation(LOCATIONS_NAMESPACE)
+    if _index is not None and _index_generation == generation:
+        return _index
+    with _lock:
+        if _index is None or _index_generation != generation:
+            _index, _index_generation = AnemometerIndex.build(), generation
+        return _index
+
+
+def anemometers_within(
+    longitude: float, latitude: float, radius_nm: float
+) -> list[int]:
+    """
+    Ids of the anemometers within `radius_nm` nautical miles of the point.
+    Every radius lookup goes through it, so that the endpoints agree on the
+    anemometers at the edge of a radius.
+    """
+    return get_anemometer_index().within(longitude, latitude, D(nm=radius_nm).m)
+
+
+def invalidate_anemometer_index():
+    # Bumped again once committed: a process rebuilding its index before the
+    # commit would otherwise keep the previous locations.
+    bump_generation(LOCATIONS_NAMESPACE)
+    transaction.on_commit(lambda: bump_generation(LOCATIONS_NAMESPACE))
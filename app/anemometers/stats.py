@@ -0,0 +1,76 @@
+"""
+Wind speed statistics of the readings taken around several centers at once.
+
+The anemometers within each radius are resolved from the location index, as
+for a single center, and sent as (center, anemometer) pairs aggregated per
+center, so a batch costs a single query whatever its size.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from django.db import connection
+
+from .models import WindSpeedReadings
+from .spatial import anemometers_within
+
+READINGS_TABLE = WindSpeedReadings._meta.db_table
+
+_STATS_WITHIN_RADIUS_SQL = f"""
+    SELECT stats.min_speed, stats.max_speed, stats.mean_speed
+    FROM generate_series(1, %(centers)s) AS centers(position)
+    CROSS JOIN LATERAL (
+        SELECT ROUND(MIN(r.speed)::numeric, 2)::float8 AS min_speed,
+               ROUND(MAX(r.speed)::numeric, 2)::float8 AS max_speed,
+               ROUND(AVG(r.speed)::numeric, 2)::float8 AS mean_speed
+        FROM unnest(%(positions)s::int[], %(anemometer_ids)s::bigint[])
+            AS pairs(position, anemometer_id)
+        JOIN {READINGS_TABLE} AS r ON r.anemometer_id = pairs.anemometer_id
+        WHERE pairs.position = centers.position{{window}}
+    ) AS stats
+    ORDER BY centers.position
+"""
+
+STATS_COLUMNS = ("min_speed", "max_speed", "mean_speed")
+
+
+def speed_stats_within_radius(
+    centers: list[dict],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> list[dict]:
+    """
+    Min, max and mean speeds of the readings within `radius` nautical miles
+    of each `lon`/`lat` center, in the order of the centers. The optional
+    window bounds the dates of the readings, `end` excluded.
+    """
+    if not centers:
+        return []
+
+    window = ""
+    if start is not None:
+        window += " AND r.date >= %(start)s"
+    if end is not None:
+        window += " AND r.date < %(end)s"
+
+    positions, anemometer_ids = [], []
+    for position, center in enumerate(centers, start=1):
+        within = anemometers_within(center["lon"], center["lat"], center["radius"])
+        positions.extend([position] * len(within))
+        anemometer_ids.extend(within)
+
+    params = {
+        "centers": len(centers),
+        "positions": positions,
+        "anemometer_ids": anemometer_ids,
+        "start": start,
+        "end": end,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_STATS_WITHIN_RADIUS_SQL.format(window=window), params)
+        rows = cursor.fetchall()
+
+    return [
+        {**center, **dict(zip(STATS_COLUMNS, row))}
+        for center, row in zip(centers, rows)
+    ]
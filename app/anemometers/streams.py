@@ -0,0 +1,135 @@
+"""
+In-process publication of the new readings to Server-Sent Events streams.
+
+Readings are published once committed, by the receivers of `signals.py`, and
+fanned out to the subscriptions whose anemometers they belong to. Each event
+is serialized once whatever the number of subscribers, and each subscription
+keeps a bounded buffer: a subscriber falling behind loses its oldest events
+rather than slowing the publishers down or growing without limit.
+
+Subscriptions are consumed from the event loop of the ASGI server; publishers
+may run in any thread.
+"""
+
+import asyncio
+import json
+import threading
+from typing import AsyncIterator, Iterable, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import WindSpeedReadings
+
+RETRY_MS = 3000
+
+
+class Subscription:
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        anemometer_ids: Optional[set[int]] = None,
+        buffer_size: int = 100,
+    ):
+        self.loop = loop
+        self.anemometer_ids = anemometer_ids
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def wants(self, anemometer_id: int) -> bool:
+        return self.anemometer_ids is None or anemometer_id in self.anemometer_ids
+
+    def offer(self, event: str):
+        """
+        Queues an event, dropping the oldest one when the buffer is full. Runs
+        in the loop of the subscription.
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class ReadingsBroker:
+    def __init__(self, buffer_size: int = 100):
+        self.buffer_size = buffer_size
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self, anemometer_ids: Optional[Iterable[int]] = None) -> Subscription:
+        """
+        Subscribes the running event loop to the readings of the anemometers,
+        or to every reading without ids.
+        """
+        subscription = Subscription(
+            asyncio.get_running_loop(),
+            anemometer_ids=set(anemometer_ids) if anemometer_ids is not None else None,
+            buffer_size=self.buffer_size,
+        )
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, readings: Iterable[WindSpeedReadings]):
+        if not self._subscriptions:
+            return
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+
+        for reading in readings:
+            event = format_event(reading)
+            for subscription in subscriptions:
+                if subscription.wants(reading.anemometer_id):
+                    try:
+                        subscription.loop.call_soon_threadsafe(
+                            subscription.offer, event
+                        )
+                    except RuntimeError:
+                        # The loop of the subscriber was closed.
+                        self.unsubscribe(subscription)
+
+
+def format_event(reading: WindSpeedReadings) -> str:
+    data = json.dumps(
+        {
+            "id": reading.id,
+            "anemometer_id": reading.anemometer_id,
+            "speed": reading.speed,
+            "date": reading.date,
+        },
+        cls=DjangoJSONEncoder,
+    )
+    return f"id: {reading.id}\nevent: reading\ndata: {data}\n\n"
+
+
+async def stream_events(
+    broker: ReadingsBroker,
+    anemometer_ids: Optional[Iterable[int]] = None,
+    keepalive: float = 15,
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events of the readings published after the subscription,
+    with a comment line sent every `keepalive` seconds of silence.
+    """
+    subscription = broker.subscribe(anemometer_ids)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield event
+    finally:
+        broker.unsubscribe(subscription)
+
+
+broker = ReadingsBroker(buffer_size=settings.READINGS_STREAM_BUFFER_SIZE)
@@ -1,16 +1,28 @@
+import gzip
+import json
+import struct
+import time
+from io import StringIO
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db import transaction
 from django.urls import reverse
 from freezegun import freeze_time
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from core.cache import anemometer_namespace, get_generation
 
-from ..models import Anemometer
+from ..models import Anemometer, WindSpeedReadings, WindSpeedRollup
 
 
 class AnemometerAPITestCase(APITestCase):
     def setUp(self):
         call_command("loaddata", "fixtures.json")
+        call_command("rebuild_rollups", stdout=StringIO())
+        cache.clear()
         self.user = User.objects.first()
         self.client.force_authenticate(user=self.user)
 
@@ -39,6 +51,8 @@ class AnemometerAPITestCase(APITestCase):
             "properties": {
                 "name": "New York - Empire State Building",
                 "tags": ["USA"],
+                "latest_reading_at": "2025-01-26T15:00:00Z",
+                "latest_speed": 72.4,
                 "last_day_mean_speed": 59.0,
                 "last_week_mean_speed": 57.77,
             },
@@ -65,7 +79,12 @@ class AnemometerAPITestCase(APITestCase):
             "id": 6,
             "type": "Feature",
             "geometry": {"type": "Point", "coordinates": [0.0, 0.0]},
-            "properties": {"name": "new", "tags": ["New"]},
+            "properties": {
+                "name": "new",
+                "tags": ["New"],
+                "latest_reading_at": None,
+                "latest_speed": None,
+            },
         }
 
     def test_update_anemometer(self):
@@ -112,3 +131,397 @@ class AnemometerAPITestCase(APITestCase):
             {"week": "2025-01-13T00:00:00Z", "mean_speed": 16.25},
             {"week": "2024-12-30T00:00:00Z", "mean_speed": 30.0},
         ]
+
+    def get_daily_mean_speeds(self, anemometer_id):
+        url = reverse("anemometers-get-daily-mean-speeds", kwargs={"pk": anemometer_id})
+        return self.client.get(path=url).json()["results"]
+
+    def test_daily_mean_speeds_follow_reading_writes(self):
+        url = reverse("readings-list")
+        data = {
+            "anemometer_to_link": "Paris - Eiffel Tower",
+            "speed": 80,
+            "date": "2025-01-22T20:00",
+        }
+        self.client.post(url, data=data)
+        assert self.get_daily_mean_speeds(5)[0] == {
+            "day": "2025-01-22T00:00:00Z",
+            "mean_speed": 62.4,
+        }
+
+        url = reverse("readings-detail", kwargs={"pk": 14})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, data={"date": "2025-01-18T10:00"}, format="json")
+            self.client.delete(reverse("readings-detail", kwargs={"pk": 13}))
+        assert self.get_daily_mean_speeds(5)[:2] == [
+            {"day": "2025-01-22T00:00:00Z", "mean_speed": 80.0},
+            {"day": "2025-01-18T00:00:00Z", "mean_speed": 21.7},
+        ]
+
+    def test_rebuild_rollups_command(self):
+        expected = self.get_daily_mean_speeds(5)
+        WindSpeedRollup.objects.all().delete()
+        WindSpeedReadings.objects.filter(id=13).update(speed=41.8)
+        cache.clear()
+
+        call_command("rebuild_rollups", chunk_size=2)
+
+        assert WindSpeedRollup.objects.filter(period="week").count() == 7
+        assert self.get_daily_mean_speeds(5)[1:] == expected[1:]
+        assert self.get_daily_mean_speeds(5)[0]["mean_speed"] == 41.8
+
+    def test_loading_fixtures_leaves_rollups_alone(self):
+        WindSpeedRollup.objects.all().delete()
+        call_command("loaddata", "fixtures.json")
+        assert not WindSpeedRollup.objects.exists()
+
+    def test_paginated_mean_speeds_cache_is_invalidated(self):
+        url = reverse("anemometers-get-daily-mean-speeds", kwargs={"pk": 5})
+        response = self.client.get(path=url, data={"page": 1})
+        assert response.json()["results"][0]["mean_speed"] == 53.6
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WindSpeedReadings.objects.get(id=13).delete()
+
+        response = self.client.get(path=url, data={"page": 1})
+        assert response.json()["results"][0]["mean_speed"] == 41.8
+
+    def test_retrieve_cache_is_invalidated_on_tags_change(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        self.client.get(url)
+        self.client.patch(path=url, data={"tags_to_link": ["New"]}, format="json")
+
+        response = self.client.get(url)
+        assert response.json()["properties"]["tags"] == ["New"]
+
+    def test_stale_mean_speeds_served_while_recomputed(self):
+        url = reverse("anemometers-get-daily-mean-speeds", kwargs={"pk": 5})
+        self.client.get(path=url)
+        with self.captureOnCommitCallbacks(execute=True):
+            WindSpeedReadings.objects.get(id=13).delete()
+
+        namespace = anemometer_namespace(5)
+        generation = get_generation(namespace)
+        lock_key = f"lock:response:{namespace}:{generation}:{url}|application/json"
+        cache.add(lock_key, 1)
+
+        response = self.client.get(path=url)
+        assert response.json()["results"][0]["mean_speed"] == 53.6
+
+        cache.delete(lock_key)
+        response = self.client.get(path=url)
+        assert response.json()["results"][0]["mean_speed"] == 41.8
+
+    def test_stale_mean_speeds_not_served_long_after_invalidation(self):
+        url = reverse("anemometers-get-daily-mean-speeds", kwargs={"pk": 5})
+        self.client.get(path=url)
+        with self.captureOnCommitCallbacks(execute=True):
+            WindSpeedReadings.objects.get(id=13).delete()
+
+        namespace = anemometer_namespace(5)
+        cache.set(f"invalidated:{namespace}", time.time() - 301)
+        generation = get_generation(namespace)
+        lock_key = f"lock:response:{namespace}:{generation}:{url}|application/json"
+        # The request waits for the lock to expire rather than serve the copy.
+        cache.add(lock_key, 1, timeout=1)
+
+        response = self.client.get(path=url)
+        assert response.json()["results"][0]["mean_speed"] == 41.8
+
+    def test_mean_speeds_served_gzip_encoded(self):
+        url = reverse("anemometers-get-daily-mean-speeds", kwargs={"pk": 5})
+        plain = self.client.get(path=url)
+
+        for _ in range(2):
+            response = self.client.get(path=url, HTTP_ACCEPT_ENCODING="gzip, br")
+            assert response.status_code == status.HTTP_200_OK
+            assert response["Content-Encoding"] == "gzip"
+            assert "Accept-Encoding" in response["Vary"]
+            assert json.loads(gzip.decompress(response.content)) == plain.json()
+
+        for accept_encoding in ("gzip;q=0, br", "*;q=0"):
+            response = self.client.get(path=url, HTTP_ACCEPT_ENCODING=accept_encoding)
+            assert "Content-Encoding" not in response
+            assert response.json() == plain.json()
+
+    def test_browsable_api_not_shared_between_users(self):
+        url = reverse("anemometers-get-daily-mean-speeds", kwargs={"pk": 5})
+        response = self.client.get(path=url, HTTP_ACCEPT="text/html")
+        assert response.status_code == status.HTTP_200_OK
+
+        other = User.objects.create_user("other-user", password="password")
+        self.client.force_authenticate(user=other)
+        response = self.client.get(path=url, HTTP_ACCEPT="text/html")
+        assert "other-user" in response.content.decode()
+
+        response = self.client.get(path=url)
+        assert {"Accept", "Accept-Encoding"} <= {
+            header.strip() for header in response["Vary"].split(",")
+        }
+
+    def test_conditional_retrieve_anemometer(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        response = self.client.get(url)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        WindSpeedReadings.objects.create(
+            anemometer_id=1, speed=10, date="2025-01-26T20:00Z"
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] != etag
+
+    def test_conditional_retrieve_anemometer_follows_the_clock(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        with freeze_time("2030-01-01 12:00:00") as frozen_time:
+            etag = self.client.get(url)["ETag"]
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+            # The rolling means moved, though no reading was written.
+            frozen_time.tick(600)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == status.HTTP_200_OK
+            assert response["ETag"] != etag
+
+    @freeze_time("2025-01-27 0:00:00")
+    def test_nearest_anemometers(self):
+        url = reverse("anemometers-nearest")
+        response = self.client.get(url, data={"lon": -74, "lat": 40.75, "k": 2})
+        assert response.status_code == status.HTTP_200_OK
+        nearest = response.json()
+        assert [round(anemometer.pop("distance"), 1) for anemometer in nearest] == [
+            0.7,
+            2.5,
+        ]
+        assert nearest == [
+            {
+                "id": 1,
+                "name": "New York - Empire State Building",
+                "latest_speed": 72.4,
+                "latest_date": "2025-01-26T15:00:00Z",
+                "last_day_mean_speed": 59.0,
+            },
+            {
+                "id": 2,
+                "name": "New York - Central Park",
+                "latest_speed": 78.9,
+                "latest_date": "2025-01-25T20:00:00Z",
+                "last_day_mean_speed": None,
+            },
+        ]
+
+    def test_nearest_anemometers_single_query(self):
+        url = reverse("anemometers-nearest")
+        for k in (1, 5):
+            with self.assertNumQueries(1):
+                response = self.client.get(url, data={"lon": 0, "lat": 0, "k": k})
+            assert len(response.json()) == k
+
+    def test_nearest_anemometers_follow_moves(self):
+        url = reverse("anemometers-nearest")
+        response = self.client.get(url, data={"lon": -74, "lat": 40.75, "k": 1})
+        assert response.json()[0]["id"] == 1
+
+        self.client.patch(
+            reverse("anemometers-detail", kwargs={"pk": 5}),
+            data={"coordinates": {"type": "Point", "coordinates": [-74, 40.75]}},
+            format="json",
+        )
+        response = self.client.get(url, data={"lon": -74, "lat": 40.75, "k": 1})
+        assert response.json()[0]["id"] == 5
+        assert response.json()[0]["distance"] == 0.0
+
+    def test_anemometer_tiles(self):
+        url = reverse("anemometers-tiles", kwargs={"z": 0, "x": 0, "y": 0})
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/vnd.mapbox-vector-tile"
+        assert b"Paris - Eiffel Tower" in response.content
+        assert b"France" in response.content
+
+        with self.assertNumQueries(0):
+            assert self.client.get(url).content == response.content
+
+        url = reverse("anemometers-tiles", kwargs={"z": 1, "x": 2, "y": 0})
+        assert self.client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    @freeze_time("2025-01-27 0:00:00")
+    def test_wind_field(self):
+        """
+        Only the Empire State Building anemometer has readings in the last
+        day, so the whole grid takes its mean speed.
+        """
+        url = reverse("anemometers-wind-field")
+        data = {
+            "min_lon": -75,
+            "min_lat": 40,
+            "max_lon": -73,
+            "max_lat": 41,
+            "width": 4,
+            "height": 3,
+            "output": "f32",
+        }
+        response = self.client.get(url, data=data)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["X-Grid-Width"] == "4"
+        grid = struct.unpack("<12f", response.content)
+        assert all(abs(speed - 59.0) < 0.001 for speed in grid)
+
+        with self.assertNumQueries(0):
+            self.client.get(url, data=data)
+
+        response = self.client.get(url, data={**data, "output": "png"})
+        assert response["Content-Type"] == "image/png"
+        assert response.content.startswith(b"\x89PNG")
+        assert struct.unpack(">II", response.content[16:24]) == (4, 3)
+
+        response = self.client.get(url, data={**data, "start": "2025-01-26T12:00"})
+        grid = struct.unpack("<12f", response.content)
+        assert all(abs(speed - 72.4) < 0.001 for speed in grid)
+
+    def test_wind_field_empty_bbox(self):
+        url = reverse("anemometers-wind-field")
+        response = self.client.get(
+            url, data={"min_lon": 1, "min_lat": 0, "max_lon": 0, "max_lat": 1}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @freeze_time("2025-01-27 0:00:00")
+    def test_anemometers_conditions(self):
+        url = reverse("anemometers-conditions")
+        response = self.client.get(url, data={"ids": "1,2"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [
+            {
+                "id": 2,
+                "name": "New York - Central Park",
+                "latest_speed": 78.9,
+                "latest_date": "2025-01-25T20:00:00Z",
+                "last_day_mean_speed": None,
+                "last_week_mean_speed": 63.13,
+            },
+            {
+                "id": 1,
+                "name": "New York - Empire State Building",
+                "latest_speed": 72.4,
+                "latest_date": "2025-01-26T15:00:00Z",
+                "last_day_mean_speed": 59.0,
+                "last_week_mean_speed": 57.77,
+            },
+        ]
+
+    def test_anemometers_conditions_single_query(self):
+        url = reverse("anemometers-conditions")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, data={"tag": "USA,France"})
+        assert [condition["id"] for condition in response.json()] == [2, 1, 3, 5, 4]
+
+    def test_latest_reading_follows_reading_writes(self):
+        def latest():
+            anemometer = Anemometer.objects.get(id=1)
+            return anemometer.latest_reading_at.isoformat(), anemometer.latest_speed
+
+        assert latest() == ("2025-01-26T15:00:00+00:00", 72.4)
+
+        # An older reading does not move the state backwards.
+        WindSpeedReadings.objects.create(
+            anemometer_id=1, speed=10, date="2025-01-20T00:00Z"
+        )
+        assert latest() == ("2025-01-26T15:00:00+00:00", 72.4)
+
+        reading = WindSpeedReadings.objects.create(
+            anemometer_id=1, speed=20, date="2025-01-27T00:00Z"
+        )
+        assert latest() == ("2025-01-27T00:00:00+00:00", 20.0)
+
+        reading.date = "2025-01-19T00:00Z"
+        reading.save()
+        assert latest() == ("2025-01-26T15:00:00+00:00", 72.4)
+
+        WindSpeedReadings.objects.get(id=2).delete()
+        assert latest() == ("2025-01-26T10:00:00+00:00", 45.6)
+
+        # Saving a stale copy of the anemometer keeps the current state.
+        anemometer = Anemometer.objects.get(id=1)
+        WindSpeedReadings.objects.create(
+            anemometer_id=1, speed=30, date="2025-01-28T00:00Z"
+        )
+        anemometer.name = "renamed"
+        anemometer.save()
+        assert latest() == ("2025-01-28T00:00:00+00:00", 30.0)
+
+    def test_latest_reading_follows_bulk_ingest(self):
+        url = reverse("readings-bulk")
+        data = [
+            {"anemometer_to_link": "Paris - Eiffel Tower", "speed": 5, "date": day}
+            for day in ("2025-02-02T00:00", "2025-02-03T00:00", "2025-02-01T00:00")
+        ]
+        self.client.post(url, data=data, format="json")
+        anemometer = Anemometer.objects.get(id=5)
+        assert anemometer.latest_reading_at.isoformat() == "2025-02-03T00:00:00+00:00"
+
+
+class TileInvalidationTestCase(APITransactionTestCase):
+    """
+    Goes through commits, after which the tiles of new readings are dropped.
+    """
+
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        cache.clear()
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def test_anemometer_tiles_invalidated_around_changes(self):
+        paris = reverse("anemometers-tiles", kwargs={"z": 2, "x": 2, "y": 1})
+        san_francisco = reverse("anemometers-tiles", kwargs={"z": 2, "x": 0, "y": 1})
+        self.client.get(paris)
+        self.client.get(san_francisco)
+
+        with transaction.atomic():
+            for hour in (20, 21):
+                WindSpeedReadings.objects.create(
+                    anemometer_id=5, speed=10, date=f"2025-01-26T{hour}:00Z"
+                )
+            with self.assertNumQueries(0):
+                self.client.get(paris)
+        with self.assertNumQueries(0):
+            self.client.get(san_francisco)
+        with self.assertNumQueries(1):
+            self.client.get(paris)
+
+        self.client.patch(
+            reverse("anemometers-detail", kwargs={"pk": 5}),
+            data={"coordinates": {"type": "Point", "coordinates": [-122, 37]}},
+            format="json",
+        )
+        assert b"Paris - Eiffel Tower" not in self.client.get(paris).content
+        assert b"Paris - Eiffel Tower" in self.client.get(san_francisco).content
+
+    def test_anemometer_tiles_invalidated_after_rollback(self):
+        paris = reverse("anemometers-tiles", kwargs={"z": 2, "x": 2, "y": 1})
+        self.client.get(paris)
+
+        try:
+            with transaction.atomic():
+                WindSpeedReadings.objects.create(
+                    anemometer_id=5, speed=10, date="2025-01-26T20:00Z"
+                )
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with self.assertNumQueries(0):
+            self.client.get(paris)
+
+        with transaction.atomic():
+            WindSpeedReadings.objects.create(
+                anemometer_id=5, speed=10, date="2025-01-26T21:00Z"
+            )
+        with self.assertNumQueries(1):
+            self.client.get(paris)
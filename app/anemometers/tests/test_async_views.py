@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+from io import StringIO
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import resolve, reverse
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from core.pagination import KeysetPagination
+
+from ..models import WindSpeedReadings
+from ..rollups import amean_speed_since, mean_speed_since
+
+
+class AsyncViewsTestCase(APITestCase):
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        call_command("rebuild_rollups", stdout=StringIO())
+        cache.clear()
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def test_read_views_are_coroutines(self):
+        for url in (
+            reverse("anemometers-detail", kwargs={"pk": 1}),
+            reverse("anemometers-get-readings", kwargs={"pk": 1}),
+            reverse("anemometers-get-daily-mean-speeds", kwargs={"pk": 1}),
+            reverse("readings-radius-stats"),
+        ):
+            assert iscoroutinefunction(resolve(url).func), url
+
+    def test_sync_actions_through_async_dispatch(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        response = self.client.patch(url, data={"name": "Renamed"}, format="json")
+        assert response.status_code == status.HTTP_200_OK
+
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["properties"]["name"] == "Renamed"
+
+    def test_retrieve_unknown_anemometer(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 999})
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_amean_speed_since(self):
+        since = datetime(2025, 1, 22, 12, tzinfo=timezone.utc)
+        for anemometer_id in (1, 5):
+            expected = await sync_to_async(mean_speed_since)(anemometer_id, since)
+            assert await amean_speed_since(anemometer_id, since) == expected
+
+    async def test_keyset_apaginate_queryset(self):
+        request = Request(APIRequestFactory().get(reverse("readings-list")))
+        queryset = WindSpeedReadings.objects.order_by("-date")
+
+        paginator = KeysetPagination()
+        rows = await paginator.apaginate_queryset(queryset, request)
+
+        assert paginator.count == await queryset.acount()
+        assert [row.id async for row in queryset[:10]] == [row.id for row in rows]
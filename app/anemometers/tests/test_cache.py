@@ -0,0 +1,160 @@
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from core.cache import _cache_keys, get_generation, reset_cache_stats
+
+from ..models import Anemometer
+
+RETRIEVE = "AnemometerViewSet.retrieve"
+CONDITIONS = "AnemometerViewSet.conditions"
+
+
+class CacheTestCase(APITestCase):
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        cache.clear()
+        caches["local"].clear()
+        reset_cache_stats()
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def get_stats(self):
+        response = self.client.get(reverse("cache-stats"))
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+
+    def test_hits_and_misses(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        for _ in range(3):
+            self.client.get(url)
+
+        assert self.get_stats()[RETRIEVE] == {"misses": 1, "hits": 2}
+
+    def test_evictions(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        self.client.get(url)
+
+        request = Request(APIRequestFactory().get(url))
+        request.accepted_media_type = "application/json"
+        namespace, keys = _cache_keys(request, {"pk": "1"}, "pk", rendered=True)
+        cache_key, _, _ = keys(get_generation(namespace))
+        assert cache.delete(cache_key)
+        self.client.get(url)
+
+        assert self.get_stats()[RETRIEVE] == {"misses": 2, "evictions": 1}
+
+    @override_settings(CACHE_LOCAL_TIMEOUT=60)
+    def test_local_tier(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        self.client.get(url)
+        cache.clear()
+        # The generation dropped from the shared cache restarts from the
+        # clock, so the local copy is no longer reachable.
+        self.client.get(url)
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+
+        assert self.get_stats()[RETRIEVE] == {
+            "misses": 2,
+            "hits": 1,
+            "local_hits": 1,
+        }
+
+    def test_readings_keep_unrelated_entries(self):
+        detail = reverse("anemometers-detail", kwargs={"pk": 1})
+        conditions = reverse("anemometers-conditions")
+        self.client.get(detail)
+        self.client.get(conditions)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("readings-bulk"),
+                data=[
+                    {
+                        "anemometer_to_link": "Paris - Eiffel Tower",
+                        "speed": 5,
+                        "date": "2025-01-26T23:00",
+                    }
+                ],
+                format="json",
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+        self.client.get(detail)
+        self.client.get(conditions)
+
+        stats = self.get_stats()
+        assert stats[RETRIEVE] == {"misses": 1, "hits": 1}
+        assert stats[CONDITIONS] == {"misses": 1, "hits": 1}
+
+        delay = timedelta(seconds=settings.CACHE_GLOBAL_READINGS_DELAY)
+        with freeze_time(delay):
+            response = self.client.get(conditions)
+        paris = next(row for row in response.json() if row["id"] == 5)
+        assert paris["latest_speed"] == 5
+        assert self.get_stats()[CONDITIONS] == {"misses": 2, "hits": 1}
+
+    @override_settings(CACHE_LOCAL_TIMEOUT=60)
+    def test_local_tier_invalidated_by_shared_generation(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        self.client.get(url)
+
+        anemometer = Anemometer.objects.get(pk=1)
+        anemometer.name = "Renamed"
+        anemometer.save()
+
+        response = self.client.get(url)
+        assert response.json()["properties"]["name"] == "Renamed"
+
+
+class SharedCacheTestCase(APITestCase):
+    """
+    Goes through the routes with a file-based cache standing in for Redis.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": directory.name,
+                },
+                "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            },
+            CACHE_LOCAL_TIMEOUT=60,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        call_command("loaddata", "fixtures.json")
+        reset_cache_stats()
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def test_invalidation_reaches_every_process(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        self.client.get(url)
+
+        # Another process only shares the file-based cache.
+        caches["local"].clear()
+        self.client.get(url)
+        assert self.get_retrieve_stats() == {"misses": 1, "hits": 1}
+
+        self.client.patch(url, data={"tags_to_link": ["New"]}, format="json")
+        response = self.client.get(url)
+        assert response.json()["properties"]["tags"] == ["New"]
+
+    def get_retrieve_stats(self):
+        return self.client.get(reverse("cache-stats")).json()[RETRIEVE]
@@ -0,0 +1,122 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from core.cache import reset_cache_stats
+from core.metrics import LATENCY_BUCKETS, Histogram, reset_metrics
+
+from ..serializers.model_serializers import WindReadingSerializer
+
+
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        cache.clear()
+        caches["local"].clear()
+        reset_cache_stats()
+        reset_metrics()
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def test_histogram(self):
+        histogram = Histogram(LATENCY_BUCKETS)
+        for value in (0.001, 0.005, 0.2, 60):
+            histogram.observe(value)
+
+        assert histogram.counts[0] == 2
+        assert histogram.counts[LATENCY_BUCKETS.index(0.25)] == 1
+        assert histogram.counts[-1] == 1
+        assert histogram.sum == 60.206
+
+    def test_server_timing(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        response = self.client.get(url)
+        server_timing = response["Server-Timing"]
+        assert server_timing.startswith("total;dur=")
+        assert "db;dur=" in server_timing
+        assert 'desc="7 queries"' in server_timing
+        assert "serializer;dur=" in server_timing
+        assert server_timing.endswith('cache;desc="misses"')
+
+        response = self.client.get(url)
+        assert 'desc="1 queries"' in response["Server-Timing"]
+        assert response["Server-Timing"].endswith('cache;desc="hits"')
+
+    def test_metrics(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        self.client.get(url)
+        self.client.get(url)
+
+        response = self.client.get(reverse("metrics"))
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"].startswith("text/plain")
+
+        lines = response.content.decode().splitlines()
+        labels = 'route="anemometers-detail",method="GET"'
+        assert "# TYPE http_request_duration_seconds histogram" in lines
+        assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+        assert f"http_request_duration_seconds_count{{{labels}}} 2" in lines
+        assert f"http_request_db_queries_total{{{labels}}} 8" in lines
+        assert (
+            'cache_response_total{view="AnemometerViewSet.retrieve",result="hits"} 1'
+            in lines
+        )
+
+    @override_settings(CACHE_LOCAL_TIMEOUT=60)
+    def test_metrics_cache_subsets(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        for _ in range(2):
+            self.client.get(url)
+
+        lines = self.client.get(reverse("metrics")).content.decode().splitlines()
+        view = 'view="AnemometerViewSet.retrieve"'
+        assert f'cache_response_total{{{view},result="misses"}} 1' in lines
+        assert f'cache_response_total{{{view},result="hits"}} 1' in lines
+        assert f"cache_local_hits_total{{{view}}} 1" in lines
+        assert not any('result="local_hits"' in line for line in lines)
+
+    def test_metrics_restricted_to_staff(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse("metrics"))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        user = User.objects.create_user("scraper", password="Test_password1")
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse("metrics"))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        self.client.force_authenticate(user=None)
+        with override_settings(METRICS_PUBLIC=True):
+            response = self.client.get(reverse("metrics"))
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_metrics_fold_unknown_methods(self):
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        for method in ("PURGE", "BREW"):
+            response = self.client.generic(method, url)
+            assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+        content = self.client.get(reverse("metrics")).content.decode()
+        labels = 'route="anemometers-detail",method="other"'
+        assert f"http_request_duration_seconds_count{{{labels}}} 2" in content
+        assert "PURGE" not in content and "BREW" not in content
+
+    def test_serializer_time(self):
+        def to_representation(serializer, instance):
+            time.sleep(0.002)
+            return {}
+
+        with mock.patch.object(
+            WindReadingSerializer, "to_representation", to_representation
+        ):
+            response = self.client.get(reverse("readings-list"))
+        assert response.status_code == status.HTTP_200_OK
+        server_timing = response["Server-Timing"].split("serializer;dur=")[1]
+        assert float(server_timing.split(",")[0]) >= 20
@@ -0,0 +1,51 @@
+from datetime import date
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from freezegun import freeze_time
+
+from ..models import Anemometer, WindSpeedReadings
+from ..partitions import create_monthly_partition, list_monthly_partitions
+
+
+class ReadingPartitionsTestCase(TestCase):
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+
+    def get_partitions(self):
+        with connection.cursor() as cursor:
+            return list_monthly_partitions(cursor)
+
+    @freeze_time("2030-01-15 0:00:00")
+    def test_create_partitions_ahead(self):
+        call_command("manage_reading_partitions", ahead=2)
+        partitions = self.get_partitions()
+        assert date(2030, 1, 1) in partitions
+        assert date(2030, 3, 1) in partitions
+
+    @freeze_time("2030-01-15 0:00:00")
+    def test_create_partition_moves_default_rows(self):
+        WindSpeedReadings.objects.create(
+            anemometer=Anemometer.objects.get(id=1), speed=10, date="2030-02-10T00:00Z"
+        )
+        call_command("manage_reading_partitions", ahead=1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {self.get_partitions()[date(2030, 2, 1)]}"
+            )
+            assert cursor.fetchone()[0] == 1
+        assert WindSpeedReadings.objects.filter(date__year=2030).count() == 1
+
+    @freeze_time("2030-01-15 0:00:00")
+    def test_detach_old_partitions(self):
+        with connection.cursor() as cursor:
+            create_monthly_partition(cursor, date(2025, 1, 1))
+        assert WindSpeedReadings.objects.filter(date__year=2025).count() == 20
+
+        call_command("manage_reading_partitions", ahead=0, retention_months=0)
+        partitions = self.get_partitions()
+        assert date(2030, 1, 1) in partitions
+        assert all(month >= date(2030, 1, 1) for month in partitions)
+        assert WindSpeedReadings.objects.filter(date__year=2025).count() == 0
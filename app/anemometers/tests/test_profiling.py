@@ -0,0 +1,124 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from core import profiling
+
+
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+        settings_override = override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=directory.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def get_radius_stats(self, **extra):
+        url = reverse("readings-radius-stats")
+        return self.client.get(
+            url, data={"lon": -74, "lat": 40, "radius": 100}, **extra
+        )
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        response = self.get_radius_stats()
+        assert response.status_code == status.HTTP_200_OK
+
+        name = response["X-Profile"]
+        assert (self.directory / f"{name}.prof").exists()
+        profiling.wait_for_reports()
+        report = (self.directory / f"{name}.sql").read_text()
+        assert "EXPLAIN ANALYZE" in report
+        assert "Execution Time" in report
+
+    def test_requested_by_staff(self):
+        staff = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(staff)
+
+        url = reverse("anemometers-get-weekly-mean-speeds", kwargs={"pk": 5})
+        response = self.client.get(url, HTTP_X_PROFILE="1")
+        assert response.status_code == status.HTTP_200_OK
+        assert "X-Profile" in response
+
+    def test_not_requested_by_other_users(self):
+        user = User.objects.create_user("user", password="password")
+        self.client.force_login(user)
+
+        response = self.get_radius_stats(HTTP_X_PROFILE="1")
+        assert response.status_code == status.HTTP_200_OK
+        assert "X-Profile" not in response
+        assert not list(self.directory.glob("*.prof"))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_PROFILES=2)
+    def test_rotation(self):
+        names = [self.get_radius_stats()["X-Profile"] for _ in range(3)]
+        profiling.wait_for_reports()
+
+        profiles = sorted(path.stem for path in self.directory.glob("*.prof"))
+        assert profiles == names[1:]
+        assert len(list(self.directory.glob("*.sql"))) == 2
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_summarize_profiles_command(self):
+        self.get_radius_stats()
+        self.client.get(reverse("anemometers-get-weekly-mean-speeds", kwargs={"pk": 5}))
+        profiling.wait_for_reports()
+
+        stdout = StringIO()
+        call_command("summarize_profiles", dir=str(self.directory), stdout=stdout)
+        output = stdout.getvalue()
+        assert output.startswith("2 profile(s)")
+        assert "SELECT" in output
+
+        stdout = StringIO()
+        call_command(
+            "summarize_profiles",
+            dir=str(self.directory),
+            route="mean-speeds",
+            stdout=stdout,
+        )
+        assert stdout.getvalue().startswith("1 profile(s)")
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_one_request_at_a_time(self):
+        with profiling.profiling_lock:
+            response = self.get_radius_stats()
+        assert response.status_code == status.HTTP_200_OK
+        assert "X-Profile" not in response
+
+        assert "X-Profile" in self.get_radius_stats()
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_credentials_not_profiled(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.post(
+            reverse("get-tokens"), {"username": "root", "password": "Test_password1"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert "X-Profile" not in response
+        assert not list(self.directory.glob("*"))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_private_directory(self):
+        directory = self.directory / "profiles"
+        with override_settings(PROFILING_DIR=str(directory)):
+            assert "X-Profile" in self.get_radius_stats()
+            profiling.wait_for_reports()
+        assert directory.stat().st_mode & 0o777 == 0o700
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from ..models import Anemometer, Tag, WindSpeedReadings
+
+PAGE_SIZES = (1, 5, 20)
+
+
+class QueryBudgetsTestCase(APITestCase):
+    """
+    Each endpoint runs a fixed number of queries, whatever the size of the
+    page it returns.
+    """
+
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        cache.clear()
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def add_anemometers(self, count):
+        tags = [Tag.objects.get_or_create(name=name)[0] for name in ("USA", "Coast")]
+        first = Anemometer.objects.filter(name__startswith="Budget").count()
+        for index in range(first, first + count):
+            anemometer = Anemometer.objects.create(
+                name=f"Budget {index}", coordinates=Point(-70 + index, 40, srid=4326)
+            )
+            anemometer.tags.set(tags)
+
+    def add_readings(self, anemometer, count):
+        start = datetime(2025, 2, 1, tzinfo=timezone.utc)
+        WindSpeedReadings.objects.bulk_create(
+            WindSpeedReadings(
+                anemometer=anemometer,
+                speed=10 + index,
+                date=start + timedelta(hours=index),
+            )
+            for index in range(count)
+        )
+
+    def assert_budget(self, url, budget):
+        cache.clear()
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_list_readings_budget(self):
+        # count, page
+        url = reverse("readings-list")
+        for page_size in PAGE_SIZES:
+            with self.subTest(page_size=page_size):
+                self.assert_budget(f"{url}?page_size={page_size}", 2)
+                response = self.client.get(f"{url}?page_size={page_size}")
+                assert len(response.json()["results"]) == page_size
+
+    def test_list_readings_filtered_by_tag_budget(self):
+        # tag lookup, count, page
+        url = reverse("readings-list")
+        for page_size in PAGE_SIZES:
+            with self.subTest(page_size=page_size):
+                self.assert_budget(f"{url}?tag=USA&tag=France&page_size={page_size}", 3)
+
+        response = self.client.get(f"{url}?tag=USA&tag=France&page_size=100")
+        ids = [reading["id"] for reading in response.json()["results"]]
+        assert len(ids) == len(set(ids)) == WindSpeedReadings.objects.count()
+
+    def test_list_anemometers_budget(self):
+        # count, page, tags
+        url = reverse("anemometers-list")
+        for added in (0, 5, 15):
+            with self.subTest(added=added):
+                self.add_anemometers(added)
+                self.assert_budget(url, 3)
+
+    def test_list_anemometers_filtered_by_tag_budget(self):
+        self.add_anemometers(5)
+        url = f"{reverse('anemometers-list')}?tag=USA&tag=Coast"
+        # tag lookup, count, page, tags
+        self.assert_budget(url, 4)
+
+        response = self.client.get(url)
+        tagged = Anemometer.objects.filter(tags__name__in=["USA", "Coast"]).distinct()
+        assert response.json()["count"] == tagged.count()
+
+    def test_retrieve_anemometer_budget(self):
+        # watermark, anemometer, tags, then day buckets and partial day twice
+        url = reverse("anemometers-detail", kwargs={"pk": 1})
+        self.assert_budget(url, 7)
+
+    def test_anemometer_readings_budget(self):
+        anemometer = Anemometer.objects.get(id=1)
+        self.add_readings(anemometer, 30)
+        url = reverse("anemometers-get-readings", kwargs={"pk": anemometer.pk})
+        # watermark, anemometer, count, page
+        for page_size in PAGE_SIZES:
+            with self.subTest(page_size=page_size):
+                self.assert_budget(f"{url}?page_size={page_size}", 4)
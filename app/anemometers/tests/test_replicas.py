@@ -0,0 +1,121 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework.views import APIView
+
+from core.cache import cache_response, conditional_response
+from core.middleware import ReplicaRoutingMiddleware
+from core.routers import use_replica
+
+from ..models import Anemometer
+
+COOKIE = "read_primary_until"
+
+
+def read_database(request):
+    return HttpResponse(router.db_for_read(Anemometer))
+
+
+class CachedReadDatabaseView(APIView):
+    authentication_classes = []
+    permission_classes = []
+    reads = None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        self.reads.append(router.db_for_read(Anemometer))
+        return timezone.now()
+
+    @conditional_response()
+    @cache_response(timeout=60)
+    def get(self, request, *args, **kwargs):
+        self.reads.append(router.db_for_read(Anemometer))
+        return Response()
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRoutingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(read_database)
+
+    def test_viewset_reads_from_replica(self):
+        for url in (reverse("anemometers-list"), reverse("readings-list")):
+            response = self.middleware(self.factory.get(url))
+            assert response.content == b"replica_1"
+
+    def test_other_views_read_from_primary(self):
+        response = self.middleware(self.factory.get(reverse("readings-stream")))
+        assert response.content == b"default"
+
+        response = self.middleware(self.factory.post(reverse("anemometers-list")))
+        assert response.content == b"default"
+
+    def test_cached_views_read_from_primary(self):
+        cache.clear()
+        reads = []
+        view = CachedReadDatabaseView.as_view(reads=reads)
+        with use_replica("replica_1"):
+            response = view(APIRequestFactory().get("/read-database"))
+            assert response.status_code == status.HTTP_200_OK
+            assert router.db_for_read(Anemometer) == "replica_1"
+        # Neither the watermark of the ETag nor the cached entry may lag.
+        assert reads == ["default", "default"]
+
+    def test_writes_stick_to_primary(self):
+        response = self.middleware(self.factory.post(reverse("anemometers-list")))
+        assert float(response.cookies[COOKIE].value) > time.time()
+
+        request = self.factory.get(reverse("anemometers-list"))
+        request.COOKIES[COOKIE] = response.cookies[COOKIE].value
+        assert self.middleware(request).content == b"default"
+
+        request.COOKIES[COOKIE] = str(time.time() - 1)
+        assert self.middleware(request).content == b"replica_1"
+
+    def test_router(self):
+        assert router.db_for_read(Anemometer) == "default"
+        assert router.db_for_write(Anemometer) == "default"
+        assert router.allow_migrate("default", "anemometers")
+        assert not router.allow_migrate("replica_1", "anemometers")
+
+
+@override_settings(DATABASE_REPLICAS=["default"])
+class ReplicaStandInTestCase(APITestCase):
+    """
+    Goes through the routes with the primary standing in for a replica.
+    """
+
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        cache.clear()
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def test_read_your_writes(self):
+        data = {
+            "name": "Sticky",
+            "coordinates": {"type": "Point", "coordinates": [1, 2]},
+        }
+        response = self.client.post(reverse("anemometers-list"), data, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert COOKIE in response.cookies
+
+        response = self.client.get(
+            reverse("anemometers-detail", kwargs={"pk": response.json()["id"]})
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_failed_write_does_not_stick(self):
+        response = self.client.post(reverse("anemometers-list"), {}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert COOKIE not in response.cookies
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..models import WindSpeedReadings
+from ..streams import ReadingsBroker, broker, stream_events
+from ..views import ReadingsStreamView
+
+
+def make_reading(id_, anemometer_id, speed=10.0):
+    return WindSpeedReadings(
+        id=id_,
+        anemometer_id=anemometer_id,
+        speed=speed,
+        date=datetime(2025, 2, 1, tzinfo=timezone.utc),
+    )
+
+
+class ReadingsBrokerTestCase(SimpleTestCase):
+    async def test_fan_out_to_matching_subscriptions(self):
+        broker = ReadingsBroker()
+        everything = broker.subscribe()
+        paris = broker.subscribe(anemometer_ids=[5])
+
+        broker.publish([make_reading(1, 1), make_reading(2, 5)])
+        await asyncio.sleep(0)
+
+        assert everything.queue.qsize() == 2
+        assert paris.queue.qsize() == 1
+        event = paris.queue.get_nowait()
+        assert event.startswith("id: 2\nevent: reading\n")
+        assert '"anemometer_id": 5' in event
+
+    async def test_slow_subscriber_drops_oldest_events(self):
+        broker = ReadingsBroker(buffer_size=2)
+        subscription = broker.subscribe()
+
+        broker.publish([make_reading(id_, 1) for id_ in (1, 2, 3)])
+        await asyncio.sleep(0)
+
+        assert subscription.dropped == 1
+        assert subscription.queue.get_nowait().startswith("id: 2\n")
+
+    async def test_stream_events(self):
+        broker = ReadingsBroker()
+        events = stream_events(broker, anemometer_ids=[1], keepalive=0.01)
+
+        assert (await anext(events)).startswith("retry:")
+        assert len(broker) == 1
+        assert await anext(events) == ": keep-alive\n\n"
+
+        broker.publish([make_reading(7, 2), make_reading(8, 1)])
+        assert (await anext(events)).startswith("id: 8\n")
+
+        await events.aclose()
+        assert len(broker) == 0
+
+
+class ReadingsStreamRouteTestCase(APITestCase):
+    def setUp(self):
+        call_command("loaddata", "fixtures.json")
+        self.user = User.objects.first()
+        self.client.force_authenticate(user=self.user)
+
+    def test_stream_filters_intersect(self):
+        view = ReadingsStreamView()
+        assert view.get_anemometer_ids() is None
+        assert view.get_anemometer_ids(tag=["USA"]) == {1, 2, 3, 4}
+        assert view.get_anemometer_ids(
+            anemometers=[1, 4, 5], tag=["USA"], lon=-74, lat=40, radius=100
+        ) == {1}
+
+    def test_stream_invalid_area(self):
+        response = self.client.get(
+            reverse("readings-stream"),
+            data={"lon": -74, "lat": 40},
+            HTTP_ACCEPT="text/event-stream",
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    async def test_stream_over_asgi(self):
+        response = await self.async_client.get(
+            reverse("readings-stream"),
+            data={"anemometers": "5"},
+            headers={
+                "Accept": "text/event-stream",
+                "Authorization": f"Bearer {AccessToken.for_user(self.user)}",
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "text/event-stream"
+
+        events = aiter(response.streaming_content)
+        assert (await anext(events)).startswith(b"retry:")
+        assert len(broker) == 1
+
+        broker.publish([make_reading(7, 1), make_reading(8, 5)])
+        assert (await anext(events)).startswith(b"id: 8\n")
+
+        await events.aclose()
+        assert len(broker) == 0
+
+    def test_stream_refused_over_wsgi(self):
+        response = self.client.get(
+            reverse("readings-stream"), HTTP_ACCEPT="text/event-stream"
+        )
+        assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+        assert response.content.startswith(b"event: error\n")
+        assert len(broker) == 0
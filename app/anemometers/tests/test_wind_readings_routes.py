@@ -1,17 +1,35 @@
+import json
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.gis.measure import D
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db import OperationalError
+from django.test import override_settings
 from django.urls import reverse
 from freezegun import freeze_time
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.cache import GLOBAL_NAMESPACE, anemometer_namespace, get_generation
 
-from ..models import Anemometer
+from .. import buffer, exports
+from ..ingest import insert_readings
+from ..models import Anemometer, WindSpeedReadings
+from ..spatial import get_anemometer_index
 from ..views import SpeedStatsWithinRadiusView
 
 
 class WindReadingsAPITestCase(APITestCase):
     def setUp(self):
         call_command("loaddata", "fixtures.json")
+        call_command("rebuild_rollups", stdout=StringIO())
+        cache.clear()
         self.user = User.objects.first()
         self.client.force_authenticate(user=self.user)
 
@@ -89,3 +107,411 @@ class WindReadingsAPITestCase(APITestCase):
             "max_speed": 78.9,
             "mean_speed": 58.23,
         }
+
+    def test_post_readings_within_radius_stats_batch_route(self):
+        url = reverse("readings-radius-stats-batch")
+        data = {
+            "centers": [
+                {"lon": -74, "lat": 40, "radius": 100},
+                {"lon": 2.29, "lat": 48.86, "radius": 10},
+                {"lon": 0, "lat": 0, "radius": 10},
+            ],
+            "start": "2025-01-22T00:00",
+            "end": "2025-01-23T00:00",
+        }
+        response = self.client.post(url, data=data, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()[1:] == [
+            {
+                "min_speed": 41.8,
+                "max_speed": 65.4,
+                "mean_speed": 53.6,
+                "lon": 2.29,
+                "lat": 48.86,
+                "radius": 10.0,
+            },
+            {
+                "min_speed": None,
+                "max_speed": None,
+                "mean_speed": None,
+                "lon": 0.0,
+                "lat": 0.0,
+                "radius": 10.0,
+            },
+        ]
+
+        del data["start"], data["end"]
+        response = self.client.post(url, data=data, format="json")
+        single = self.client.get(
+            reverse("readings-radius-stats"), data=data["centers"][0]
+        )
+        assert response.json()[0]["mean_speed"] == single.json()["mean_speed"]
+
+    def test_radius_stats_endpoints_agree_at_the_edge(self):
+        index = get_anemometer_index()
+        distance = index.distances(-74, 40)[index.ids.tolist().index(1)]
+        # Just past anemometer 1, which sphere and spheroid place differently.
+        center = {"lon": -74, "lat": 40, "radius": D(m=distance).nm * (1 + 1e-6)}
+
+        single = self.client.get(reverse("readings-radius-stats"), data=center)
+        batch = self.client.post(
+            reverse("readings-radius-stats-batch"),
+            data={"centers": [center]},
+            format="json",
+        )
+        assert single.json()["mean_speed"] is not None
+        assert batch.json()[0]["mean_speed"] == single.json()["mean_speed"]
+
+    def test_post_readings_within_radius_stats_batch_invalid(self):
+        url = reverse("readings-radius-stats-batch")
+        response = self.client.post(url, data={"centers": []}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_aggregate_readings_daily_from_rollups(self):
+        url = reverse("readings-aggregate")
+        response = self.client.get(
+            url, data={"tag": "France", "bucket": "1d", "stats": "mean,count"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            "bucket": "1d",
+            "stats": ["mean", "count"],
+            "series": [
+                {
+                    "anemometer": 5,
+                    "time": [
+                        "2025-01-03T00:00:00Z",
+                        "2025-01-04T00:00:00Z",
+                        "2025-01-15T00:00:00Z",
+                        "2025-01-18T00:00:00Z",
+                        "2025-01-22T00:00:00Z",
+                    ],
+                    "mean": [30.0, 30.0, 20.0, 15.0, 53.6],
+                    "count": [1, 1, 1, 3, 2],
+                }
+            ],
+        }
+
+    def test_aggregate_readings_from_raw_readings(self):
+        url = reverse("readings-aggregate")
+        response = self.client.get(
+            url,
+            data={
+                "anemometers": "5",
+                "bucket": "1h",
+                "stats": "count,max,p95",
+                "start": "2025-01-18T00:00",
+                "end": "2025-01-23T00:00",
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["series"] == [
+            {
+                "anemometer": 5,
+                "time": [
+                    "2025-01-18T12:00:00Z",
+                    "2025-01-18T18:00:00Z",
+                    "2025-01-22T08:00:00Z",
+                    "2025-01-22T12:00:00Z",
+                ],
+                "count": [1, 2, 1, 1],
+                "max": [25.0, 10.0, 65.4, 41.8],
+                "p95": [25.0, 10.0, 65.4, 41.8],
+            }
+        ]
+
+        response = self.client.get(
+            url, data={"anemometers": "5", "bucket": "1M", "stats": "min,max,count"}
+        )
+        assert response.json()["series"][0] == {
+            "anemometer": 5,
+            "time": ["2025-01-01T00:00:00Z"],
+            "min": [10.0],
+            "max": [65.4],
+            "count": [8],
+        }
+
+    def test_aggregate_readings_invalid_stat(self):
+        url = reverse("readings-aggregate")
+        response = self.client.get(url, data={"stats": "mean,median"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_post_bulk_readings(self):
+        url = reverse("readings-bulk")
+        data = [
+            {
+                "anemometer_to_link": "New York - Empire State Building",
+                "speed": 10.356,
+                "date": "2025-01-01T00:00",
+            },
+            {"anemometer_to_link": "Unknown", "speed": 12, "date": "2025-01-01T00:00"},
+            {
+                "anemometer_to_link": "New York - Central Park",
+                "speed": 301,
+                "date": "2025-01-01T00:00",
+            },
+            {
+                "anemometer_to_link": "New York - Central Park",
+                "speed": 20,
+                "date": "2025-01-01T01:00",
+            },
+        ]
+        response = self.client.post(url, data=data, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()["created"] == 2
+        assert [error["index"] for error in response.json()["errors"]] == [1, 2]
+        assert "anemometer_to_link" in response.json()["errors"][0]["errors"]
+        assert "speed" in response.json()["errors"][1]["errors"]
+        assert WindSpeedReadings.objects.count() == 22
+
+    def test_post_bulk_readings_ndjson(self):
+        url = reverse("readings-bulk")
+        body = (
+            '{"anemometer_to_link": "New York - Central Park", "speed": 20, '
+            '"date": "2025-01-01T00:00"}\n'
+            "\n"
+            '{"anemometer_to_link": "New York - Central Park", "speed": 30, '
+            '"date": "2025-01-01T01:00"}\n'
+        )
+        response = self.client.post(url, data=body, content_type="application/x-ndjson")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json() == {"created": 2, "errors": []}
+
+    def test_post_bulk_readings_all_invalid(self):
+        url = reverse("readings-bulk")
+        data = [
+            {"anemometer_to_link": "Unknown", "speed": 12, "date": "2025-01-01T00:00"}
+        ]
+        response = self.client.post(url, data=data, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["created"] == 0
+
+    def test_list_readings_cursor_pagination(self):
+        url = reverse("readings-list")
+        response = self.client.get(path=url, data={"page_size": 8, "count": "false"})
+        assert response.status_code == status.HTTP_200_OK
+        assert "count" not in response.json()
+        assert response.json()["previous"] is None
+
+        ids = [reading["id"] for reading in response.json()["results"]]
+        next_url = response.json()["next"]
+        while next_url:
+            response = self.client.get(next_url)
+            ids += [reading["id"] for reading in response.json()["results"]]
+            next_url = response.json()["next"]
+        assert len(ids) == len(set(ids)) == 20
+
+        previous_url = response.json()["previous"]
+        response = self.client.get(previous_url)
+        assert [reading["id"] for reading in response.json()["results"]] == ids[8:16]
+
+    def test_list_readings_cursor_keeps_microseconds(self):
+        for microsecond in (100, 200, 300):
+            WindSpeedReadings.objects.create(
+                anemometer_id=1,
+                speed=10,
+                date=f"2025-01-26T20:00:00.000{microsecond}+00:00",
+            )
+
+        url = reverse("readings-list")
+        for ordering in ("-date", "date"):
+            ids = []
+            next_url = f"{url}?page_size=1&count=false&ordering={ordering}"
+            while next_url:
+                response = self.client.get(next_url)
+                ids += [reading["id"] for reading in response.json()["results"]]
+                next_url = response.json()["next"]
+            assert len(ids) == len(set(ids)) == 23
+
+    def test_list_readings_invalid_cursor(self):
+        url = reverse("readings-list")
+        response = self.client.get(path=url, data={"cursor": "invalid"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_export_readings_csv(self):
+        url = reverse("readings-export")
+        response = self.client.get(
+            path=url, data={"anemometers": "1,2", "output": "csv"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "text/csv"
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert lines[0] == "id,anemometer,speed,date"
+        assert (
+            lines[1]
+            == "3,New York - Empire State Building,55.3,2025-01-25T18:00:00+00:00"
+        )
+        assert len(lines) == 7
+
+    def test_export_readings_ndjson(self):
+        url = reverse("readings-export")
+        response = self.client.get(
+            path=url,
+            data={"tag": "France", "start": "2025-01-15T00:00", "output": "ndjson"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        content = b"".join(response.streaming_content).decode()
+        rows = [json.loads(line) for line in content.splitlines()]
+        assert len(rows) == 6
+        assert {row["anemometer"] for row in rows} == {"Paris - Eiffel Tower"}
+
+    def test_export_readings_dates_match_between_formats(self):
+        WindSpeedReadings.objects.create(
+            anemometer_id=1, speed=10, date="2025-01-26T20:00:00.000123+00:00"
+        )
+        url = reverse("readings-export")
+        params = {"anemometers": "1", "start": "2025-01-26T19:00"}
+
+        response = self.client.get(path=url, data={**params, "output": "csv"})
+        csv_date = b"".join(response.streaming_content).decode().splitlines()[1]
+        response = self.client.get(path=url, data={**params, "output": "ndjson"})
+        row = json.loads(b"".join(response.streaming_content).decode())
+
+        assert csv_date.endswith(",2025-01-26T20:00:00.000123+00:00")
+        assert row["date"] == "2025-01-26T20:00:00.000123+00:00"
+
+    @override_settings(READINGS_EXPORT_CHUNK_SIZE=2)
+    async def test_export_readings_streamed_over_asgi(self):
+        exported = []
+
+        def get_export_rows(**params):
+            for row in exports.get_export_rows(**params):
+                exported.append(row)
+                yield row
+
+        with mock.patch("anemometers.views.get_export_rows", get_export_rows):
+            response = await self.async_client.get(
+                reverse("readings-export"),
+                data={"output": "ndjson"},
+                headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+            )
+            assert response.status_code == status.HTTP_200_OK
+
+            chunks = response.__aiter__()
+            first_chunk = await anext(chunks)
+            assert len(first_chunk.splitlines()) == 2
+            assert len(exported) < 20
+
+            rest = [chunk async for chunk in chunks]
+        assert len(b"".join([first_chunk, *rest]).splitlines()) == len(exported) == 20
+
+    @override_settings(READINGS_WRITE_BEHIND=True)
+    def test_write_behind_readings(self):
+        readings_buffer = buffer.ReadingsBuffer(max_rows=3, autostart=False)
+        with mock.patch.object(buffer, "_buffer", readings_buffer):
+            data = {
+                "anemometer_to_link": "Paris - Eiffel Tower",
+                "speed": 12.5,
+                "date": "2025-02-01T00:00",
+            }
+            response = self.client.post(reverse("readings-list"), data=data)
+            assert response.status_code == status.HTTP_202_ACCEPTED
+            assert response.json() == {"queued": 1, "errors": []}
+
+            response = self.client.post(
+                reverse("readings-bulk"),
+                data=[data, {**data, "speed": -1}, data],
+                format="json",
+            )
+            assert response.status_code == status.HTTP_202_ACCEPTED
+            assert response.json()["queued"] == 2
+            assert [error["index"] for error in response.json()["errors"]] == [1]
+
+            # The buffer is full: the batch is refused as a whole.
+            response = self.client.post(
+                reverse("readings-bulk"), data=[data], format="json"
+            )
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert response["Retry-After"] == "1"
+            assert WindSpeedReadings.objects.filter(anemometer_id=5).count() == 8
+
+            readings_buffer.flush()
+            assert WindSpeedReadings.objects.filter(anemometer_id=5).count() == 11
+
+            response = self.client.get(reverse("readings-buffer"))
+            stats = response.json()
+            assert stats["depth"] == 0
+            assert stats["enqueued"] == stats["flushed"] == 3
+            assert stats["rejected"] == 1
+            assert stats["flushes"] == 1
+
+    @override_settings(READINGS_WRITE_BEHIND=True)
+    def test_write_behind_invalid_reading(self):
+        readings_buffer = buffer.ReadingsBuffer(max_rows=3, autostart=False)
+        with mock.patch.object(buffer, "_buffer", readings_buffer):
+            data = {"anemometer_to_link": "Unknown", "speed": 1, "date": "2025-02-01"}
+            response = self.client.post(reverse("readings-list"), data=data)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert "anemometer_to_link" in response.json()
+
+    def test_write_behind_failed_flush_keeps_readings(self):
+        readings_buffer = buffer.ReadingsBuffer(autostart=False)
+        rows = [
+            {
+                "anemometer_id": 5,
+                "speed": speed,
+                "date": datetime(2025, 2, speed, tzinfo=timezone.utc),
+            }
+            for speed in range(1, 4)
+        ]
+        readings_buffer.put(rows)
+
+        with mock.patch.object(
+            buffer, "insert_readings", side_effect=OperationalError("gone away")
+        ):
+            assert not readings_buffer.flush()
+        assert WindSpeedReadings.objects.filter(anemometer_id=5).count() == 8
+        assert readings_buffer.stats()["depth"] == 3
+
+        assert readings_buffer.flush()
+        assert WindSpeedReadings.objects.filter(anemometer_id=5).count() == 11
+        stats = readings_buffer.stats()
+        assert stats["depth"] == 0
+        assert stats["retried"] == stats["flushed"] == 3
+        assert stats["failed"] == 0
+
+    def test_write_behind_flush_drops_only_invalid_readings(self):
+        readings_buffer = buffer.ReadingsBuffer(autostart=False)
+        rows = [
+            {
+                "anemometer_id": 5,
+                "speed": speed,
+                "date": datetime(2025, 2, day, tzinfo=timezone.utc),
+            }
+            for day, speed in enumerate([1, 2, None, 4, 5], start=1)
+        ]
+        readings_buffer.put(rows)
+
+        assert readings_buffer.flush()
+        speeds = WindSpeedReadings.objects.filter(
+            anemometer_id=5, date__month=2
+        ).values_list("speed", flat=True)
+        assert sorted(speeds) == [1, 2, 4, 5]
+        stats = readings_buffer.stats()
+        assert stats["flushed"] == 4
+        assert stats["failed"] == 1
+        assert stats["retried"] == 0
+
+    def test_insert_readings_invalidates_cache_on_commit(self):
+        namespaces = (anemometer_namespace(5), GLOBAL_NAMESPACE)
+        generations = [get_generation(namespace) for namespace in namespaces]
+        row = {
+            "anemometer_id": 5,
+            "speed": 12.5,
+            "date": datetime(2025, 2, 1, tzinfo=timezone.utc),
+        }
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            insert_readings([row])
+        # A request before the commit would cache the previous readings.
+        assert [get_generation(namespace) for namespace in namespaces] == generations
+
+        for callback in callbacks:
+            callback()
+        assert get_generation(namespaces[0]) > generations[0]
+        # The global namespace follows after the delay.
+        assert get_generation(namespaces[1]) == generations[1]
+        with freeze_time(timedelta(seconds=settings.CACHE_GLOBAL_READINGS_DELAY)):
+            assert get_generation(namespaces[1]) > generations[1]
@@ -0,0 +1,184 @@
+"""
+Mapbox vector tiles of the anemometers, encoded by PostGIS.
+
+Tiles are cached per tile key. A changed anemometer only drops the tiles of
+every zoom level whose buffered extent contains its location, at its previous
+location as well when it moved. The tiles around new readings are dropped
+once per transaction, after it commits.
+"""
+
+import math
+from contextvars import ContextVar
+from functools import partial
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Anemometer, Tag, WindSpeedRollup
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_CACHE_TIMEOUT = 3600
+TILE_LAYER = "anemometers"
+MAX_LATITUDE = 85.0511287798
+
+ANEMOMETERS_TABLE = Anemometer._meta.db_table
+ANEMOMETER_TAGS_TABLE = Anemometer.tags.through._meta.db_table
+TAGS_TABLE = Tag._meta.db_table
+ROLLUPS_TABLE = WindSpeedRollup._meta.db_table
+
+_TILE_SQL = f"""
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom,
+               ST_Transform(
+                   ST_Expand(
+                       ST_TileEnvelope(%(z)s, %(x)s, %(y)s),
+                       %(margin)s * 40075016.68557849 / 2 ^ %(z)s
+                   ),
+                   4326
+               ) AS search
+    ), features AS (
+        SELECT ST_AsMVTGeom(
+                   ST_Transform(a.coordinates::geometry, 3857),
+                   bounds.geom, %(extent)s, %(buffer)s, true
+               ) AS geom,
+               a.id,
+               a.name,
+               a.latest_speed,
+               (SELECT string_agg(t.name, ',' ORDER BY t.name)
+                FROM {ANEMOMETER_TAGS_TABLE} AS links
+                JOIN {TAGS_TABLE} AS t ON t.id = links.tag_id
+                WHERE links.anemometer_id = a.id) AS tags,
+               (SELECT ROUND((r.speed_sum / r.speed_count)::numeric, 2)::float8
+                FROM {ROLLUPS_TABLE} AS r
+                WHERE r.anemometer_id = a.id AND r.period = %(period)s
+                ORDER BY r.bucket DESC
+                LIMIT 1) AS mean_speed
+        FROM {ANEMOMETERS_TABLE} AS a, bounds
+        WHERE a.coordinates::geometry && bounds.search
+    )
+    SELECT ST_AsMVT(features, %(layer)s, %(extent)s, 'geom', 'id')
+    FROM features
+    WHERE geom IS NOT NULL
+"""
+
+
+def tile_cache_key(z: int, x: int, y: int) -> str:
+    return f"tile:{TILE_LAYER}:{z}/{x}/{y}"
+
+
+def render_tile(z: int, x: int, y: int) -> bytes:
+    """
+    Encodes the anemometers of a tile with their name, tags, latest speed and
+    latest daily mean speed as attributes.
+    """
+    params = {
+        "z": z,
+        "x": x,
+        "y": y,
+        "margin": TILE_BUFFER / TILE_EXTENT,
+        "extent": TILE_EXTENT,
+        "buffer": TILE_BUFFER,
+        "period": WindSpeedRollup.Period.DAY,
+        "layer": TILE_LAYER,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_TILE_SQL, params)
+        tile = cursor.fetchone()[0]
+    return bytes(tile or b"")
+
+
+def get_tile(z: int, x: int, y: int) -> bytes:
+    key = tile_cache_key(z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        tile = render_tile(z, x, y)
+        cache.set(key, tile, timeout=TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def tiles_covering(point: Point) -> Iterator[tuple[int, int, int]]:
+    """
+    (z, x, y) of the tiles of every zoom level whose buffered extent contains
+    the point.
+    """
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, point.y))
+    tile_x = (point.x + 180) / 360
+    tile_y = (1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2
+    margin = TILE_BUFFER / TILE_EXTENT
+
+    for z in range(settings.ANEMOMETER_TILES_MAX_ZOOM + 1):
+        size = 2**z
+        xs = range(
+            math.floor(tile_x * size - margin), math.floor(tile_x * size + margin) + 1
+        )
+        ys = range(
+            math.floor(tile_y * size - margin), math.floor(tile_y * size + margin) + 1
+        )
+        for x in {x % size for x in xs}:
+            for y in ys:
+                if 0 <= y < size:
+                    yield z, x, y
+
+
+def _tile_keys(points: Iterable[Point]) -> set[str]:
+    return {
+        tile_cache_key(*tile)
+        for point in points
+        if point is not None
+        for tile in tiles_covering(point)
+    }
+
+
+def clear_tiles(points: Iterable[Point]):
+    keys = _tile_keys(points)
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # A tile rendered by a concurrent request before the commit is dropped too.
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# Anemometers whose tiles the next commit drops, for the transactions of this
+# context.
+_pending_anemometer_ids: ContextVar[Optional[set[int]]] = ContextVar(
+    "pending_anemometer_ids", default=None
+)
+
+
+def _drop_pending_tiles(pending: set[int]):
+    if not pending:
+        return
+    anemometer_ids = set(pending)
+    pending.clear()
+    keys = _tile_keys(
+        Anemometer.objects.filter(id__in=anemometer_ids).values_list(
+            "coordinates", flat=True
+        )
+    )
+    if keys:
+        cache.delete_many(keys)
+
+
+def clear_anemometer_tiles(anemometer_ids: Iterable[int]):
+    """
+    Drops the tiles around the anemometers once the transaction commits.
+    Consecutive writes of a transaction share a single lookup of the locations
+    and a single deletion of their tiles: the first of their callbacks drops
+    the tiles of all of them, and the others find nothing pending. Each write
+    registers its callback, so that one in a savepoint rolled back, or in a
+    transaction rolled back, only delays the deletion to the next commit.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        _drop_pending_tiles(set(anemometer_ids))
+        return
+
+    pending = _pending_anemometer_ids.get()
+    if pending is None:
+        pending = set()
+        _pending_anemometer_ids.set(pending)
+    pending.update(anemometer_ids)
+    transaction.on_commit(partial(_drop_pending_tiles, pending))
@@ -1,16 +1,40 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .views import AnemometerViewSet, SpeedStatsWithinRadiusView, WindReadingViewSet
+from .views import (
+    AnemometerTileView,
+    AnemometerViewSet,
+    BatchSpeedStatsWithinRadiusView,
+    ReadingsStreamView,
+    SpeedStatsWithinRadiusView,
+    WindFieldView,
+    WindReadingViewSet,
+)
 
 router = DefaultRouter(trailing_slash=False)
 router.register(prefix="anemometers", viewset=AnemometerViewSet, basename="anemometers")
 router.register(prefix="readings", viewset=WindReadingViewSet, basename="readings")
 
 urlpatterns = [
+    path(
+        "anemometers/tiles/<int:z>/<int:x>/<int:y>.mvt",
+        AnemometerTileView.as_view(),
+        name="anemometers-tiles",
+    ),
+    path(
+        "anemometers/wind-field",
+        WindFieldView.as_view(),
+        name="anemometers-wind-field",
+    ),
     path(
         "readings/radius/stats",
         SpeedStatsWithinRadiusView.as_view(),
         name="readings-radius-stats",
     ),
+    path(
+        "readings/radius/stats/batch",
+        BatchSpeedStatsWithinRadiusView.as_view(),
+        name="readings-radius-stats-batch",
+    ),
+    path("readings/stream", ReadingsStreamView.as_view(), name="readings-stream"),
 ] + router.urls
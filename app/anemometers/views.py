@@ -1,33 +1,85 @@
+import asyncio
+from datetime import timedelta
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance, GeometryDistance
 from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import D
-from django.db.models import Avg, Max, Min, QuerySet
-from django.db.models.functions import Round, TruncDay, TruncWeek
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Avg, F, Max, Min, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Round
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import mixins, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.cache import cache_response
+from core.async_views import AsyncViewMixin
+from core.cache import cache_response, conditional_response
+from core.metrics import SerializerTimingMixin, serializer_data
+from core.pagination import KeysetPagination
 
+from .aggregates import AggregateTooLarge, aggregate_readings
+from .buffer import BufferFull, get_readings_buffer
+from .conditions import with_conditions
+from .exports import (
+    CONTENT_TYPES,
+    ExportUnavailable,
+    aiter_chunks,
+    get_export_rows,
+    stream_export,
+)
 from .filters import AnemometerFilterSet, WindReadingFilterSet
-from .models import Anemometer, WindSpeedReadings
+from .ingest import ingest_readings, validate_readings
+from .models import Anemometer, WindSpeedReadings, WindSpeedRollup
+from .parsers import NDJSONParser
+from .renderers import EventStreamRenderer
+from .rollups import amean_speed_since
 from .serializers.model_serializers import (
     AnemometerRetrieveSerializer,
     AnemometerSerializer,
     WindReadingSerializer,
 )
-from .serializers.query_serializers import SpeedStatsWithinRadiusQuerySerializer
+from .serializers.query_serializers import (
+    AnemometerConditionsQuerySerializer,
+    BatchSpeedStatsWithinRadiusQuerySerializer,
+    NearestAnemometersQuerySerializer,
+    ReadingsAggregateQuerySerializer,
+    ReadingsExportQuerySerializer,
+    ReadingsStreamQuerySerializer,
+    SpeedStatsWithinRadiusQuerySerializer,
+    WindFieldQuerySerializer,
+)
 from .serializers.response_serializers import (
+    AnemometerConditionsResponseSerializer,
+    BatchSpeedStatsWithinRadiusResponseSerializer,
+    BulkReadingsResponseSerializer,
     DailyMeanSpeedsResponseSerializer,
+    NearestAnemometerResponseSerializer,
+    QueuedReadingsResponseSerializer,
+    ReadingsAggregateResponseSerializer,
+    ReadingsBufferStatsResponseSerializer,
     SpeedStatsWithinRadiusResponseSerializer,
     WeeklyMeanSpeedsResponseSerializer,
 )
+from .spatial import anemometers_within
+from .stats import speed_stats_within_radius
+from .streams import broker, stream_events
+from .tiles import get_tile
+from .windfield import get_wind_field
 
 
 class AnemometerViewSet(
+    AsyncViewMixin,
+    SerializerTimingMixin,
     viewsets.GenericViewSet,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
@@ -37,71 +89,203 @@ class AnemometerViewSet(
 ):
     serializer_class = AnemometerSerializer
     queryset = Anemometer.objects.all().order_by("name")
+    read_from_replicas = True
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = AnemometerFilterSet
     ordering_fields = ["id", "name"]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.prefetch_related("tags")
+        return queryset
+
     def get_serializer_class(self):
         if self.action == "retrieve":
             return AnemometerRetrieveSerializer
         return AnemometerSerializer
 
-    @cache_response()
-    def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+    async def aget_last_modified(self, request, pk=None, *args, **kwargs):
+        try:
+            return (
+                await Anemometer.objects.filter(pk=pk)
+                .values_list("modified_at", flat=True)
+                .afirst()
+            )
+        except (TypeError, ValueError):
+            return None
+
+    # The rolling means move with the clock, their validators with the cache timeout.
+    @conditional_response(time_bucket=600)
+    @cache_response(timeout=600, stale_timeout=60, rendered=True)
+    async def retrieve(self, request, *args, **kwargs):
+        anemometer = await self.aget_object()
+
+        now = timezone.now()
+        anemometer.last_day_mean_speed, anemometer.last_week_mean_speed = (
+            await asyncio.gather(
+                amean_speed_since(anemometer.id, since=now - timedelta(days=1)),
+                amean_speed_since(anemometer.id, since=now - timedelta(weeks=1)),
+            )
+        )
+
+        serializer = self.get_serializer(anemometer)
+        return Response(serializer_data(serializer))
 
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        query_serializer=NearestAnemometersQuerySerializer,
+        responses={200: NearestAnemometerResponseSerializer(many=True)},
+    )
+    @action(detail=False, methods=["get"], url_path="nearest")
+    def nearest(self, request):
+        query_serializer = NearestAnemometersQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+
+        center = Point(
+            query_serializer.validated_data["lon"],
+            query_serializer.validated_data["lat"],
+            srid=4326,
+        )
+        last_day_mean_speed = (
+            WindSpeedReadings.objects.filter(
+                anemometer=OuterRef("pk"),
+                date__gte=timezone.now() - timedelta(days=1),
+            )
+            .values("anemometer")
+            .annotate(mean_speed=Round(Avg("speed"), 2))
+            .values("mean_speed")
+        )
+        # `<->` lets PostGIS walk the GiST index of the coordinates in
+        # distance order, so only the k closest rows are read.
+        anemometers = (
+            Anemometer.objects.annotate(
+                distance=Distance("coordinates", center),
+                last_day_mean_speed=Subquery(last_day_mean_speed),
+                latest_date=F("latest_reading_at"),
+            )
+            .order_by(GeometryDistance("coordinates", center))
+            .values(
+                "id",
+                "name",
+                "distance",
+                "latest_speed",
+                "latest_date",
+                "last_day_mean_speed",
+            )[: query_serializer.validated_data["k"]]
+        )
+        nearest = [
+            {**anemometer, "distance": round(anemometer["distance"].nm, 2)}
+            for anemometer in anemometers
+        ]
+
+        serializer = NearestAnemometerResponseSerializer(nearest, many=True)
+        return Response(data=serializer_data(serializer))
+
+    @swagger_auto_schema(
+        query_serializer=AnemometerConditionsQuerySerializer,
+        responses={200: AnemometerConditionsResponseSerializer(many=True)},
+    )
+    @action(detail=False, methods=["get"], url_path="conditions")
+    @cache_response(stale_timeout=60, rendered=True)
+    def conditions(self, request):
+        query_serializer = AnemometerConditionsQuerySerializer(
+            data=request.query_params
+        )
+        query_serializer.is_valid(raise_exception=True)
+
+        anemometers = Anemometer.objects.all()
+        if "ids" in query_serializer.validated_data:
+            anemometers = anemometers.filter(
+                id__in=query_serializer.validated_data["ids"]
+            )
+        if "tag" in query_serializer.validated_data:
+            # Filtered on a subquery: joining the tags would repeat the readings.
+            anemometers = anemometers.filter(
+                id__in=Anemometer.objects.filter(
+                    tags__name__in=query_serializer.validated_data["tag"]
+                ).values("id")
+            )
+        conditions = (
+            with_conditions(anemometers)
+            .values(
+                "id",
+                "name",
+                "latest_speed",
+                "latest_date",
+                "last_day_mean_speed",
+                "last_week_mean_speed",
+            )
+            .order_by("name")
+        )
+
+        serializer = AnemometerConditionsResponseSerializer(conditions, many=True)
+        return Response(data=serializer_data(serializer))
+
     @swagger_auto_schema(responses={200: WindReadingSerializer})
     @action(detail=True, methods=["get"], url_path="readings")
-    def get_readings(self, request, pk=None):
-        anemometer = self.get_object()
+    @conditional_response()
+    async def get_readings(self, request, pk=None):
+        anemometer = await self.aget_object()
         readings = anemometer.wind_readings.all().order_by("-date")
 
-        paginated_readings = self.paginate_queryset(readings)
+        paginator = KeysetPagination()
+        paginated_readings = await paginator.apaginate_queryset(
+            readings, request, view=self
+        )
         serializer = WindReadingSerializer(paginated_readings, many=True)
 
-        return self.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(serializer_data(serializer))
 
     @swagger_auto_schema(responses={200: DailyMeanSpeedsResponseSerializer})
     @action(detail=True, methods=["get"], url_path="mean/daily")
-    @cache_response()
-    def get_daily_mean_speeds(self, request, pk=None):
-        anemometer = self.get_object()
+    @conditional_response()
+    @cache_response(stale_timeout=300, rendered=True)
+    async def get_daily_mean_speeds(self, request, pk=None):
+        anemometer = await self.aget_object()
         mean_speeds = (
-            anemometer.wind_readings.annotate(day=TruncDay("date"))
-            .values("day")
-            .annotate(mean_speed=Round(Avg("speed"), 2))
+            anemometer.wind_rollups.filter(period=WindSpeedRollup.Period.DAY)
+            .annotate(
+                day=F("bucket"),
+                mean_speed=Round(F("speed_sum") / F("speed_count"), 2),
+            )
+            .values("day", "mean_speed")
             .order_by("-day")
         )
 
-        paginated_mean_speeds = self.paginate_queryset(mean_speeds)
+        paginated_mean_speeds = await self.apaginate_queryset(mean_speeds)
         serializer = DailyMeanSpeedsResponseSerializer(paginated_mean_speeds, many=True)
 
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(serializer_data(serializer))
 
     @swagger_auto_schema(responses={200: WeeklyMeanSpeedsResponseSerializer})
     @action(detail=True, methods=["get"], url_path="mean/weekly")
-    @cache_response()
-    def get_weekly_mean_speeds(self, request, pk=None):
-        anemometer = self.get_object()
+    @conditional_response()
+    @cache_response(stale_timeout=300, rendered=True)
+    async def get_weekly_mean_speeds(self, request, pk=None):
+        anemometer = await self.aget_object()
         mean_speeds = (
-            anemometer.wind_readings.annotate(week=TruncWeek("date"))
-            .values("week")
-            .annotate(mean_speed=Round(Avg("speed"), 2))
+            anemometer.wind_rollups.filter(period=WindSpeedRollup.Period.WEEK)
+            .annotate(
+                week=F("bucket"),
+                mean_speed=Round(F("speed_sum") / F("speed_count"), 2),
+            )
+            .values("week", "mean_speed")
             .order_by("-week")
         )
 
-        paginated_mean_speeds = self.paginate_queryset(mean_speeds)
+        paginated_mean_speeds = await self.apaginate_queryset(mean_speeds)
         serializer = WeeklyMeanSpeedsResponseSerializer(
             paginated_mean_speeds, many=True
         )
 
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(serializer_data(serializer))
 
 
 class WindReadingViewSet(
+    SerializerTimingMixin,
     viewsets.GenericViewSet,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
@@ -110,32 +294,152 @@ class WindReadingViewSet(
     mixins.DestroyModelMixin,
 ):
     serializer_class = WindReadingSerializer
-    queryset = WindSpeedReadings.objects.all().order_by("-date")
+    queryset = WindSpeedReadings.objects.select_related("anemometer").order_by("-date")
+    read_from_replicas = True
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = WindReadingFilterSet
     ordering_fields = ["date", "anemometer"]
 
+    def create(self, request, *args, **kwargs):
+        if not settings.READINGS_WRITE_BEHIND:
+            return super().create(request, *args, **kwargs)
+
+        rows, errors = validate_readings([request.data])
+        if errors:
+            raise ValidationError(errors[0]["errors"])
+        return self.enqueue_readings(rows, errors)
+
+    def enqueue_readings(self, rows, errors):
+        """
+        Queues validated rows in the write-behind buffer, answering 503 when
+        it is full so that clients retry later.
+        """
+        try:
+            get_readings_buffer().put(rows)
+        except BufferFull as exc:
+            return Response(
+                data={"detail": str(exc)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+
+        serializer = QueuedReadingsResponseSerializer(
+            {"queued": len(rows), "errors": errors}
+        )
+        response_status = (
+            status.HTTP_202_ACCEPTED if rows else status.HTTP_400_BAD_REQUEST
+        )
+        return Response(data=serializer_data(serializer), status=response_status)
 
-class SpeedStatsWithinRadiusView(APIView):
+    @swagger_auto_schema(
+        request_body=WindReadingSerializer(many=True),
+        responses={
+            201: BulkReadingsResponseSerializer,
+            202: QueuedReadingsResponseSerializer,
+        },
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk",
+        parser_classes=[JSONParser, NDJSONParser],
+    )
+    def bulk(self, request):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError("Expected a non-empty list of readings.")
+        if len(rows) > settings.READINGS_BULK_MAX_ROWS:
+            raise ValidationError(
+                f"A batch cannot contain more than {settings.READINGS_BULK_MAX_ROWS} readings."
+            )
+
+        if settings.READINGS_WRITE_BEHIND:
+            return self.enqueue_readings(*validate_readings(rows))
+
+        readings, errors = ingest_readings(rows)
+
+        serializer = BulkReadingsResponseSerializer(
+            {"created": len(readings), "errors": errors}
+        )
+        response_status = (
+            status.HTTP_201_CREATED if readings else status.HTTP_400_BAD_REQUEST
+        )
+        return Response(data=serializer_data(serializer), status=response_status)
+
+    @swagger_auto_schema(responses={200: ReadingsBufferStatsResponseSerializer})
+    @action(detail=False, methods=["get"], url_path="buffer")
+    def buffer(self, request):
+        serializer = ReadingsBufferStatsResponseSerializer(
+            get_readings_buffer().stats()
+        )
+        return Response(data=serializer_data(serializer))
+
+    @swagger_auto_schema(
+        query_serializer=ReadingsAggregateQuerySerializer,
+        responses={200: ReadingsAggregateResponseSerializer},
+    )
+    @action(detail=False, methods=["get"], url_path="aggregate")
+    @cache_response(stale_timeout=60, rendered=True)
+    def aggregate(self, request):
+        query_serializer = ReadingsAggregateQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        params = query_serializer.validated_data
+
+        try:
+            series = aggregate_readings(
+                **params, max_rows=settings.READINGS_AGGREGATE_MAX_BUCKETS
+            )
+        except AggregateTooLarge as exc:
+            raise ValidationError(str(exc))
+
+        serializer = ReadingsAggregateResponseSerializer(
+            {"bucket": params["bucket"], "stats": params["stats"], "series": series}
+        )
+        return Response(data=serializer_data(serializer))
+
+    @swagger_auto_schema(query_serializer=ReadingsExportQuerySerializer)
+    @action(detail=False, methods=["get"], url_path="export")
+    def export(self, request):
+        query_serializer = ReadingsExportQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        params = dict(query_serializer.validated_data)
+        output = params.pop("output")
+
+        chunk_size = settings.READINGS_EXPORT_CHUNK_SIZE
+        rows = get_export_rows(**params, chunk_size=chunk_size)
+        try:
+            content = stream_export(rows, output, chunk_size=chunk_size)
+        except ExportUnavailable as exc:
+            raise ValidationError({"output": [str(exc)]})
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_chunks(content)
+
+        response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[output])
+        response["Content-Disposition"] = f'attachment; filename="readings.{output}"'
+        return response
+
+
+class SpeedStatsWithinRadiusView(AsyncViewMixin, APIView):
     @swagger_auto_schema(
         query_serializer=SpeedStatsWithinRadiusQuerySerializer,
         responses={200: SpeedStatsWithinRadiusResponseSerializer},
     )
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         query_serializer = SpeedStatsWithinRadiusQuerySerializer(
             data=request.query_params
         )
         query_serializer.is_valid(raise_exception=True)
 
-        anemometers_qs = self.get_anemometers_within_radius_qs(
+        anemometer_ids = await sync_to_async(anemometers_within)(
             longitude=query_serializer.validated_data["lon"],
             latitude=query_serializer.validated_data["lat"],
-            radius=query_serializer.validated_data["radius"],
+            radius_nm=query_serializer.validated_data["radius"],
         )
 
-        readings = WindSpeedReadings.objects.filter(
-            anemometer__in=anemometers_qs
-        ).aggregate(
+        readings = await WindSpeedReadings.objects.filter(
+            anemometer_id__in=anemometer_ids
+        ).aaggregate(
             min_speed=Round(Min("speed"), 2),
             max_speed=Round(Max("speed"), 2),
             mean_speed=Round(Avg("speed"), 2),
@@ -144,13 +448,135 @@ class SpeedStatsWithinRadiusView(APIView):
         serializer = SpeedStatsWithinRadiusResponseSerializer(data=readings)
         serializer.is_valid()
 
-        return Response(data=serializer.data)
+        return Response(data=serializer_data(serializer))
 
     def get_anemometers_within_radius_qs(
         self, longitude: float, latitude: float, radius
     ) -> QuerySet:
-        center = Point(longitude, latitude, srid=4326)
-        anemometers_qs = Anemometer.objects.filter(
-            coordinates__dwithin=(center, D(nm=radius))
+        anemometer_ids = anemometers_within(longitude, latitude, radius)
+        return Anemometer.objects.filter(id__in=anemometer_ids)
+
+
+class BatchSpeedStatsWithinRadiusView(APIView):
+    @swagger_auto_schema(
+        request_body=BatchSpeedStatsWithinRadiusQuerySerializer,
+        responses={200: BatchSpeedStatsWithinRadiusResponseSerializer(many=True)},
+    )
+    def post(self, request, *args, **kwargs):
+        query_serializer = BatchSpeedStatsWithinRadiusQuerySerializer(data=request.data)
+        query_serializer.is_valid(raise_exception=True)
+
+        stats = speed_stats_within_radius(**query_serializer.validated_data)
+
+        serializer = BatchSpeedStatsWithinRadiusResponseSerializer(stats, many=True)
+        return Response(data=serializer_data(serializer))
+
+
+class AnemometerTileView(APIView):
+    @swagger_auto_schema(responses={200: "Mapbox vector tile of the anemometers"})
+    def get(self, request, z, x, y, *args, **kwargs):
+        if z > settings.ANEMOMETER_TILES_MAX_ZOOM or x >= 2**z or y >= 2**z:
+            raise NotFound("Tile out of range.")
+
+        return HttpResponse(
+            get_tile(z, x, y), content_type="application/vnd.mapbox-vector-tile"
+        )
+
+
+class WindFieldView(APIView):
+    @swagger_auto_schema(
+        query_serializer=WindFieldQuerySerializer,
+        responses={200: "Interpolated wind speed grid, northmost row first"},
+    )
+    def get(self, request, *args, **kwargs):
+        query_serializer = WindFieldQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        params = query_serializer.validated_data
+
+        content = get_wind_field(
+            bbox=(
+                params["min_lon"],
+                params["min_lat"],
+                params["max_lon"],
+                params["max_lat"],
+            ),
+            width=params["width"],
+            height=params["height"],
+            output=params["output"],
+            power=params["power"],
+            start=params.get("start"),
+            end=params.get("end"),
+        )
+        content_type = (
+            "image/png" if params["output"] == "png" else "application/octet-stream"
         )
-        return anemometers_qs
+        response = HttpResponse(content, content_type=content_type)
+        response["X-Grid-Width"] = params["width"]
+        response["X-Grid-Height"] = params["height"]
+        return response
+
+
+class ReadingsStreamView(APIView):
+    """
+    Server-Sent Events of the readings committed after the connection, for
+    the anemometers matching every given filter. Only served by the ASGI
+    application, where a stream does not hold a worker thread: a WSGI server
+    would buffer the endless stream in one of its workers, so the request is
+    refused there.
+    """
+
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    @swagger_auto_schema(
+        query_serializer=ReadingsStreamQuerySerializer,
+        responses={
+            200: "text/event-stream of `reading` events",
+            501: "The application is not served over ASGI",
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        query_serializer = ReadingsStreamQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        if not isinstance(request._request, ASGIRequest):
+            return Response(
+                data={"detail": "Readings streams are only served over ASGI."},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+
+        response = StreamingHttpResponse(
+            stream_events(
+                broker,
+                anemometer_ids=self.get_anemometer_ids(
+                    **query_serializer.validated_data
+                ),
+                keepalive=settings.READINGS_STREAM_KEEPALIVE,
+            ),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def get_anemometer_ids(
+        self, anemometers=None, tag=None, lon=None, lat=None, radius=None
+    ) -> Optional[set[int]]:
+        """
+        Ids of the followed anemometers, resolved once at subscription so that
+        publishing never queries the database. None follows every anemometer.
+        """
+        anemometer_ids = set(anemometers) if anemometers else None
+        if tag:
+            tagged = set(
+                Anemometer.objects.filter(tags__name__in=tag).values_list(
+                    "id", flat=True
+                )
+            )
+            anemometer_ids = (
+                tagged if anemometer_ids is None else anemometer_ids & tagged
+            )
+        if radius is not None:
+            around = set(anemometers_within(lon, lat, radius))
+            anemometer_ids = (
+                around if anemometer_ids is None else anemometer_ids & around
+            )
+        return anemometer_ids
@@ -0,0 +1,155 @@
+"""
+Wind speed field interpolated over a bounding box.
+
+The mean speed of every anemometer over the time window is read with a single
+grouped query, then spread over a regular grid by inverse distance weighting.
+Grids are cached per bounding box, resolution and window, the window bounds
+being floored to `WINDOW_BUCKET` seconds.
+"""
+
+import struct
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Avg
+from django.utils import timezone
+
+from .models import Anemometer
+from .spatial import haversine
+
+WINDOW_BUCKET = 300
+GRID_CACHE_TIMEOUT = 300
+# Grid cells processed at once, bounding the (cells, anemometers) distance matrix.
+CELLS_PER_CHUNK = 16384
+# 16-bit PNG pixels hold hundredths of knots, the highest value marks no data.
+PNG_SCALE = 100
+PNG_NO_DATA = 0xFFFF
+
+
+def floor_to_bucket(date: datetime) -> datetime:
+    timestamp = int(date.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % WINDOW_BUCKET, tz=date.tzinfo)
+
+
+def get_window(start=None, end=None) -> tuple[datetime, datetime]:
+    """
+    Bucketed (start, end) window, the last day by default.
+    """
+    end = floor_to_bucket(end or timezone.now())
+    start = floor_to_bucket(start) if start else end - timedelta(days=1)
+    return start, end
+
+
+def get_station_means(start: datetime, end: datetime):
+    """
+    (longitudes, latitudes, mean speeds) of the anemometers with readings in
+    the window.
+    """
+    stations = (
+        Anemometer.objects.filter(
+            wind_readings__date__gte=start, wind_readings__date__lt=end
+        )
+        .annotate(mean_speed=Avg("wind_readings__speed"))
+        .values_list("coordinates", "mean_speed")
+    )
+    lons, lats, speeds = [], [], []
+    for point, mean_speed in stations:
+        lons.append(point.x)
+        lats.append(point.y)
+        speeds.append(mean_speed)
+    return np.array(lons), np.array(lats), np.array(speeds)
+
+
+def interpolate(bbox, width, height, lons, lats, speeds, power=2.0) -> np.ndarray:
+    """
+    Inverse distance weighted speeds at the centers of a `height` x `width`
+    grid over `bbox` (min lon, min lat, max lon, max lat), northmost row
+    first. Cells are NaN when there is no station.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    grid = np.full(height * width, np.nan)
+    if not len(speeds):
+        return grid.reshape(height, width)
+
+    cell_lons = min_lon + (np.arange(width) + 0.5) * (max_lon - min_lon) / width
+    cell_lats = max_lat - (np.arange(height) + 0.5) * (max_lat - min_lat) / height
+    cell_lons, cell_lats = (
+        np.radians(axis).ravel() for axis in np.meshgrid(cell_lons, cell_lats)
+    )
+    station_lons, station_lats = np.radians(lons), np.radians(lats)
+
+    for start in range(0, len(grid), CELLS_PER_CHUNK):
+        cells = slice(start, start + CELLS_PER_CHUNK)
+        distances = haversine(
+            cell_lons[cells, np.newaxis],
+            cell_lats[cells, np.newaxis],
+            station_lons[np.newaxis, :],
+            station_lats[np.newaxis, :],
+        )
+        with np.errstate(divide="ignore"):
+            weights = distances**-power
+        # A cell on a station takes its speed.
+        on_station = np.isinf(weights)
+        weights[on_station.any(axis=1)] = on_station[on_station.any(axis=1)]
+        grid[cells] = weights @ speeds / weights.sum(axis=1)
+
+    return grid.reshape(height, width)
+
+
+def encode_png(grid: np.ndarray) -> bytes:
+    """
+    16-bit grayscale PNG of the grid, in hundredths of knots.
+    """
+    height, width = grid.shape
+    pixels = np.where(
+        np.isnan(grid),
+        PNG_NO_DATA,
+        np.clip(np.rint(grid * PNG_SCALE), 0, PNG_NO_DATA - 1),
+    ).astype(">u2")
+    rows = np.zeros((height, 1 + width * 2), dtype=np.uint8)
+    rows[:, 1:] = pixels.view(np.uint8).reshape(height, width * 2)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 16, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows.tobytes()))
+        + chunk(b"IEND", b"")
+    )
+
+
+def encode_grid(grid: np.ndarray, output: str) -> bytes:
+    if output == "png":
+        return encode_png(grid)
+    return grid.astype("<f4").tobytes()
+
+
+def get_wind_field(
+    bbox, width: int, height: int, output: str, power: float = 2.0, start=None, end=None
+) -> bytes:
+    start, end = get_window(start, end)
+    key = "wind-field:{}:{}x{}:{}:{}:{}:{}".format(
+        ",".join(map(str, bbox)),
+        width,
+        height,
+        power,
+        int(start.timestamp()),
+        int(end.timestamp()),
+        output,
+    )
+    content = cache.get(key)
+    if content is None:
+        grid = interpolate(bbox, width, height, *get_station_means(start, end), power)
+        content = encode_grid(grid, output)
+        cache.set(key, content, timeout=GRID_CACHE_TIMEOUT)
+    return content
@@ -1,35 +1,692 @@
+import asyncio
+import gzip
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
 from functools import wraps
+from urllib.parse import urlencode
 
-from django.core.cache import cache
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_header_parameters, quote_etag
 from rest_framework.response import Response
 
+from .metrics import record_cache
+from .routers import use_primary
+
+GLOBAL_NAMESPACE = "global"
+LOCK_POLL_INTERVAL = 0.05
+GZIP_MIN_LENGTH = 200
+LOCAL_CACHE_ALIAS = "local"
+
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+def anemometer_namespace(anemometer_id) -> str:
+    return f"anemometer:{anemometer_id}"
+
+
+def _generation_key(namespace: str) -> str:
+    return f"generation:{namespace}"
+
+
+def _invalidation_key(namespace: str) -> str:
+    return f"invalidated:{namespace}"
+
+
+def _pending_bump_key(namespace: str) -> str:
+    return f"pending-bump:{namespace}"
+
+
+def _bump_due(values: dict, namespace: str) -> bool:
+    bump_at = values.get(_pending_bump_key(namespace))
+    return bump_at is not None and bump_at <= time.time()
+
+
+def get_generation(namespace: str) -> int:
+    key = _generation_key(namespace)
+    pending_key = _pending_bump_key(namespace)
+    values = cache.get_many([key, pending_key])
+    # Only the request that removes a due bump applies it.
+    if _bump_due(values, namespace) and cache.delete(pending_key):
+        bump_generation(namespace)
+        values = cache.get_many([key])
+    generation = values.get(key)
+    if generation is None:
+        # Seeded from the clock so that a counter evicted from the cache never
+        # restarts at a generation whose entries could still be cached.
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(namespace: str) -> int:
+    key = _generation_key(namespace)
+    pending_key = _pending_bump_key(namespace)
+    values = await cache.aget_many([key, pending_key])
+    if _bump_due(values, namespace) and await cache.adelete(pending_key):
+        await abump_generation(namespace)
+        values = await cache.aget_many([key])
+    generation = values.get(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_generation(*namespaces: str):
+    """
+    Invalidates every cached response of the given namespaces at once.
+    """
+    for namespace in namespaces:
+        key = _generation_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, time.time_ns(), timeout=None):
+                cache.incr(key)
+        # Bounds how long the entries of the previous generation are served stale.
+        cache.set(_invalidation_key(namespace), time.time(), timeout=None)
+
+
+async def abump_generation(*namespaces: str):
+    for namespace in namespaces:
+        key = _generation_key(namespace)
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            if not await cache.aadd(key, time.time_ns(), timeout=None):
+                await cache.aincr(key)
+        await cache.aset(_invalidation_key(namespace), time.time(), timeout=None)
+
+
+def defer_generation_bump(namespace: str, delay: float):
+    """
+    Bumps the generation of a namespace within `delay` seconds, as the first
+    read of the generation after that. The bumps deferred meanwhile join it.
+    """
+    if delay <= 0:
+        bump_generation(namespace)
+    else:
+        cache.add(_pending_bump_key(namespace), time.time() + delay, timeout=None)
+
+
+def normalized_path(request) -> str:
+    """
+    Request path with its querystring sorted, so that equivalent URLs share
+    the same cache entry.
+    """
+    params = sorted(
+        (key, value) for key, values in request.query_params.lists() for value in values
+    )
+    if not params:
+        return request.path
+    return f"{request.path}?{urlencode(params)}"
+
+
+def _expires_early(entry: dict, early_expiration: float) -> bool:
+    """
+    Probabilistic early expiration: the closer an entry is to its expiry and
+    the longer it took to compute, the likelier a request recomputes it ahead
+    of time, which spreads the recomputations of popular entries.
+    """
+    if not early_expiration:
+        return False
+    jitter = -entry["compute_time"] * early_expiration * math.log(1 - random.random())
+    return time.time() + jitter >= entry["expires_at"]
+
+
+def _render_entry(view, request, response, *args, **kwargs) -> dict:
+    """
+    Renders a response with the renderer negotiated for the request and
+    keeps its bytes, along with a gzip-encoded variant of large bodies.
+    """
+    response = view.finalize_response(request, response, *args, **kwargs)
+    response.render()
+    entry = {"content_type": response["Content-Type"], "body": response.content}
+    if len(response.content) >= GZIP_MIN_LENGTH:
+        entry["gzip"] = gzip.compress(response.content)
+    return entry
+
+
+def _is_json(media_type: str) -> bool:
+    """
+    Whether a negotiated media type is JSON, whose rendering only depends on
+    the data. The browsable API embeds the user and its CSRF token.
+    """
+    mimetype, _ = parse_header_parameters(media_type)
+    return mimetype == "application/json" or mimetype.endswith("+json")
+
+
+def _accepts_gzip(request) -> bool:
+    """
+    Whether the `Accept-Encoding` of a request allows gzip, `gzip;q=0` and
+    `*;q=0` refusing it.
+    """
+    qualities = {}
+    for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, params = parse_header_parameters(coding)
+        if not name:
+            continue
+        try:
+            qualities[name] = float(params.get("q", 1))
+        except ValueError:
+            qualities[name] = 0.0
+    return qualities.get("gzip", qualities.get("*", 0)) > 0
+
+
+def _cached_response(entry: dict, request):
+    if "data" in entry:
+        return Response(entry["data"])
+
+    if "gzip" in entry and _accepts_gzip(request):
+        response = HttpResponse(entry["gzip"], content_type=entry["content_type"])
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(entry["body"], content_type=entry["content_type"])
+    patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+    return response
+
+
+def _count(view_name: str, *counters: str):
+    with _stats_lock:
+        _stats[view_name].update(counters)
+    record_cache(counters[0])
+
+
+def cache_stats() -> dict:
+    """
+    Counters of the views decorated with `cache_response` in this process:
+
+    - `hits`: served a fresh entry, `local_hits` of them from the local tier;
+    - `stale_hits`: served a stale entry while another request recomputed it;
+    - `misses`: computed the response, `early_expirations` of them ahead of
+      the expiry of the entry and `evictions` because the entry was dropped
+      by the cache before expiring.
+    """
+    with _stats_lock:
+        return {view_name: dict(counters) for view_name, counters in _stats.items()}
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _local_cache():
+    """
+    In-process tier of the responses, in front of the shared cache, or None
+    when `CACHE_LOCAL_TIMEOUT` disables it.
+
+    Response keys embed the generation of their namespace, which is read from
+    the shared cache, so a bump from any process invalidates the local copies
+    of every process.
+    """
+    if not settings.CACHE_LOCAL_TIMEOUT:
+        return None
+    return caches[LOCAL_CACHE_ALIAS]
+
+
+def _local_timeout(entry: dict) -> float:
+    return max(0, min(settings.CACHE_LOCAL_TIMEOUT, entry["expires_at"] - time.time()))
+
+
+def _get_entry(cache_key: str, *stale_keys: str):
+    """
+    Returns a response entry, whether it came from the local tier, and the
+    values of `stale_keys` read from the shared tier along with the entry, in
+    the same round trip.
+    """
+    local_cache = _local_cache()
+    if local_cache is not None:
+        entry = local_cache.get(cache_key)
+        if entry is not None:
+            return entry, True, {}
+
+    values = cache.get_many([cache_key, *stale_keys])
+    entry = values.pop(cache_key, None)
+    if entry is not None and local_cache is not None:
+        local_cache.set(cache_key, entry, timeout=_local_timeout(entry))
+    return entry, False, values
+
+
+async def _aget_entry(cache_key: str, *stale_keys: str):
+    local_cache = _local_cache()
+    if local_cache is not None:
+        entry = await local_cache.aget(cache_key)
+        if entry is not None:
+            return entry, True, {}
+
+    values = await cache.aget_many([cache_key, *stale_keys])
+    entry = values.pop(cache_key, None)
+    if entry is not None and local_cache is not None:
+        await local_cache.aset(cache_key, entry, timeout=_local_timeout(entry))
+    return entry, False, values
+
+
+def _set_entry(cache_key: str, entry: dict, timeout: int):
+    cache.set(cache_key, entry, timeout=timeout)
+    local_cache = _local_cache()
+    if local_cache is not None:
+        local_cache.set(cache_key, entry, timeout=_local_timeout(entry))
+
+
+async def _aset_entry(cache_key: str, entry: dict, timeout: int):
+    await cache.aset(cache_key, entry, timeout=timeout)
+    local_cache = _local_cache()
+    if local_cache is not None:
+        await local_cache.aset(cache_key, entry, timeout=_local_timeout(entry))
+
+
+def _was_evicted(stale_entry, generation: int) -> bool:
+    """
+    Whether the stale copy of a missing entry shows that the entry was
+    dropped before its expiry, rather than invalidated or expired.
+    """
+    return (
+        stale_entry is not None
+        and stale_entry.get("generation") == generation
+        and stale_entry["expires_at"] > time.time()
+    )
+
+
+def _is_fresh_enough(
+    stale_entry: dict, generation: int, invalidated_at, stale_timeout: int
+) -> bool:
+    """
+    Whether a stale copy may still be served: a copy of the current generation
+    up to `stale_timeout` seconds after it expired, and one of the previous
+    generation up to `stale_timeout` seconds after it was invalidated.
+    """
+    now = time.time()
+    if stale_entry.get("generation") == generation:
+        return now < stale_entry["expires_at"] + stale_timeout
+    return (
+        stale_entry.get("generation") == generation - 1
+        and invalidated_at is not None
+        and now < invalidated_at + stale_timeout
+    )
+
+
+def _stale_keys(namespace: str, stale_key: str, stale_timeout: int) -> tuple:
+    """
+    Keys read along with an entry to serve or judge its stale copy on a miss.
+    """
+    return (stale_key, _invalidation_key(namespace)) if stale_timeout else ()
+
+
+def _stale_entry(
+    stale_values: dict, namespace: str, stale_key: str, generation: int, stale_timeout
+):
+    stale_entry = stale_values.get(stale_key)
+    invalidated_at = stale_values.get(_invalidation_key(namespace))
+    if stale_entry is not None and _is_fresh_enough(
+        stale_entry, generation, invalidated_at, stale_timeout
+    ):
+        return stale_entry
+    return None
+
+
+def _wait_for_entry(cache_key: str, lock_key: str, lock_timeout: int):
+    """
+    Waits for the request holding the lock to store its entry. Returns None
+    if the lock is released or expires without an entry being stored.
+    """
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            return None
+    return None
+
+
+async def _await_entry(cache_key: str, lock_key: str, lock_timeout: int):
+    """
+    Async variant of `_wait_for_entry`, which yields to the event loop between
+    polls instead of blocking a thread.
+    """
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await cache.aget(cache_key)
+        if entry is not None:
+            return entry
+        if await cache.aget(lock_key) is None:
+            return None
+    return None
+
+
+def _cache_keys(request, kwargs, anemometer_url_kwarg: str, rendered: bool):
+    """
+    Returns the namespace of a response and the key builder of its entries
+    for a given namespace generation.
+    """
+    if anemometer_url_kwarg in kwargs:
+        namespace = anemometer_namespace(kwargs[anemometer_url_kwarg])
+    else:
+        namespace = GLOBAL_NAMESPACE
+    path = normalized_path(request)
+    if rendered:
+        path = f"{path}|{request.accepted_media_type}"
+
+    def keys(generation: int):
+        cache_key = f"response:{namespace}:{generation}:{path}"
+        return cache_key, f"stale-response:{namespace}:{path}", f"lock:{cache_key}"
+
+    return namespace, keys
+
+
+def _new_entry(
+    view,
+    request,
+    response,
+    rendered: bool,
+    timeout: int,
+    started_at: float,
+    *args,
+    **kwargs,
+) -> dict:
+    if rendered:
+        entry = _render_entry(view, request, response, *args, **kwargs)
+    else:
+        entry = {"data": response.data}
+    entry["expires_at"] = time.time() + timeout
+    entry["compute_time"] = time.monotonic() - started_at
+    return entry
+
+
+def cache_response(
+    timeout: int = 600,
+    anemometer_url_kwarg: str = "pk",
+    stale_timeout: int = 0,
+    lock_timeout: int = 10,
+    early_expiration: float = 1.0,
+    rendered: bool = False,
+):
+    """
+    Caches the data of successful responses.
+
+    Views routed with an anemometer id are cached in the namespace of that
+    anemometer, the others in the global namespace. The namespace generation
+    is part of the cache key, so bumping it drops every paginated or filtered
+    variant of the cached URLs. New readings bump the global generation up to
+    `CACHE_GLOBAL_READINGS_DELAY` seconds late, see `clear_anemometers_cache`.
+
+    A single request recomputes a missing entry while holding a lock of
+    `lock_timeout` seconds; concurrent requests wait for it, or are served the
+    previous entry for up to `stale_timeout` seconds after it expired or was
+    invalidated, as told by the time of the last generation bump.
+    `early_expiration` scales the probabilistic early recomputation of entries
+    about to expire, 0 disables it. The previous entry is read along with the
+    current one, so a miss costs no extra round trip.
+
+    With `rendered`, the final bytes of JSON responses are cached per
+    negotiated media type, along with a gzip variant, and hits bypass the DRF
+    rendering. Other media types, such as the browsable API, are not cached.
+
+    With `CACHE_LOCAL_TIMEOUT`, entries are also kept for that many seconds
+    in the memory of the process. Hits, misses and evictions are counted per
+    view, see `cache_stats`.
+
+    Entries are shared by every request, so misses are computed from the
+    primary even in requests reading from a replica, which may lag.
+
+    Coroutine views are cached through the async cache API.
+    """
+
+    def decorator(func):
+        view_name = func.__qualname__
+
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            if rendered and not _is_json(request.accepted_media_type):
+                return func(self, request, *args, **kwargs)
+
+            namespace, keys = _cache_keys(
+                request, kwargs, anemometer_url_kwarg, rendered
+            )
+            generation = get_generation(namespace)
+            cache_key, stale_key, lock_key = keys(generation)
+
+            entry, local, stale_values = _get_entry(
+                cache_key, *_stale_keys(namespace, stale_key, stale_timeout)
+            )
+            if entry is not None and not _expires_early(entry, early_expiration):
+                _count(view_name, "hits", *(("local_hits",) if local else ()))
+                return _cached_response(entry, request)
+
+            locked = cache.add(lock_key, 1, timeout=lock_timeout)
+            if not locked:
+                counter = "hits"
+                if entry is None and stale_timeout:
+                    entry = _stale_entry(
+                        stale_values, namespace, stale_key, generation, stale_timeout
+                    )
+                    if entry is not None:
+                        counter = "stale_hits"
+                if entry is None:
+                    entry = _wait_for_entry(cache_key, lock_key, lock_timeout)
+                if entry is not None:
+                    _count(view_name, counter)
+                    return _cached_response(entry, request)
+
+            if entry is not None:
+                _count(view_name, "misses", "early_expirations")
+            elif _was_evicted(stale_values.get(stale_key), generation):
+                _count(view_name, "misses", "evictions")
+            else:
+                _count(view_name, "misses")
+
+            try:
+                started_at = time.monotonic()
+                with use_primary():
+                    response = func(self, request, *args, **kwargs)
+
+                if response.status_code != 200:
+                    return response
+
+                entry = _new_entry(
+                    self,
+                    request,
+                    response,
+                    rendered,
+                    timeout,
+                    started_at,
+                    *args,
+                    **kwargs,
+                )
+                entry["generation"] = generation
+                _set_entry(cache_key, entry, timeout)
+                if stale_timeout:
+                    cache.set(stale_key, entry, timeout=timeout + stale_timeout)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+
+            return _cached_response(entry, request) if rendered else response
+
+        @wraps(func)
+        async def async_wrapper(self, request, *args, **kwargs):
+            if rendered and not _is_json(request.accepted_media_type):
+                return await func(self, request, *args, **kwargs)
+
+            namespace, keys = _cache_keys(
+                request, kwargs, anemometer_url_kwarg, rendered
+            )
+            generation = await aget_generation(namespace)
+            cache_key, stale_key, lock_key = keys(generation)
+
+            entry, local, stale_values = await _aget_entry(
+                cache_key, *_stale_keys(namespace, stale_key, stale_timeout)
+            )
+            if entry is not None and not _expires_early(entry, early_expiration):
+                _count(view_name, "hits", *(("local_hits",) if local else ()))
+                return _cached_response(entry, request)
+
+            locked = await cache.aadd(lock_key, 1, timeout=lock_timeout)
+            if not locked:
+                counter = "hits"
+                if entry is None and stale_timeout:
+                    entry = _stale_entry(
+                        stale_values, namespace, stale_key, generation, stale_timeout
+                    )
+                    if entry is not None:
+                        counter = "stale_hits"
+                if entry is None:
+                    entry = await _await_entry(cache_key, lock_key, lock_timeout)
+                if entry is not None:
+                    _count(view_name, counter)
+                    return _cached_response(entry, request)
+
+            if entry is not None:
+                _count(view_name, "misses", "early_expirations")
+            elif _was_evicted(stale_values.get(stale_key), generation):
+                _count(view_name, "misses", "evictions")
+            else:
+                _count(view_name, "misses")
+
+            try:
+                started_at = time.monotonic()
+                with use_primary():
+                    response = await func(self, request, *args, **kwargs)
+
+                if response.status_code != 200:
+                    return response
+
+                entry = _new_entry(
+                    self,
+                    request,
+                    response,
+                    rendered,
+                    timeout,
+                    started_at,
+                    *args,
+                    **kwargs,
+                )
+                entry["generation"] = generation
+                await _aset_entry(cache_key, entry, timeout)
+                if stale_timeout:
+                    await cache.aset(stale_key, entry, timeout=timeout + stale_timeout)
+            finally:
+                if locked:
+                    await cache.adelete(lock_key)
+
+            return _cached_response(entry, request) if rendered else response
+
+        return async_wrapper if iscoroutinefunction(func) else wrapper
+
+    return decorator
+
+
+def _validators(request, last_modified, time_bucket: int) -> tuple[str, int]:
+    """
+    Returns the ETag and Last-Modified timestamp of a response from its
+    last-modified watermark, moved forward to the start of the current
+    `time_bucket` seconds, if any.
+    """
+    if time_bucket:
+        bucket_start = time.time() // time_bucket * time_bucket
+        last_modified = max(
+            last_modified, datetime.fromtimestamp(bucket_start, tz=timezone.utc)
+        )
+    validator = "|".join(
+        (
+            last_modified.isoformat(),
+            normalized_path(request),
+            request.accepted_media_type,
+        )
+    )
+    etag = quote_etag(hashlib.md5(validator.encode()).hexdigest())
+    return etag, int(last_modified.timestamp())
+
+
+def _set_validators(response, etag: str, timestamp: int):
+    if response.status_code in (200, 304):
+        response.headers.setdefault("ETag", etag)
+        response.headers.setdefault("Last-Modified", http_date(timestamp))
+
+
+def conditional_response(time_bucket: int = 0):
+    """
+    Answers conditional GETs from the last-modified watermark returned by the
+    view's `get_last_modified(request, *args, **kwargs)`, before the view runs.
+
+    The ETag is derived from the watermark, the normalized URL and the
+    negotiated media type. Views without a watermark run unconditionally.
+
+    Views whose payload changes with the clock, such as rolling means, pass a
+    `time_bucket` in seconds: the validators then also change at the start of
+    every bucket, even when nothing is written.
+
+    The watermark and the view are read from the primary, even in requests
+    reading from a replica: an ETag computed from a lagging watermark would
+    validate stale copies.
+
+    Coroutine views read their watermark from the coroutine
+    `aget_last_modified(request, *args, **kwargs)` instead.
+    """
 
-def cache_response(timeout: int = 600):
     def decorator(func):
         @wraps(func)
         def wrapper(self, request, *args, **kwargs):
-            cache_key = f"{request.get_full_path()}"
-            cached_data = cache.get(cache_key)
+            with use_primary():
+                last_modified = self.get_last_modified(request, *args, **kwargs)
+                if last_modified is None:
+                    return func(self, request, *args, **kwargs)
 
-            if cached_data:
-                return Response(cached_data)
+                etag, timestamp = _validators(request, last_modified, time_bucket)
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=timestamp
+                )
+                if response is None:
+                    response = func(self, request, *args, **kwargs)
 
-            response = func(self, request, *args, **kwargs)
+            _set_validators(response, etag, timestamp)
+            return response
 
-            cache.set(cache_key, response.data, timeout=timeout)
+        @wraps(func)
+        async def async_wrapper(self, request, *args, **kwargs):
+            with use_primary():
+                last_modified = await self.aget_last_modified(request, *args, **kwargs)
+                if last_modified is None:
+                    return await func(self, request, *args, **kwargs)
 
+                etag, timestamp = _validators(request, last_modified, time_bucket)
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=timestamp
+                )
+                if response is None:
+                    response = await func(self, request, *args, **kwargs)
+
+            _set_validators(response, etag, timestamp)
             return response
 
-        return wrapper
+        return async_wrapper if iscoroutinefunction(func) else wrapper
 
     return decorator
 
 
 def clear_anemometer_cache(anemometer_id):
-    uris = [
-        f"/anemometers/{anemometer_id}",
-        f"/anemometers/{anemometer_id}/mean/daily",
-        f"/anemometers/{anemometer_id}/mean/weekly",
-    ]
-    for uri in uris:
-        cache.delete(uri)
+    bump_generation(anemometer_namespace(anemometer_id), GLOBAL_NAMESPACE)
+
+
+def clear_anemometers_cache(anemometer_ids):
+    """
+    Drops the cached responses of anemometers with new readings, and lets
+    the writes of the next seconds share the invalidation of the global ones.
+    """
+    bump_generation(
+        *(anemometer_namespace(anemometer_id) for anemometer_id in anemometer_ids)
+    )
+    defer_generation_bump(GLOBAL_NAMESPACE, settings.CACHE_GLOBAL_READINGS_DELAY)
@@ -0,0 +1,15 @@
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class PreciseJSONEncoder(DjangoJSONEncoder):
+    """
+    `DjangoJSONEncoder` keeping the microseconds of datetimes and times, which
+    it otherwise truncates to milliseconds.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
@@ -0,0 +1,268 @@
+"""
+In-process request metrics, exposed in the Prometheus text format.
+
+Each route owns preallocated histograms and counters, created on its first
+request. Recording a request then only increments them: the SQL queries are
+timed by a wrapper installed on every database connection, the serializers
+by the views through `serializer_data`, and both report to the timings of
+the current request, kept in a context variable so that they follow the
+request into the threads of `sync_to_async`.
+
+The metrics live in the memory of each process, and so do the counters of
+`core.cache`: with several server processes, each one must be scraped on its
+own address, as a target of its own, rather than through a load balancer
+answering from any of them, whose counters would seem to reset at random.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.response import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Any other method is recorded as "other", so clients cannot grow the routes.
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+# Counters of `core.cache` that each cached request increments exactly one of.
+CACHE_OUTCOMES = frozenset(("hits", "stale_hits", "misses"))
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "db_time", "queries", "serializer_time")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.queries = 0
+        self.serializer_time = 0.0
+
+
+class RequestTimings:
+    __slots__ = ("queries", "db_time", "serializer_time", "cache")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.cache: Optional[str] = None
+
+
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "current_timings", default=None
+)
+
+_routes: dict[tuple[str, str], RouteMetrics] = {}
+_lock = threading.Lock()
+
+
+def record_request(route: str, method: str, duration: float, timings: RequestTimings):
+    key = (route, method if method in METHODS else "other")
+    with _lock:
+        metrics = _routes.get(key)
+        if metrics is None:
+            metrics = _routes[key] = RouteMetrics()
+        metrics.latency.observe(duration)
+        metrics.db_time.observe(timings.db_time)
+        metrics.queries += timings.queries
+        metrics.serializer_time += timings.serializer_time
+
+
+def record_cache(result: str):
+    """
+    Notes the outcome of `cache_response` for the current request.
+    """
+    timings = current_timings.get()
+    if timings is not None:
+        timings.cache = result
+
+
+def reset_metrics():
+    with _lock:
+        _routes.clear()
+
+
+def time_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += time.perf_counter() - started_at
+        timings.queries += 1
+
+
+def serializer_data(serializer):
+    """
+    Returns the data of a serializer, timed in the current request.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return serializer.data
+
+    started_at = time.perf_counter()
+    try:
+        return serializer.data
+    finally:
+        timings.serializer_time += time.perf_counter() - started_at
+
+
+class SerializerTimingMixin:
+    """
+    The `list` and `retrieve` actions of the DRF model mixins, with the data
+    of their serializers timed through `serializer_data`.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer_data(serializer))
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer_data(serializer))
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer_data(serializer))
+
+
+def _install_query_timer(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+_installed = False
+
+
+def install():
+    """
+    Instruments the database connections, once.
+    """
+    global _installed
+
+    with _lock:
+        if _installed:
+            return
+        connection_created.connect(_install_query_timer)
+        for connection in connections.all(initialized_only=True):
+            _install_query_timer(None, connection)
+        _installed = True
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def _histogram_lines(name: str, labels: str, counts: list[int], total: float):
+    cumulative = 0
+    for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), counts):
+        cumulative += count
+        yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+    yield f"{name}_sum{{{labels}}} {total}"
+    yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+def render_metrics(cache_counters: dict) -> str:
+    """
+    Renders the metrics of the routes, along with the counters of the cached
+    views, in the Prometheus text format.
+    """
+    with _lock:
+        routes = [
+            (
+                _labels(route=route, method=method),
+                (metrics.latency.counts.copy(), metrics.latency.sum),
+                (metrics.db_time.counts.copy(), metrics.db_time.sum),
+                metrics.queries,
+                metrics.serializer_time,
+            )
+            for (route, method), metrics in sorted(_routes.items())
+        ]
+
+    families = {
+        "http_request_duration_seconds": ("histogram", "Duration of the requests."),
+        "http_request_db_seconds": ("histogram", "Time spent in SQL per request."),
+        "http_request_db_queries_total": ("counter", "SQL queries of the requests."),
+        "http_request_serializer_seconds_total": (
+            "counter",
+            "Time spent in serializers by the requests.",
+        ),
+        "cache_response_total": ("counter", "Outcomes of the cached views."),
+        "cache_local_hits_total": (
+            "counter",
+            "Hits of the cached views answered by the local tier.",
+        ),
+        "cache_early_expirations_total": (
+            "counter",
+            "Entries of the cached views recomputed before expiring.",
+        ),
+        "cache_evictions_total": (
+            "counter",
+            "Misses of the cached views on entries evicted from the cache.",
+        ),
+    }
+    samples = {name: [] for name in families}
+    for labels, latency, db_time, queries, serializer_time in routes:
+        samples["http_request_duration_seconds"].extend(
+            _histogram_lines("http_request_duration_seconds", labels, *latency)
+        )
+        samples["http_request_db_seconds"].extend(
+            _histogram_lines("http_request_db_seconds", labels, *db_time)
+        )
+        samples["http_request_db_queries_total"].append(
+            f"http_request_db_queries_total{{{labels}}} {queries}"
+        )
+        samples["http_request_serializer_seconds_total"].append(
+            f"http_request_serializer_seconds_total{{{labels}}} {serializer_time}"
+        )
+    for view_name, counters in sorted(cache_counters.items()):
+        for counter, count in sorted(counters.items()):
+            # The outcomes partition the requests, the others count subsets.
+            if counter in CACHE_OUTCOMES:
+                name = "cache_response_total"
+                labels = _labels(view=view_name, result=counter)
+            else:
+                name = f"cache_{counter}_total"
+                labels = _labels(view=view_name)
+            if name in samples:
+                samples[name].append(f"{name}{{{labels}}} {count}")
+
+    lines = []
+    for name, (kind, description) in families.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(duration: float, timings: RequestTimings) -> str:
+    metrics = [
+        f"total;dur={duration * 1000:.1f}",
+        f'db;dur={timings.db_time * 1000:.1f};desc="{timings.queries} queries"',
+        f"serializer;dur={timings.serializer_time * 1000:.1f}",
+    ]
+    if timings.cache is not None:
+        metrics.append(f'cache;desc="{timings.cache}"')
+    return ", ".join(metrics)
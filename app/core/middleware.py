@@ -0,0 +1,247 @@
+import random
+import sys
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import metrics, profiling
+from .routers import use_replica
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, SQL queries, serializer time and cache outcome of
+    every request in `core.metrics`, and sums them up in a `Server-Timing`
+    header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        metrics.install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings = metrics.RequestTimings()
+        token = metrics.current_timings.set(timings)
+        started_at = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_timings.reset(token)
+        self.record(request, response, time.perf_counter() - started_at, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings = metrics.RequestTimings()
+        token = metrics.current_timings.set(timings)
+        started_at = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_timings.reset(token)
+        self.record(request, response, time.perf_counter() - started_at, timings)
+        return response
+
+    def record(self, request, response, duration, timings):
+        resolver_match = request.resolver_match
+        route = resolver_match.view_name if resolver_match else "unmatched"
+        metrics.record_request(route, request.method, duration, timings)
+        response["Server-Timing"] = metrics.server_timing(duration, timings)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Reads from a replica during the GET requests of the views flagged with
+    `read_from_replicas`.
+
+    A client that successfully wrote is given a cookie keeping its reads on
+    the primary for `DATABASE_REPLICA_STICKY_SECONDS`, so that it reads its
+    own writes whatever the replication lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if self.reads_from_replica(request):
+            with use_replica():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        self.stick_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if self.reads_from_replica(request):
+            with use_replica():
+                response = await self.get_response(request)
+        else:
+            response = await self.get_response(request)
+        self.stick_to_primary(request, response)
+        return response
+
+    def reads_from_replica(self, request) -> bool:
+        if not settings.DATABASE_REPLICAS or request.method not in ("GET", "HEAD"):
+            return False
+
+        try:
+            primary_until = float(
+                request.COOKIES.get(settings.DATABASE_REPLICA_STICKY_COOKIE, 0)
+            )
+        except ValueError:
+            primary_until = 0
+        if primary_until > time.time():
+            return False
+
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        view_class = getattr(match.func, "cls", None)
+        return getattr(view_class, "read_from_replicas", False)
+
+    def stick_to_primary(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        sticky_seconds = settings.DATABASE_REPLICA_STICKY_SECONDS
+        response.set_cookie(
+            settings.DATABASE_REPLICA_STICKY_COOKIE,
+            str(time.time() + sticky_seconds),
+            max_age=sticky_seconds,
+            httponly=True,
+            samesite="Lax",
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a `PROFILING_SAMPLE_RATE` fraction of the requests, along with
+    the requests of staff users carrying the `PROFILING_HEADER` header, see
+    `core/profiling.py`. The name of the profile is returned in that header.
+    Requests arriving while another one is profiled are not profiled.
+
+    Unused unless `PROFILING_ENABLED` is set.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        profiling.install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.is_excluded(request) or (
+            not self.is_sampled(request) and not self.is_requested(request)
+        ):
+            return self.get_response(request)
+        if not profiling.profiling_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        profiler, queries = profiling.StackSampler(), []
+        root = sys._getframe()
+        profiler.add_thread(threading.get_ident(), lambda frame: frame is root)
+        token = profiling.current_queries.set(queries)
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+            profiling.current_queries.reset(token)
+            profiling.profiling_lock.release()
+
+        path = profiling.save_profile(profiler, self.route(request), queries)
+        response[settings.PROFILING_HEADER] = path.stem
+        return response
+
+    async def __acall__(self, request):
+        if self.is_excluded(request) or (
+            not self.is_sampled(request)
+            and not await sync_to_async(self.is_requested)(request)
+        ):
+            return await self.get_response(request)
+        # Never waits: the event loop would stop with it.
+        if not profiling.profiling_lock.acquire(blocking=False):
+            return await self.get_response(request)
+
+        profiler, queries = profiling.StackSampler(), []
+        try:
+            # The event loop only while it runs this request, and the thread
+            # running the `sync_to_async` calls of the request.
+            root = sys._getframe()
+            profiler.add_thread(threading.get_ident(), lambda frame: frame is root)
+            profiler.add_thread(
+                await sync_to_async(threading.get_ident)(),
+                lambda frame: frame.f_code is profiling.SYNC_TO_ASYNC_CODE,
+            )
+            token = profiling.current_queries.set(queries)
+            profiler.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.stop()
+                profiling.current_queries.reset(token)
+        finally:
+            profiling.profiling_lock.release()
+
+        path = await sync_to_async(profiling.save_profile)(
+            profiler, self.route(request), queries
+        )
+        response[settings.PROFILING_HEADER] = path.stem
+        return response
+
+    def is_sampled(self, request) -> bool:
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def is_excluded(self, request) -> bool:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.view_name in settings.PROFILING_EXCLUDED_ROUTES
+
+    def is_requested(self, request) -> bool:
+        if settings.PROFILING_HEADER not in request.headers:
+            return False
+
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except APIException:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
+
+    def route(self, request) -> str:
+        resolver_match = request.resolver_match
+        return resolver_match.view_name if resolver_match else "unmatched"
@@ -0,0 +1,237 @@
+import asyncio
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .encoders import PreciseJSONEncoder
+
+
+async def alist(queryset) -> list:
+    return [row async for row in queryset]
+
+
+class PageNumberPagination(pagination.PageNumberPagination):
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async variant of `paginate_queryset`, counting the rows and reading
+        the page with the async ORM.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+        self.page.object_list = await alist(self.page.object_list)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on the values of the ordering fields instead of an offset: a
+    page only reads the rows following the boundary row of the previous one,
+    so its cost does not depend on how deep it is.
+
+    The ordering comes from the queryset, on non-nullable model fields, with
+    the primary key appended as a tie-breaker. Cursors are opaque tokens
+    encoding the boundary row and the paging direction.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    count_query_param = "count"
+    include_count = True
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        self.count = queryset.count() if self.get_include_count(request) else None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async variant of `paginate_queryset`, counting the rows while the
+        page is read.
+        """
+        page_queryset = self.get_page_queryset(queryset, request)
+        if self.get_include_count(request):
+            self.count, rows = await asyncio.gather(
+                queryset.acount(), alist(page_queryset)
+            )
+        else:
+            self.count, rows = None, await alist(page_queryset)
+        return self.set_page(rows)
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Returns the queryset of the requested page, with one extra row telling
+        whether another page follows.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+
+        cursor = self.decode_cursor(request)
+        self.reverse = cursor is not None and cursor["reverse"]
+        self.has_cursor = cursor is not None
+        ordering = [
+            (name, descending != self.reverse) for name, descending in self.ordering
+        ]
+
+        queryset = queryset.order_by(
+            *[f"-{name}" if descending else name for name, descending in ordering]
+        )
+        if cursor is not None:
+            queryset = queryset.filter(
+                self.get_boundary_filter(ordering, cursor["values"])
+            )
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = has_more if self.reverse else self.has_cursor
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_include_count(self, request):
+        value = request.query_params.get(self.count_query_param)
+        if value is None:
+            return self.include_count
+        return value.lower() not in ("0", "false", "no")
+
+    def get_ordering(self, queryset):
+        """
+        Returns the ordering of the queryset as (attname, descending) pairs,
+        ending with the primary key.
+        """
+        opts = queryset.model._meta
+        ordering = []
+        for item in queryset.query.order_by or opts.ordering:
+            if not isinstance(item, str) or item == "?" or "__" in item:
+                raise ImproperlyConfigured(
+                    f"{self.__class__.__name__} only orders on model fields, got {item!r}."
+                )
+            name = item.lstrip("-")
+            try:
+                field = opts.pk if name == "pk" else opts.get_field(name)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(f"Unknown ordering field {name!r}.")
+            ordering.append((field.attname, item.startswith("-")))
+
+        if opts.pk.attname not in [name for name, _ in ordering]:
+            descending = ordering[-1][1] if ordering else False
+            ordering.append((opts.pk.attname, descending))
+        self.fields = [opts.get_field(name) for name, _ in ordering]
+        return ordering
+
+    def get_boundary_filter(self, ordering, values) -> Q:
+        """
+        Filters the rows strictly after the boundary row in the given ordering.
+        The bound on the first field alone lets the database use its index.
+        """
+        first_name, first_descending = ordering[0]
+        bound = Q(
+            **{f"{first_name}__{'lte' if first_descending else 'gte'}": values[0]}
+        )
+
+        after, equal = Q(), Q()
+        for (name, descending), value in zip(ordering, values):
+            after |= equal & Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal &= Q(**{name: value})
+        return bound & after
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            values = [
+                field.to_python(value)
+                for field, value in zip(self.fields, cursor["v"], strict=True)
+            ]
+            return {"values": values, "reverse": bool(cursor.get("r"))}
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse: bool) -> str:
+        values = [getattr(row, name) for name, _ in self.ordering]
+        payload = {"v": values}
+        if reverse:
+            payload["r"] = 1
+        data = json.dumps(payload, cls=PreciseJSONEncoder, separators=(",", ":"))
+        encoded = base64.urlsafe_b64encode(data.encode()).decode("ascii")
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response_data = OrderedDict()
+        if self.count is not None:
+            response_data["count"] = self.count
+        response_data["next"] = self.get_next_link()
+        response_data["previous"] = self.get_previous_link()
+        response_data["results"] = data
+        return Response(response_data)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,278 @@
+"""
+Sampled profiling of production requests.
+
+A sampled request runs under a `StackSampler` while its SQL queries are
+captured, and its profile is written to `PROFILING_DIR`, a directory private
+to the user of the server, in the format of cProfile, for `pstats`. A
+background thread then adds a report of the queries and the `EXPLAIN ANALYZE`
+plans of the slowest SELECT statements, off the request path, and drops all
+but the newest `PROFILING_MAX_PROFILES` profiles. The routes of
+`PROFILING_EXCLUDED_ROUTES`, which handle credentials, are never profiled, so
+that no password ends up in the captured parameters.
+
+The sampler reads the stacks of the threads of the request alone, every
+`SAMPLE_INTERVAL` seconds, through `sys._current_frames`: under ASGI, the
+event loop while it runs a coroutine of the request, and the thread of its
+`sync_to_async` calls, where async views do their ORM and serializer work.
+Being statistical, a profile counts samples rather than calls, and leaves
+out functions shorter than the interval.
+
+A single request is profiled at a time, which bounds the cost of sampling:
+the others are served unprofiled meanwhile.
+"""
+
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from pathlib import Path
+from types import FrameType
+from typing import Callable, Optional
+
+from asgiref.sync import SyncToAsync
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.backends.signals import connection_created
+
+EXPLAIN_SLOWEST = 5
+SAMPLE_INTERVAL = 0.001
+
+# Outermost frame of the work run by `sync_to_async` in its threads.
+SYNC_TO_ASYNC_CODE = SyncToAsync.thread_handler.__code__
+
+current_queries: ContextVar[Optional[list]] = ContextVar(
+    "current_queries", default=None
+)
+
+# Held by the request being profiled.
+profiling_lock = threading.Lock()
+
+_reports = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiling-reports")
+
+
+class StackSampler:
+    """
+    Samples the stacks of some threads from a thread of its own, and totals
+    them per function as cProfile would: the calls of a function are the
+    samples it appears in, its own time that of the samples it runs in.
+
+    A thread is only sampled while its stack goes through the frame its
+    `is_root` predicate accepts, and the frames above that one are left out.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._threads: dict[int, Callable[[FrameType], bool]] = {}
+        self._stats = defaultdict(lambda: [0, 0.0, 0.0, defaultdict(lambda: [0, 0.0])])
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_thread(self, ident: int, is_root: Callable[[FrameType], bool]):
+        self._threads[ident] = is_root
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="profiling-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        sampled_at = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, sampled_at = now - sampled_at, now
+            frames = sys._current_frames()
+            for ident, is_root in self._threads.items():
+                if ident in frames:
+                    self._record(self._stack(frames[ident], is_root), elapsed)
+
+    @staticmethod
+    def _stack(frame: Optional[FrameType], is_root) -> list[tuple]:
+        """
+        Functions of a stack from its root down to the running one, or none
+        when the stack does not go through a root.
+        """
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            if is_root(frame):
+                return stack[::-1]
+            frame = frame.f_back
+        return []
+
+    def _record(self, stack: list[tuple], elapsed: float):
+        if not stack:
+            return
+        self.samples += 1
+        self._stats[stack[-1]][1] += elapsed
+        # Recursive functions count once per sample.
+        seen = set()
+        for caller, function in zip([None, *stack], stack):
+            if function in seen:
+                continue
+            seen.add(function)
+            stats = self._stats[function]
+            stats[0] += 1
+            stats[2] += elapsed
+            if caller is not None:
+                stats[3][caller][0] += 1
+                stats[3][caller][1] += elapsed
+
+    def dump_stats(self, path: Path):
+        """
+        Writes the samples in the marshalled format of `cProfile`.
+        """
+        stats = {
+            function: (
+                calls,
+                calls,
+                own_time,
+                time_,
+                {
+                    caller: (caller_calls, caller_calls, 0.0, caller_time)
+                    for caller, (caller_calls, caller_time) in callers.items()
+                },
+            )
+            for function, (calls, own_time, time_, callers) in self._stats.items()
+        }
+        with open(path, "wb") as file:
+            marshal.dump(stats, file)
+
+
+def capture_query(execute, sql, params, many, context):
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append(
+            {
+                "alias": context["connection"].alias,
+                "sql": sql,
+                "params": params,
+                "many": many,
+                "duration": time.perf_counter() - started_at,
+            }
+        )
+
+
+def _install_query_capture(sender, connection, **kwargs):
+    if capture_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_query)
+
+
+def install():
+    """
+    Captures the queries of the profiled requests on every connection.
+    """
+    connection_created.connect(
+        _install_query_capture, dispatch_uid="core.profiling.capture_query"
+    )
+    for connection in connections.all(initialized_only=True):
+        _install_query_capture(None, connection)
+
+
+def explain(query: dict) -> str:
+    # In a savepoint, so that a failing plan leaves any running transaction usable.
+    alias = query["alias"]
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query['sql']}", query["params"])
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def sql_report(queries: list[dict]) -> str:
+    """
+    Lists the captured queries, followed by the plans of the slowest SELECT
+    statements. Other statements are not explained, as `ANALYZE` runs them.
+    """
+    lines = [
+        f"{len(queries)} queries, {sum(q['duration'] for q in queries) * 1000:.1f} ms",
+        "",
+    ]
+    for query in queries:
+        lines.append(f"-- {query['duration'] * 1000:.1f} ms on {query['alias']}")
+        lines.append(f"{query['sql']};")
+        lines.append(f"-- params: {query['params']!r}")
+        lines.append("")
+
+    selects = [
+        query
+        for query in queries
+        if not query["many"] and query["sql"].lstrip().upper().startswith("SELECT")
+    ]
+    selects.sort(key=lambda query: query["duration"], reverse=True)
+    for query in selects[:EXPLAIN_SLOWEST]:
+        lines.append(f"-- EXPLAIN ANALYZE ({query['duration'] * 1000:.1f} ms)")
+        lines.append(f"{query['sql']};")
+        try:
+            lines.append(explain(query))
+        except Exception as exc:
+            lines.append(f"-- EXPLAIN failed: {exc}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def profile_name(route: str) -> str:
+    """
+    Names a profile after its capture time, so that names sort by age.
+    """
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", route).strip("_") or "request"
+    return f"{time.time_ns()}-{os.getpid()}-{slug}"
+
+
+def save_profile(profiler, route: str, queries: list[dict]) -> Path:
+    """
+    Writes a profile, and leaves its SQL report and the rotation of the
+    profiles to the background thread.
+    """
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    path = directory / f"{profile_name(route)}.prof"
+    profiler.dump_stats(path)
+
+    _reports.submit(
+        write_sql_report,
+        path.with_suffix(".sql"),
+        queries,
+        settings.PROFILING_MAX_PROFILES,
+    )
+    return path
+
+
+def write_sql_report(path: Path, queries: list[dict], max_profiles: int):
+    close_old_connections()
+    try:
+        path.write_text(sql_report(queries))
+        rotate(path.parent, max_profiles)
+    finally:
+        # The plans run on connections of this thread, not kept between reports.
+        connections.close_all()
+
+
+def wait_for_reports():
+    """
+    Waits for the SQL reports of the profiles already saved.
+    """
+    _reports.submit(lambda: None).result()
+
+
+def rotate(directory: Path, max_profiles: int):
+    profiles = sorted(directory.glob("*.prof"), key=lambda path: path.name)
+    for path in profiles[: max(0, len(profiles) - max_profiles)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".sql").unlink(missing_ok=True)
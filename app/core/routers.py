@@ -0,0 +1,64 @@
+"""
+Routing of the reads to the replicas of `DATABASE_REPLICAS`.
+
+Requests opt in through `ReplicaRoutingMiddleware`, which picks a replica for
+the whole request, so that its queries all see the same replication state.
+Writes, migrations and the reads of the other requests go to the primary, as
+well as the reads of the handlers filling shared state, such as the cached
+responses and their validators, see `use_primary`.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+read_replica: ContextVar[Optional[str]] = ContextVar("read_replica", default=None)
+
+
+@contextmanager
+def use_replica(alias: Optional[str] = None):
+    """
+    Reads from the given replica, or a random one, within the block.
+    """
+    if alias is None and settings.DATABASE_REPLICAS:
+        alias = random.choice(settings.DATABASE_REPLICAS)
+    token = read_replica.set(alias)
+    try:
+        yield alias
+    finally:
+        read_replica.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """
+    Reads from the primary within the block, even in a request reading from a
+    replica: what is read there outlives the request, and must not lag.
+    """
+    token = read_replica.set(None)
+    try:
+        yield
+    finally:
+        read_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_replica.get()
+
+    def db_for_write(self, model, **hints):
+        # Instances read from a replica are saved on the primary.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
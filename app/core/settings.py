@@ -1,3 +1,5 @@
+import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -36,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -43,6 +46,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.ProfilingMiddleware",
+    "core.middleware.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "core.urls"
@@ -64,6 +69,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "core.wsgi.application"
+ASGI_APPLICATION = "core.asgi.application"
 
 
 # Database
@@ -77,9 +83,71 @@ DATABASES = {
         "PASSWORD": "postgres",
         "HOST": "db",
         "PORT": "5432",
+        # Closed after each request by default: under ASGI, connections are
+        # opened by the threads of `sync_to_async`, the write-behind buffer and
+        # the event streams, which the end of a request never cleans up, so
+        # persistent ones pile up (https://code.djangoproject.com/ticket/33497).
+        # Only raise it behind a pooler or when served under WSGI.
+        "CONN_MAX_AGE": int(os.environ.get("DATABASE_CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read replicas, as a comma-separated list of `host[:port]` sharing the
+# credentials of the primary. The GET requests of the anemometer and readings
+# viewsets read from one of them, except for the clients that wrote within the
+# last `DATABASE_REPLICA_STICKY_SECONDS`, see `core/routers.py`.
+DATABASE_REPLICAS = []
+for index, address in enumerate(
+    filter(None, os.environ.get("DATABASE_REPLICA_HOSTS", "").split(",")), start=1
+):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+DATABASE_REPLICA_STICKY_SECONDS = 5
+DATABASE_REPLICA_STICKY_COOKIE = "read_primary_until"
+
+
+# Cache shared by the workers: `redis://` URLs use Redis, `file://` paths a
+# file-based cache, and without `CACHE_URL` each process keeps its own memory
+# cache. The responses of `core.cache.cache_response` may also be kept in the
+# memory of each process for `CACHE_LOCAL_TIMEOUT` seconds, 0 disables it.
+
+CACHE_URL = os.environ.get("CACHE_URL", "")
+if CACHE_URL.startswith(("redis://", "rediss://")):
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CACHE_URL,
+    }
+elif CACHE_URL.startswith("file://"):
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_URL.removeprefix("file://"),
+    }
+else:
+    SHARED_CACHE = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+
+CACHES = {
+    "default": SHARED_CACHE,
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "local",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+CACHE_LOCAL_TIMEOUT = int(os.environ.get("CACHE_LOCAL_TIMEOUT", "0"))
+# New readings drop the cached responses of their anemometer at once, but
+# those of the global namespace, which every write touches, at most
+# `CACHE_GLOBAL_READINGS_DELAY` seconds later, once for all the writes since.
+CACHE_GLOBAL_READINGS_DELAY = int(os.environ.get("CACHE_GLOBAL_READINGS_DELAY", "5"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -127,7 +195,7 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "core.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
 }
@@ -164,3 +232,36 @@ LOGGING = {
         },
     },
 }
+
+READINGS_BULK_MAX_ROWS = 10000
+READINGS_EXPORT_CHUNK_SIZE = 2000
+READINGS_RADIUS_BATCH_MAX_CENTERS = 1000
+ANEMOMETER_TILES_MAX_ZOOM = 20
+READINGS_AGGREGATE_MAX_BUCKETS = 100000
+
+# Write-behind ingestion: readings are queued and inserted in batches by a
+# background thread, see `anemometers/buffer.py`.
+READINGS_WRITE_BEHIND = False
+READINGS_BUFFER_MAX_ROWS = 50000
+READINGS_BUFFER_BATCH_SIZE = 1000
+READINGS_BUFFER_FLUSH_MS = 500
+
+# Sampled profiling of the requests, see `core/profiling.py`. Staff users may
+# also request a profile by sending the `PROFILING_HEADER` header.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "") == "1"
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_HEADER = "X-Profile"
+PROFILING_DIR = os.environ.get(
+    "PROFILING_DIR", os.path.join(tempfile.gettempdir(), "wind-profiles")
+)
+PROFILING_MAX_PROFILES = 200
+# Routes handling credentials, whose SQL parameters must not be written down.
+PROFILING_EXCLUDED_ROUTES = ("register", "get-tokens", "refresh-tokens")
+
+# The Prometheus metrics are reserved to staff users, unless the route is only
+# reachable by the scraper, from a private network.
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "") == "1"
+
+# Server-Sent Events of the new readings, see `anemometers/streams.py`.
+READINGS_STREAM_BUFFER_SIZE = 100
+READINGS_STREAM_KEEPALIVE = 15
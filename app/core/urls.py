@@ -5,7 +5,7 @@ from drf_yasg.views import get_schema_view
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .views import RegistrationView
+from .views import CacheStatsView, MetricsView, RegistrationView
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -23,6 +23,8 @@ urlpatterns = [
     path("auth/register", RegistrationView.as_view(), name="register"),
     path("auth/tokens", TokenObtainPairView.as_view(), name="get-tokens"),
     path("auth/tokens/refresh", TokenRefreshView.as_view(), name="refresh-tokens"),
+    path("cache/stats", CacheStatsView.as_view(), name="cache-stats"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path("", include("anemometers.urls")),
     path("docs", schema_view.with_ui("swagger", cache_timeout=0), name="docs"),
 ]
@@ -1,9 +1,48 @@
+from django.conf import settings
+from django.http import HttpResponse
 from rest_framework import generics
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from .cache import cache_stats
+from .metrics import render_metrics
 from .serializers import RegistrationSerializer
 
 
 class RegistrationView(generics.CreateAPIView):
     serializer_class = RegistrationSerializer
     permission_classes = [AllowAny]
+
+
+class CacheStatsView(APIView):
+    """
+    Counters of the cached views in this server process only, see
+    `core.metrics` for scraping several processes.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=cache_stats())
+
+
+class MetricsView(APIView):
+    """
+    Prometheus metrics of this server process only: each process is a
+    scrape target of its own, see `core.metrics`. Restricted to staff users,
+    unless `METRICS_PUBLIC` lets a scraper in without credentials.
+    """
+
+    def get_authenticators(self):
+        if settings.METRICS_PUBLIC:
+            return []
+        return super().get_authenticators()
+
+    def get_permissions(self):
+        if settings.METRICS_PUBLIC:
+            return [AllowAny()]
+        return [IsAdminUser()]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            render_metrics(cache_stats()), content_type="text/plain; version=0.0.4"
+        )